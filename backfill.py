@@ -0,0 +1,242 @@
+"""Загрузка полной истории работ новых пользователей (from_date=0).
+
+Ответ с полной историей может быть большим, поэтому тело ответа
+читается частями и разбирается потоково: в памяти находятся только
+непрочитанный остаток очередной части и текущая работа. Работы по одной
+проверяются (decoder.make_record), работы с ошибками пропускаются,
+остальные запоминаются в хранилище как последние известные статусы;
+хранилище записывает их в базу пачками по BATCH_SIZE работ. Оповещения
+об исторических изменениях не отправляются. После загрузки метка
+времени пользователя устанавливается по current_date ответа, и обычный
+опрос продолжается с нее без повторных оповещений.
+"""
+
+import codecs
+import json
+import logging
+import re
+import time
+from contextlib import closing
+
+import homework
+from decoder import ERROR_KEYS, make_record
+from exceptions import (
+    BadFormatError, MissingDataError, ServerError, TooManyRequestsError,
+    UnknowStatus
+)
+from storage import StateStore
+from tenants import NO_TENANTS, TENANTS_FILE, load_tenants
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+# Наибольший размер значения ответа (например, записи о работе), которое
+# дочитывается из следующих частей, если не удалось его разобрать.
+MAX_VALUE_SIZE = 1024 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+EXPECTING = 'Ожидается {expected}'
+BACKFILL_COMPLETE = (
+    'Загружена история работ пользователя {name}: {count} работ(ы).'
+)
+BACKFILL_FAIL = (
+    'Не удалось загрузить историю работ пользователя {name}: {error}'
+)
+BACKFILL_SKIPPED = 'История работ уже загружена для {count} пользователей.'
+RECORD_SKIPPED = 'Работа пропущена при загрузке истории: {error}'
+
+logger = logging.getLogger('homework.backfill')
+
+
+class JsonStream:
+    """Чтение значений JSON из последовательности частей в байтах."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        """Чтение очередной части; False в конце потока."""
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        while not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self.text.decode(b'', final=True)
+            else:
+                text = self.text.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        return False
+
+    def peek(self) -> str:
+        """Первый непробельный символ; пустая строка в конце потока."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, expected: str) -> str:
+        """Пропуск одного из символов expected."""
+        char = self.peek()
+        if not char or char not in expected:
+            raise json.JSONDecodeError(
+                EXPECTING.format(expected=' или '.join(expected)),
+                self.buffer, self.pos
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Очередное значение JSON целиком.
+
+        Значение, заканчивающееся на границе прочитанных данных (например,
+        число), дочитывается: оно может продолжаться в следующей части.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                value, end, failure = None, None, error
+            else:
+                if end < len(self.buffer):
+                    self.pos = end
+                    return value
+            too_long = len(self.buffer) - self.pos > MAX_VALUE_SIZE
+            if too_long or not self.more():
+                if end is None:
+                    raise failure
+                self.pos = end
+                return value
+
+
+def stream_answer(chunks, fields: dict):
+    """Записи Homework из ответа сервера, прочитанного частями chunks.
+
+    Работы, не прошедшие проверку, пропускаются с предупреждением в
+    журнале. Остальные поля верхнего уровня ответа (current_date, error
+    и т.д.) помещаются в fields по мере чтения. Ответ с ключом error или code
+    не проверяется на наличие списка работ, чтобы вызывающий код
+    сообщил об ошибке сервера.
+    """
+    stream = JsonStream(chunks)
+    streamed = False
+    if stream.peek() != '{':
+        answer = stream.value()
+        raise BadFormatError(
+            homework.WRONG_RESPONSE_OBJECT.format(type_name=type(answer))
+        )
+    stream.expect('{')
+    closed = stream.peek() == '}'
+    if closed:
+        stream.expect('}')
+    while not closed:
+        key = stream.value()
+        stream.expect(':')
+        if key == 'homeworks' and stream.peek() == '[':
+            stream.expect('[')
+            streamed = True
+            if stream.peek() == ']':
+                stream.expect(']')
+            else:
+                while True:
+                    value = stream.value()
+                    try:
+                        record = make_record(value)
+                    except (
+                        BadFormatError, MissingDataError, UnknowStatus
+                    ) as error:
+                        logger.warning(RECORD_SKIPPED.format(error=error))
+                    else:
+                        yield record
+                    if stream.expect(',]') == ']':
+                        break
+        else:
+            fields[key] = stream.value()
+        closed = stream.expect(',}') == '}'
+    if streamed or any(key in fields for key in ERROR_KEYS):
+        return
+    if 'homeworks' in fields:
+        raise BadFormatError(homework.WRONG_HOMEWORKS_OBJECT.format(
+            type_name=type(fields['homeworks'])
+        ))
+    raise MissingDataError(homework.NO_HOMEWORKS_IN_RESPONSE)
+
+
+def backfill(tenant, store: StateStore, transport=None,
+             chunk_size: int = CHUNK_SIZE,
+             batch_size: int = BATCH_SIZE) -> int:
+    """Загрузка истории работ пользователя в хранилище.
+
+    Возвращает число загруженных работ. Метка времени пользователя
+    записывается только после успешного чтения всего ответа.
+    """
+    started = int(time.time())
+    request_data = homework.api_request(tenant.headers, 0)
+    response = homework.send_request(request_data, transport, stream=True)
+    fields = {}
+    count = 0
+    with closing(response):
+        records = stream_answer(response.iter_content(chunk_size), fields)
+        for record in records:
+            store.seed(tenant.name, [record])
+            count += 1
+            if count % batch_size == 0:
+                store.flush()
+    for key in ERROR_KEYS:
+        if key in fields:
+            raise ServerError(homework.SERVER_FAIL.format(
+                name=key, text=fields[key]
+            ), **request_data)
+    tenant.timestamp = fields.get('current_date', started)
+    store.save(tenant.name, tenant.timestamp)
+    store.flush()
+    logger.info(BACKFILL_COMPLETE.format(name=tenant.name, count=count))
+    return count
+
+
+def backfill_new(state_file: str = None, transport=None) -> int:
+    """Загрузка истории работ пользователей, еще не известных хранилищу.
+
+    Возвращает код завершения, как homework.check_once.
+    """
+    try:
+        tenants = load_tenants(TENANTS_FILE)
+    except (OSError, ValueError) as error:
+        logger.critical(homework.FAILURE.format(error=error))
+        return homework.EXIT_CONFIG
+    if not tenants:
+        logger.critical(NO_TENANTS)
+        return homework.EXIT_CONFIG
+    store = StateStore(state_file) if state_file else StateStore()
+    code = homework.EXIT_OK
+    try:
+        new = [
+            tenant for tenant in tenants
+            if store.watermark(tenant.name) is None
+        ]
+        if len(new) < len(tenants):
+            logger.info(BACKFILL_SKIPPED.format(count=len(tenants) - len(new)))
+        for tenant in new:
+            try:
+                backfill(tenant, store, transport)
+            except TooManyRequestsError as error:
+                logger.warning(str(error))
+                code = homework.EXIT_TEMPFAIL
+                break
+            except Exception as error:
+                logger.error(BACKFILL_FAIL.format(
+                    name=tenant.name, error=error
+                ))
+                code = homework.EXIT_FAILURE
+    finally:
+        store.close()
+    return code
@@ -0,0 +1,125 @@
+"""Бенчмарк загрузки истории работ (from_date=0) в хранилище.
+
+Ответ с историей заданного размера формируется частями по мере чтения
+и не хранится в памяти бенчмарка целиком. Сравниваются режимы:
+- stream - backfill.stream_answer: потоковый разбор, запись статусов
+  в хранилище пачками;
+- full - разбор всего ответа decoder.decode_answer и запись всех
+  статусов одной транзакцией, как при обычном опросе.
+
+Для каждого размера истории выводится строка JSON:
+- per_homework - микросекунд на одну работу (формирование ответа,
+  разбор и запись в базу);
+- peak_memory - наибольший прирост памяти по данным tracemalloc в байтах.
+
+Запуск: python benchmarks/backfill.py [--homeworks 1000,10000,100000]
+[--output results.jsonl]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backfill  # noqa: E402
+import decoder  # noqa: E402
+from debugserver import STATUS_CYCLE, iso_date  # noqa: E402
+from storage import StateStore  # noqa: E402
+
+HOMEWORKS = '1000,10000,100000'
+EPOCH = 1_600_000_000
+COMMENT = 'Код не по PEP8, нужно исправить. Добавьте docstring к функциям.'
+
+
+def chunks(count: int, size: int = backfill.CHUNK_SIZE):
+    """Тело ответа с count работами частями около size байт."""
+    parts, length = [b'{"homeworks":['], 0
+    for number in range(count):
+        part = json.dumps({
+            'id': number,
+            'status': STATUS_CYCLE[number % len(STATUS_CYCLE)],
+            'homework_name': f'username__hw{number}.zip',
+            'reviewer_comment': COMMENT,
+            'date_updated': iso_date(EPOCH + number * 3600),
+            'lesson_name': 'Итоговый проект',
+        }, ensure_ascii=False).encode('utf-8')
+        parts.append(part if number == 0 else b',' + part)
+        length += len(part)
+        if length >= size:
+            yield b''.join(parts)
+            parts, length = [], 0
+    parts.append(b'],"current_date":%d}' % (EPOCH + count * 3600))
+    yield b''.join(parts)
+
+
+def stream(count: int, store: StateStore) -> None:
+    fields = {}
+    for number, record in enumerate(
+        backfill.stream_answer(chunks(count), fields), start=1
+    ):
+        store.seed('student', [record])
+        if number % backfill.BATCH_SIZE == 0:
+            store.flush()
+    store.save('student', fields['current_date'])
+    store.flush()
+
+
+def full(count: int, store: StateStore) -> None:
+    answer = decoder.decode_answer(b''.join(chunks(count)))
+    store.save('student', answer['current_date'], answer['homeworks'])
+    store.flush()
+
+
+def run(mode: str, count: int, traced: bool) -> tuple:
+    """Время работы и наибольший прирост памяти (если traced)."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = StateStore(os.path.join(directory, 'state.sqlite3'))
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        {'stream': stream, 'full': full}[mode](count, store)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if traced else None
+        tracemalloc.stop()
+        store.close()
+    return elapsed, peak
+
+
+def measure(mode: str, count: int) -> dict:
+    elapsed, _ = run(mode, count, traced=False)
+    _, peak = run(mode, count, traced=True)
+    return {
+        'mode': mode,
+        'homeworks': count,
+        'per_homework': round(elapsed / count * 1e6, 2),
+        'peak_memory': peak,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--homeworks', default=HOMEWORKS,
+                        help='размеры истории через запятую')
+    parser.add_argument('--output', help='файл JSON Lines для результатов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for count in args.homeworks.split(','):
+        for mode in ('stream', 'full'):
+            line = json.dumps(measure(mode, int(count)))
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as output:
+                    output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
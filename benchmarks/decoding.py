@@ -0,0 +1,135 @@
+"""Микробенчмарк разбора ответа API с полной историей работ.
+
+Ответ с from_date=0 содержит все работы студента вместе с комментариями
+ревьюеров. Сравниваются варианты разбора:
+- dict - json.loads и check_response, как при запросе через
+  requests.get (работы остаются словарями, их поля проверяются позже
+  в parse_status);
+- dict-checked - то же с проверкой каждой работы parse_status, как
+  при оповещении обо всех работах ответа;
+- lean-json, lean-orjson - decoder.decode_answer со стандартным json
+  и с orjson (если установлен): проверка всех работ и компактные
+  записи Homework.
+
+Со стандартным json разбор decoder.decode_answer медленнее варианта
+dict, который не проверяет работы, поэтому orjson включен
+в requirements.txt.
+
+Для каждого размера истории выводится строка JSON:
+- per_response - микросекунд на разбор одного ответа;
+- per_homework - микросекунд на одну работу;
+- retained_per_homework - память, удерживаемая результатом разбора,
+  в байтах на работу.
+
+Запуск: python benchmarks/decoding.py [--homeworks 100,1000,10000]
+[--output results.jsonl]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import decoder  # noqa: E402
+import homework  # noqa: E402
+from debugserver import STATUS_CYCLE, iso_date  # noqa: E402
+
+HOMEWORKS = '100,1000,10000'
+EPOCH = 1_600_000_000
+COMMENT = 'Код не по PEP8, нужно исправить. Добавьте docstring к функциям.'
+
+
+def history(count: int) -> bytes:
+    """Тело ответа с count работами."""
+    return json.dumps({
+        'homeworks': [
+            {
+                'id': number,
+                'status': STATUS_CYCLE[number % len(STATUS_CYCLE)],
+                'homework_name': f'username__hw{number}.zip',
+                'reviewer_comment': COMMENT,
+                'date_updated': iso_date(EPOCH + number * 3600),
+                'lesson_name': 'Итоговый проект',
+            }
+            for number in range(count)
+        ],
+        'current_date': EPOCH + count * 3600,
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def parse_dict(content: bytes) -> list:
+    return homework.check_response(json.loads(content))
+
+
+def parse_checked(content: bytes) -> list:
+    homeworks = parse_dict(content)
+    for homework_record in homeworks:
+        homework.parse_status(homework_record)
+    return homeworks
+
+
+def variants() -> dict:
+    parsers = {
+        'dict': parse_dict,
+        'dict-checked': parse_checked,
+        'lean-json': lambda content: decoder.decode_answer(
+            content, json.loads
+        ),
+    }
+    if decoder.orjson is not None:
+        parsers['lean-orjson'] = lambda content: decoder.decode_answer(
+            content, decoder.orjson.loads
+        )
+    return parsers
+
+
+def retained(parse, content: bytes) -> int:
+    tracemalloc.start()
+    result = parse(content)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def measure(name: str, parse, count: int) -> dict:
+    content = history(count)
+    number = max(10000 // count, 3)
+    elapsed = min(timeit.repeat(
+        lambda: parse(content), number=number, repeat=5
+    )) / number
+    return {
+        'decoder': name,
+        'homeworks': count,
+        'per_response': round(elapsed * 1e6, 1),
+        'per_homework': round(elapsed / count * 1e6, 3),
+        'retained_per_homework': round(retained(parse, content) / count),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--homeworks', default=HOMEWORKS,
+                        help='размеры истории через запятую')
+    parser.add_argument('--output', help='файл JSON Lines для результатов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for count in args.homeworks.split(','):
+        for name, parse in variants().items():
+            line = json.dumps(measure(name, parse, int(count)))
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as output:
+                    output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Сквозной бенчмарк движка опроса в виртуальном времени.
+
+Движок engine.Engine опрашивает локальный имитатор API Практикума
+(debugserver.py) и отправляет оповещения в имитатор Telegram
+(debugtelegram.py). Время цикла событий и сценария статусов
+виртуальное: часы переводятся сразу к очередному опросу, поэтому
+несколько часов работы бота моделируются за секунды или минуты.
+Ограничения частоты запросов к Практикуму и отправки Telegram
+в бенчмарке отключены.
+
+Для каждого числа пользователей выводится строка JSON:
+- polls_per_second - опросов в секунду реального времени;
+- latency_p50, latency_p99 - задержка от изменения статуса до доставки
+  оповещения в виртуальных секундах;
+- cpu_per_cycle - процессорное время на один опрос (включая имитаторы,
+  работающие в том же процессе);
+- rss_per_tenant - прирост резидентной памяти на пользователя в байтах.
+
+Запуск: python benchmarks/e2e.py [--tenants 1,100,10000] [--duration 3600]
+[--output results.jsonl]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import debugserver  # noqa: E402
+import debugtelegram  # noqa: E402
+import engine  # noqa: E402
+import homework  # noqa: E402
+from notifier import GuardedRequest, Notifier  # noqa: E402
+from ratelimit import FairLimiter  # noqa: E402
+from transport import Transport  # noqa: E402
+from virtualtime import CountingExecutor, VirtualLoop, VirtualTime  # noqa
+
+TENANTS = '1,100,10000'
+DURATION = 3600
+PERIOD = 1800
+CONCURRENCY = 32
+TOKEN = 'bench-token-{index}'
+STATUS_MESSAGE = homework.STATUS_CHANGED.split('"')[0]
+UNLIMITED = float('inf')
+
+
+def rss() -> int:
+    """Текущая резидентная память процесса в байтах."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def serve(server) -> None:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def run(tenant_count: int, duration: float, period: float) -> dict:
+    """Моделирование работы движка для заданного числа пользователей."""
+    clock = VirtualTime()
+    scenario = debugserver.Scenario(period=period, start=clock.epoch)
+    practicum = debugserver.make_server('127.0.0.1', 0, scenario)
+    practicum.clock = clock.wall
+    telegram = debugtelegram.make_server('127.0.0.1', 0)
+    latencies = []
+
+    def on_deliver(chat_id: str, text: str) -> None:
+        now = clock.wall()
+        _, _, changed = scenario.last_change(
+            TOKEN.format(index=chat_id), now
+        )
+        latencies.extend(
+            [now - changed] * text.count(STATUS_MESSAGE)
+        )
+
+    telegram.on_deliver = on_deliver
+    serve(practicum)
+    serve(telegram)
+    homework.ENDPOINT = 'http://127.0.0.1:%d/' % practicum.server_port
+
+    memory = rss()
+    bot = engine.Bot(
+        '1234:abcdefg',
+        base_url='http://127.0.0.1:%d/bot' % telegram.server_port,
+        request=GuardedRequest(con_pool_size=4)
+    )
+    tenants = []
+    for index in range(tenant_count):
+        tenant = engine.Tenant(TOKEN.format(index=index), index)
+        tenant.timestamp = int(clock.epoch)
+        tenants.append(tenant)
+    notifier = Notifier(
+        bot, UNLIMITED, UNLIMITED, UNLIMITED, clock=clock.monotonic
+    )
+    http = Transport(pool_size=CONCURRENCY)
+    runner = engine.Engine(
+        bot, tenants, CONCURRENCY, transport=http, notifier=notifier,
+        limiter=FairLimiter(UNLIMITED, UNLIMITED)
+    )
+    runner.executor = executor = CountingExecutor(max_workers=CONCURRENCY)
+
+    def busy() -> bool:
+        return executor.inflight > 0 or not notifier.idle()
+
+    loop = VirtualLoop(clock, busy)
+    started, cpu = time.perf_counter(), time.process_time()
+    try:
+        loop.run_until_complete(asyncio.wait_for(runner.run(), duration))
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        loop.close()
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+    memory = rss() - memory
+    practicum.shutdown()
+    telegram.shutdown()
+    practicum.server_close()
+    telegram.server_close()
+    polls = http.stats.requests
+    return {
+        'commit': commit(),
+        'tenants': tenant_count,
+        'virtual_seconds': duration,
+        'wall_seconds': round(elapsed, 3),
+        'polls': polls,
+        'notifications': len(latencies),
+        'polls_per_second': round(polls / elapsed, 1),
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p99': percentile(latencies, 0.99),
+        'cpu_per_cycle': cpu / polls if polls else None,
+        'rss_per_tenant': memory / tenant_count,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', default=TENANTS,
+                        help='числа пользователей через запятую')
+    parser.add_argument('--duration', type=float, default=DURATION,
+                        help='виртуальная длительность работы, с')
+    parser.add_argument('--period', type=float, default=PERIOD,
+                        help='период изменения статусов в сценарии, с')
+    parser.add_argument('--output', help='файл JSON Lines для результатов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    homework.logger.setLevel(logging.WARNING)
+    for count in args.tenants.split(','):
+        result = run(int(count), args.duration, args.period)
+        line = json.dumps(result)
+        print(line, flush=True)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as output:
+                output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Микробенчмарк пропускной способности журналирования.
+
+Сравнивает время вызова logger.info в потоке опроса при синхронной
+записи в файл (как было раньше) и при записи через очередь logs.py,
+а также для многократно повторяющейся записи с прореживанием.
+Медленный диск моделируется задержкой DISK_LATENCY на каждую запись.
+
+Запуск: python benchmarks/logging_throughput.py [число записей]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logs  # noqa: E402
+
+RECORDS = 50000
+DISK_LATENCY = 0.0002
+RESULT = '{name:<24} {rate:>12.0f} записей/с {cost:>8.2f} мкс/запись'
+
+
+def measure(name: str, logger: logging.Logger, count: int, repeated: bool):
+    started = time.perf_counter()
+    for index in range(count):
+        if repeated:
+            logger.debug('Обновлений не получено.')
+        else:
+            logger.info('Запись номер %d', index)
+    elapsed = time.perf_counter() - started
+    print(RESULT.format(
+        name=name, rate=count / elapsed, cost=elapsed / count * 1e6
+    ))
+
+
+class SlowFileHandler(logging.FileHandler):
+    """Файловый обработчик с задержкой записи."""
+
+    def emit(self, record):
+        time.sleep(DISK_LATENCY)
+        super().emit(record)
+
+
+def sync_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f'bench.sync.{name}')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler.setFormatter(logging.Formatter(logs.FORMAT))
+    logger.addHandler(handler)
+    return logger
+
+
+def queued_logger(name: str, directory: str, handler=None):
+    logger = logging.getLogger(f'bench.queued.{name}')
+    logger.propagate = False
+    listener = logs.setup_logging(
+        logger, os.path.join(directory, f'{name}.log')
+    )
+    # Вывод на экран не измеряется.
+    listener.handlers = listener.handlers[1:]
+    if handler:
+        handler.setFormatter(logging.Formatter(logs.FORMAT))
+        listener.handlers = (handler,)
+    return logger, listener
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else RECORDS
+    slow_count = max(count // 20, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sync.log')
+        measure(
+            'FileHandler', sync_logger('fast', logging.FileHandler(path)),
+            count, False
+        )
+        logger, listener = queued_logger('fast', directory)
+        measure('QueueHandler', logger, count, False)
+        measure('QueueHandler, повторы', logger, count, True)
+        logs.stop_logging(listener)
+        measure(
+            'FileHandler, медл. диск',
+            sync_logger('slow', SlowFileHandler(path)), slow_count, False
+        )
+        logger, listener = queued_logger(
+            'slow', directory, SlowFileHandler(path)
+        )
+        measure('QueueHandler, медл. диск', logger, slow_count, False)
+        logs.stop_logging(listener)
+
+
+if __name__ == '__main__':
+    main()
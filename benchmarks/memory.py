@@ -0,0 +1,126 @@
+"""Бенчмарк памяти, занимаемой состоянием пользователей движка.
+
+Для каждого пользователя создается запись tenants.Tenant, в нее
+переносятся работы из разобранного ответа API (как при опросе с
+from_date=0), срок опроса назначается в колесе таймеров, статусы
+попадают в кэш команд. Ответы после обработки отбрасываются, поэтому
+учитывается только удерживаемое состояние.
+
+Для каждого числа пользователей выводится строка JSON с приростом
+памяти на пользователя в байтах по данным tracemalloc:
+- registry - запись пользователя с известными статусами работ
+  и кешем ошибок;
+- timers - срок опроса в колесе таймеров;
+- status_cache - статусы в кэше команд /status и /history;
+- bytes_per_tenant - все вместе.
+
+Запуск: python benchmarks/memory.py [--tenants 1000,100000]
+[--homeworks 5] [--output results.jsonl]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import homework  # noqa: E402
+from commands import StatusCache  # noqa: E402
+from debugserver import STATUS_CYCLE, iso_date  # noqa: E402
+from schedule import TimingWheel  # noqa: E402
+from tenants import Tenant  # noqa: E402
+
+TENANTS = '1000,100000'
+HOMEWORKS = 5
+EPOCH = 1_600_000_000
+TOKEN = 'y0_bench-token-{index:032d}'
+
+
+def response(index: int, count: int) -> str:
+    """Ответ API со всеми работами пользователя."""
+    return json.dumps({
+        'homeworks': [
+            {
+                'id': index * 100 + number,
+                'status': STATUS_CYCLE[(index + number) % len(STATUS_CYCLE)],
+                'homework_name': f'student{index}__hw{number}.zip',
+                'reviewer_comment': 'Код не по PEP8, нужно исправить',
+                'date_updated': iso_date(EPOCH + index + number * 86400),
+                'lesson_name': 'Итоговый проект',
+            }
+            for number in range(count)
+        ],
+        'current_date': EPOCH + 30 * 86400,
+    })
+
+
+def traced() -> int:
+    return tracemalloc.get_traced_memory()[0]
+
+
+def measure(tenant_count: int, homework_count: int) -> dict:
+    bodies = [response(index, homework_count) for index in range(64)]
+    tracemalloc.start()
+    started = traced()
+    tenants = [
+        Tenant(TOKEN.format(index=index), 100_000_000 + index)
+        for index in range(tenant_count)
+    ]
+    changes = []
+    for index, tenant in enumerate(tenants):
+        answer = json.loads(bodies[index % len(bodies)])
+        homeworks = homework.check_response(answer)
+        changes = tenant.diff.changes(homeworks)
+        for record in changes:
+            tenant.diff.commit(record)
+        tenant.timestamp = answer['current_date']
+        tenant.status = changes[-1]['status'] if changes else None
+    del answer, homeworks, changes
+    registry = traced()
+    wheel = TimingWheel()
+    for index, tenant in enumerate(tenants):
+        tenant.deadline = index % 3600 + 0.5
+        wheel.schedule(index, tenant.deadline)
+    timers = traced()
+    cache = StatusCache()
+    for index, tenant in enumerate(tenants):
+        answer = json.loads(bodies[index % len(bodies)])
+        cache.update(tenant.chat_id, answer['homeworks'], complete=True)
+    del answer
+    finished = traced()
+    tracemalloc.stop()
+    return {
+        'tenants': tenant_count,
+        'homeworks': homework_count,
+        'registry': round((registry - started) / tenant_count),
+        'timers': round((timers - registry) / tenant_count),
+        'status_cache': round((finished - timers) / tenant_count),
+        'bytes_per_tenant': round((finished - started) / tenant_count),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', default=TENANTS,
+                        help='числа пользователей через запятую')
+    parser.add_argument('--homeworks', type=int, default=HOMEWORKS,
+                        help='число работ у каждого пользователя')
+    parser.add_argument('--output', help='файл JSON Lines для результатов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for count in args.tenants.split(','):
+        line = json.dumps(measure(int(count), args.homeworks))
+        print(line, flush=True)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as output:
+                output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
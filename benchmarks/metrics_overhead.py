@@ -0,0 +1,42 @@
+"""Микробенчмарк накладных расходов метрик на цикл опроса.
+
+Один цикл опроса обновляет гистограммы длительности запроса к API,
+опоздания по расписанию и отправки в Telegram, а также счетчик ошибок.
+
+Запуск: python benchmarks/metrics_overhead.py [число циклов]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Counter, Histogram, Registry  # noqa: E402
+
+CYCLES = 200000
+RESULT = 'Метрики: {cost:.2f} мкс на цикл, выдача метрик: {render:.1f} мкс'
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else CYCLES
+    registry = Registry()
+    api = Histogram('api', 'API', registry=registry)
+    lateness = Histogram('lateness', 'Опоздание', registry=registry)
+    send = Histogram('send', 'Отправка', registry=registry)
+    errors = Counter('errors', 'Ошибки', ('error',), registry=registry)
+    started = time.perf_counter()
+    for cycle in range(cycles):
+        api.observe(0.12)
+        lateness.observe(0.003)
+        send.observe(0.05)
+        errors.inc('NoResponseError')
+    cost = (time.perf_counter() - started) / cycles
+    started = time.perf_counter()
+    registry.render()
+    render = time.perf_counter() - started
+    print(RESULT.format(cost=cost * 1e6, render=render * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Воспроизведение записанного трафика бота (кассеты).
+
+Кассета записывается движком при заданной переменной среды CASSETTE
+(см. модуль cassette) и воспроизводится через цикл опроса
+с записанной скоростью (--speed 1), ускоренно (--speed 10) или без
+пауз (--speed 0). Для каждой кассеты и скорости выводится строка JSON:
+- cycles - число циклов опроса;
+- per_cycle, cycle_p99 - средняя и 99-процентильная длительность цикла
+  в микросекундах;
+- duration, recorded_duration - время воспроизведения и записи, с;
+- lateness - наибольшее опоздание цикла относительно записи, с;
+- sent, recorded_sent - число сообщений Telegram при воспроизведении
+  и в кассете;
+- diverged - число сообщений, отличающихся от записанных (например,
+  из-за статусов, известных движку до начала записи).
+
+Запуск: python benchmarks/replay.py cassette.jsonl [--speed 0,1]
+[--output results.jsonl]
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cassette  # noqa: E402
+import homework  # noqa: E402
+
+SPEEDS = '0'
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(path: str, speed: float) -> dict:
+    events = cassette.load(path)
+    result = cassette.replay(events, speed)
+    cycles = result['cycles']
+    sent, recorded = Counter(result['sent']), Counter(result['recorded'])
+    return {
+        'commit': commit(),
+        'cassette': os.path.basename(path),
+        'speed': speed,
+        'cycles': len(cycles),
+        'per_cycle': round(sum(cycles) / len(cycles) * 1e6, 1)
+        if cycles else None,
+        'cycle_p99': round(percentile(cycles, 0.99) * 1e6, 1)
+        if cycles else None,
+        'duration': round(result['duration'], 3),
+        'recorded_duration': events[-1]['at'] if events else 0,
+        'lateness': round(result['lateness'], 3),
+        'sent': len(result['sent']),
+        'recorded_sent': len(result['recorded']),
+        'diverged': sum(((sent - recorded) + (recorded - sent)).values()),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cassettes', nargs='+', help='файлы кассет')
+    parser.add_argument('--speed', default=SPEEDS,
+                        help='скорости воспроизведения через запятую, '
+                             '0 - без пауз')
+    parser.add_argument('--output', help='файл JSON Lines для результатов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    homework.logger.setLevel(logging.CRITICAL)
+    for path in args.cassettes:
+        for speed in args.speed.split(','):
+            line = json.dumps(measure(path, float(speed)))
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as output:
+                    output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
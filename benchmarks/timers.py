@@ -0,0 +1,136 @@
+"""Бенчмарк хранения сроков опроса: колесо таймеров и куча.
+
+Для каждого числа таймеров выводится строка JSON с временем
+в микросекундах на операцию:
+- schedule - назначение срока новому таймеру;
+- reschedule - перенос срока существующего таймера;
+- cancel - отмена таймера;
+- expire - выдача сработавшего таймера при переводе часов шагами
+  step секунд через весь горизонт сроков;
+и приростом памяти на таймер в байтах (memory_per_timer).
+
+Сроки распределены как у простаивающих пользователей: равномерно
+в пределах трех часов. Для сравнения те же операции выполняются над
+кучей heapq с ленивым удалением отмененных записей (structure: heap).
+
+Запуск: python benchmarks/timers.py [--timers 100000,1000000]
+[--output results.jsonl]
+"""
+
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from schedule import TimingWheel  # noqa: E402
+
+TIMERS = '100000,1000000'
+HORIZON = 3 * 3600
+STEP = 1
+
+
+class HeapTimers:
+    """Куча сроков с ленивым удалением - базовый вариант для сравнения."""
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def schedule(self, key, deadline: float) -> None:
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+
+    def cancel(self, key) -> bool:
+        return self.deadlines.pop(key, None) is not None
+
+    def advance(self, now: float) -> list:
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, key = heapq.heappop(self.heap)
+            if self.deadlines.get(key) == deadline:
+                del self.deadlines[key]
+                due.append(key)
+        return due
+
+
+def make(structure: str):
+    return TimingWheel() if structure == 'wheel' else HeapTimers()
+
+
+def memory_per_timer(structure: str, deadlines: list) -> float:
+    tracemalloc.start()
+    timers = make(structure)
+    for key, deadline in enumerate(deadlines):
+        timers.schedule(key, deadline)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del timers
+    return memory / len(deadlines)
+
+
+def measure(structure: str, count: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    deadlines = [rng.uniform(0, HORIZON) for _ in range(count)]
+    moved = [rng.uniform(0, HORIZON) for _ in range(count)]
+    memory = memory_per_timer(structure, deadlines)
+    timers = make(structure)
+    started = time.perf_counter()
+    for key, deadline in enumerate(deadlines):
+        timers.schedule(key, deadline)
+    schedule = time.perf_counter() - started
+    started = time.perf_counter()
+    for key, deadline in enumerate(moved):
+        timers.schedule(key, deadline)
+    reschedule = time.perf_counter() - started
+    cancelled = range(0, count, 10)
+    started = time.perf_counter()
+    for key in cancelled:
+        timers.cancel(key)
+    cancel = time.perf_counter() - started
+    expired = 0
+    started = time.perf_counter()
+    now = 0
+    while now <= HORIZON:
+        now += STEP
+        expired += len(timers.advance(now))
+    expire = time.perf_counter() - started
+    assert expired == count - len(cancelled)
+    return {
+        'structure': structure,
+        'timers': count,
+        'schedule': round(schedule / count * 1e6, 3),
+        'reschedule': round(reschedule / count * 1e6, 3),
+        'cancel': round(cancel / len(cancelled) * 1e6, 3),
+        'expire': round(expire / expired * 1e6, 3),
+        'memory_per_timer': round(memory, 1),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timers', default=TIMERS,
+                        help='числа таймеров через запятую')
+    parser.add_argument('--output', help='файл JSON Lines для результатов')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for count in args.timers.split(','):
+        for structure in ('wheel', 'heap'):
+            line = json.dumps(measure(structure, int(count)))
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as output:
+                    output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Цикл событий asyncio в виртуальном времени.
+
+Когда в цикле нет готовых событий и фоновые потоки ничего не делают,
+виртуальные часы переводятся сразу к ближайшему запланированному
+событию вместо ожидания. Пока потоки заняты (запросы в пуле потоков,
+отправка сообщений), время не идет, и цикл ждет их завершения
+в реальном времени.
+"""
+
+import asyncio
+import selectors
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BUSY_POLL = 0.005
+
+
+class VirtualTime:
+    """Виртуальные монотонные часы и соответствующее им время UNIX."""
+
+    def __init__(self, epoch: float = None):
+        self.epoch = time.time() if epoch is None else epoch
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def wall(self) -> float:
+        return self.epoch + self.now
+
+    def advance(self, delay: float) -> None:
+        self.now += delay
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Пул потоков, учитывающий число незавершенных задач."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.inflight = 0
+
+    def done(self, future) -> None:
+        with self.lock:
+            self.inflight -= 1
+
+    def submit(self, *args, **kwargs):
+        with self.lock:
+            self.inflight += 1
+        future = super().submit(*args, **kwargs)
+        future.add_done_callback(self.done)
+        return future
+
+
+class VirtualSelector:
+    """Селектор, переводящий виртуальные часы вместо ожидания."""
+
+    def __init__(self, clock: VirtualTime, busy):
+        self.selector = selectors.DefaultSelector()
+        self.clock = clock
+        self.busy = busy
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events or timeout == 0:
+            return events
+        if self.busy():
+            return self.selector.select(BUSY_POLL)
+        if timeout is None:
+            return self.selector.select(None)
+        self.clock.advance(timeout)
+        return []
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    """Цикл событий, время которого задается VirtualTime.
+
+    busy - функция без аргументов, возвращающая True, пока фоновые
+    потоки выполняют работу.
+    """
+
+    def __init__(self, clock: VirtualTime, busy):
+        self.clock = clock
+        super().__init__(VirtualSelector(clock, busy))
+
+    def time(self) -> float:
+        return self.clock.monotonic()
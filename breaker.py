@@ -0,0 +1,127 @@
+"""Предохранители (circuit breaker) для внешних сервисов.
+
+Предохранитель общий для всех пользователей одного сервиса. После
+threshold сбоев подряд он размыкается, и запросы отклоняются без
+обращения к сервису. Через recovery_timeout секунд пропускается один
+пробный запрос: при успехе предохранитель замыкается, при сбое снова
+размыкается на recovery_timeout. Так недоступность сервиса стоит одного
+запроса за интервал вместо запроса на каждого пользователя.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from exceptions import CircuitOpenError
+from metrics import Gauge
+
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 5))
+BREAKER_TIMEOUT = float(os.getenv('BREAKER_TIMEOUT', 60))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+BREAKER_OPENED = (
+    'Сервис {name} недоступен, запросы приостановлены на {delay} с.'
+)
+BREAKER_CLOSED = 'Сервис {name} снова доступен.'
+
+BREAKER_STATE = Gauge(
+    'homework_breaker_state',
+    'Состояние предохранителя: 0 - замкнут, 1 - разомкнут, 2 - пробный '
+    'запрос.',
+    ('endpoint',)
+)
+
+logger = logging.getLogger('homework.breaker')
+
+
+class CircuitBreaker:
+    """Предохранитель одного внешнего сервиса.
+
+    is_failure - функция, определяющая по исключению, говорит ли оно
+    о недоступности сервиса; остальные исключения означают, что сервис
+    ответил. Потокобезопасен.
+    """
+
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD,
+                 recovery_timeout: float = BREAKER_TIMEOUT,
+                 is_failure=None, clock=time.monotonic):
+        self.name = name
+        self.threshold = threshold
+        self.recovery_timeout = recovery_timeout
+        self.is_failure = is_failure or (lambda error: True)
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        BREAKER_STATE.set_function(
+            lambda: STATES.index(self.state), name
+        )
+
+    def retry_in(self) -> float:
+        """Время до следующего пробного запроса."""
+        with self.lock:
+            if self.state == CLOSED:
+                return 0
+            return max(self.opened + self.recovery_timeout - self.clock(), 0)
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос.
+
+        В разомкнутом состоянии по истечении recovery_timeout разрешается
+        один пробный запрос, результат которого нужно сообщить
+        методами success или failure.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.clock() - self.opened < self.recovery_timeout:
+                return False
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+                self.opened = self.clock()
+                return True
+            return False
+
+    def success(self) -> None:
+        with self.lock:
+            recovered = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+        if recovered:
+            logger.warning(BREAKER_CLOSED.format(name=self.name))
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == CLOSED and self.failures < self.threshold:
+                return
+            self.state = OPEN
+            self.opened = self.clock()
+        logger.warning(BREAKER_OPENED.format(
+            name=self.name, delay=self.recovery_timeout
+        ))
+
+    def record(self, error: Exception = None) -> None:
+        """Учет результата запроса по возникшему исключению."""
+        if error is not None and self.is_failure(error):
+            self.failure()
+        else:
+            self.success()
+
+    def call(self, function, *args, **kwargs):
+        """Вызов функции, если предохранитель ее пропускает."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            self.record(error)
+            raise
+        self.success()
+        return result
@@ -0,0 +1,337 @@
+"""Запись и воспроизведение трафика бота (кассеты).
+
+Если задана переменная среды CASSETTE, движок записывает в этот файл
+ответы API Практикума и отправки сообщений в Telegram с временем от
+начала записи и длительностью запросов. Кассета - дописываемый файл
+JSON Lines, по одному событию на строку; каждый запуск движка начинает
+в нем новый сеанс. Токены Практикума и идентификаторы чатов заменяются
+псевдонимами (Recorder.redact): HMAC со случайным ключом, который
+создается для каждого сеанса и не сохраняется в кассету. В пределах
+сеанса по кассете можно сопоставить запросы одного пользователя, но
+нельзя восстановить перебором ни токен, ни короткий идентификатор
+чата. Псевдонимами заменяются и токены в текстах событий: после OAuth
+(например, в параметрах запроса в сообщении об ошибке), токен бота
+в адресе запроса к Bot API (в сообщениях об ошибках сети) и токены,
+встреченные в теле ответа.
+
+Функция replay пропускает ответы кассеты через тот же цикл опроса
+(homework.process_homeworks): разбор, поиск изменений, составление
+и отправку сообщений. С speed=1 события воспроизводятся с записанными
+интервалами и задержками серверов, с большим speed - быстрее во столько
+же раз, с speed=0 - без пауз. Предохранитель PRACTICUM_BREAKER при
+воспроизведении идет по записанному времени, поэтому результат
+не зависит от скорости воспроизведения.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+import homework
+from exceptions import TooManyRequestsError
+from notifier import SEPARATOR
+from tenants import Tenant
+from tracing import cycle
+
+CASSETTE = os.getenv('CASSETTE')
+VERSION = 1
+SESSION = 'session'
+PRACTICUM = 'practicum'
+TELEGRAM = 'telegram'
+ANONYMOUS = 'anonymous'
+AUTHORIZATION = re.compile(r'(OAuth\s+)([^\s\'"]+)')
+# Токен бота в пути запроса к Bot API: /bot<id>:<секрет>/sendMessage.
+BOT_TOKEN = re.compile(r'(bot)(\d+:[A-Za-z0-9_-]+)')
+
+WRONG_VERSION = 'Неподдерживаемая версия кассеты {path}: {version}.'
+NO_PRACTICUM_EVENT = 'Кассета не содержит ответа для запроса.'
+
+
+def practicum_token(headers: dict) -> str:
+    """Токен из заголовка Authorization запроса или None."""
+    authorization = (headers or {}).get('Authorization')
+    return authorization.split()[-1] if authorization else None
+
+
+class Recorder:
+    """Запись событий в кассету. Потокобезопасен."""
+
+    def __init__(self, path: str, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.key = secrets.token_bytes(32)
+        # Токены, встреченные в телах ответов, и их псевдонимы.
+        self.echoed = {}
+        self.started = clock()
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.write(SESSION, version=VERSION, started=time.time())
+
+    def redact(self, value) -> str:
+        """Псевдоним токена или идентификатора чата."""
+        digest = hmac.new(
+            self.key, str(value).encode('utf-8'), hashlib.sha256
+        ).hexdigest()
+        return 'redacted-' + digest[:12]
+
+    def scrub(self, text: str, token: str = None) -> str:
+        """Замена токенов в тексте псевдонимами.
+
+        Если token встречается в text, он запоминается и заменяется
+        и в последующих текстах.
+        """
+        for pattern in (AUTHORIZATION, BOT_TOKEN):
+            text = pattern.sub(
+                lambda match: match.group(1) + self.redact(match.group(2)),
+                text
+            )
+        if homework.TELEGRAM_TOKEN and homework.TELEGRAM_TOKEN in text:
+            text = text.replace(
+                homework.TELEGRAM_TOKEN, self.redact(homework.TELEGRAM_TOKEN)
+            )
+        with self.lock:
+            if token and token in text:
+                self.echoed[token] = self.redact(token)
+            # Длинные токены заменяются первыми: токен может начинаться
+            # с другого токена.
+            echoed = sorted(
+                self.echoed.items(), key=lambda item: -len(item[0])
+            )
+        for secret, alias in echoed:
+            if secret in text:
+                text = text.replace(secret, alias)
+        return text
+
+    def write(self, kind: str, **fields) -> None:
+        event = {'kind': kind, 'at': round(self.clock() - self.started, 6)}
+        event.update(
+            (key, value) for key, value in fields.items() if value is not None
+        )
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+class RecordingTransport:
+    """Транспорт, записывающий ответы API Практикума в кассету.
+
+    Ответы, читаемые частями (stream=True), передаются без записи.
+    """
+
+    def __init__(self, transport, recorder: Recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        if kwargs.get('stream'):
+            return self.transport.get(url, params, headers, **kwargs)
+        token = practicum_token(headers)
+        event = {
+            'tenant': self.recorder.redact(token) if token else ANONYMOUS,
+            'from_date': (params or {}).get('from_date'),
+        }
+        started = self.recorder.clock()
+        try:
+            response = self.transport.get(url, params, headers, **kwargs)
+        except Exception as error:
+            self.recorder.write(
+                PRACTICUM, **event,
+                elapsed=round(self.recorder.clock() - started, 6),
+                error=self.recorder.scrub(f'{type(error).__name__}: {error}')
+            )
+            raise
+        self.recorder.write(
+            PRACTICUM, **event,
+            elapsed=round(self.recorder.clock() - started, 6),
+            status=response.status_code,
+            retry_after=response.headers.get('Retry-After'),
+            body=self.recorder.scrub(
+                response.content.decode('utf-8', 'replace'), token
+            )
+        )
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+
+class RecordingBot:
+    """Бот, записывающий отправленные сообщения в кассету."""
+
+    def __init__(self, bot, recorder: Recorder):
+        self.bot = bot
+        self.recorder = recorder
+
+    def send_message(self, chat_id, text: str, **kwargs):
+        started = self.recorder.clock()
+        error = None
+        try:
+            return self.bot.send_message(chat_id, text, **kwargs)
+        except Exception as send_error:
+            error = self.recorder.scrub(
+                f'{type(send_error).__name__}: {send_error}'
+            )
+            raise
+        finally:
+            self.recorder.write(
+                TELEGRAM, chat=self.recorder.redact(chat_id),
+                elapsed=round(self.recorder.clock() - started, 6),
+                text=self.recorder.scrub(text), error=error
+            )
+
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
+
+
+def load(path: str) -> list:
+    """События кассеты со сквозным временем at для всех сеансов."""
+    events = []
+    offset = last = 0
+    with open(path, encoding='utf-8') as cassette:
+        for line in cassette:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event['kind'] == SESSION:
+                if event.get('version') != VERSION:
+                    raise ValueError(WRONG_VERSION.format(
+                        path=path, version=event.get('version')
+                    ))
+                offset = last
+                continue
+            event['at'] += offset
+            last = max(last, event['at'])
+            events.append(event)
+    return events
+
+
+class ReplayResponse:
+    """Ответ API Практикума из кассеты."""
+
+    def __init__(self, event: dict):
+        self.status_code = event['status']
+        self.headers = {}
+        if 'retry_after' in event:
+            self.headers['Retry-After'] = event['retry_after']
+        self.content = event.get('body', '').encode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayTransport:
+    """Транспорт, отвечающий на запрос текущим событием кассеты."""
+
+    def __init__(self, speed: float = 0, sleep=time.sleep):
+        self.speed = speed
+        self.sleep = sleep
+        self.event = None
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        import requests
+
+        if self.event is None:
+            raise requests.ConnectionError(NO_PRACTICUM_EVENT)
+        event, self.event = self.event, None
+        if self.speed:
+            self.sleep(event['elapsed'] / self.speed)
+        if 'error' in event:
+            raise requests.ConnectionError(event['error'])
+        return ReplayResponse(event)
+
+
+class ReplayBot:
+    """Бот, запоминающий сообщения; отправка длится delay секунд."""
+
+    def __init__(self, delay: float = 0, sleep=time.sleep):
+        self.delay = delay
+        self.sleep = sleep
+        self.sent = []
+
+    def send_message(self, chat_id, text: str, **kwargs) -> None:
+        if self.delay:
+            self.sleep(self.delay)
+        self.sent.append(text)
+
+
+def replay(events: list, speed: float = 0, clock=time.perf_counter,
+           sleep=time.sleep) -> dict:
+    """Воспроизведение ответов кассеты через цикл опроса.
+
+    Возвращает словарь: cycles - длительности циклов опроса в секундах,
+    duration - общее время воспроизведения, lateness - наибольшее
+    опоздание цикла относительно записанного времени (при speed > 0),
+    recorded и sent - сообщения Telegram из кассеты и отправленные при
+    воспроизведении.
+    """
+    recorded = [
+        message
+        for event in events if event['kind'] == TELEGRAM
+        for message in event['text'].split(SEPARATOR)
+    ]
+    telegram = [
+        event['elapsed'] for event in events if event['kind'] == TELEGRAM
+    ]
+    delay = sum(telegram) / len(telegram) / speed if speed and telegram else 0
+    transport = ReplayTransport(speed, sleep)
+    bot = ReplayBot(delay, sleep)
+    tenants = {}
+    cycles = []
+    lateness = 0
+    now = 0
+    breaker = homework.PRACTICUM_BREAKER
+    breaker_clock = breaker.clock
+    breaker.clock = lambda: now
+    started = clock()
+    try:
+        for event in events:
+            if event['kind'] != PRACTICUM:
+                continue
+            now = event['at']
+            if speed:
+                wait = started + now / speed - clock()
+                if wait > 0:
+                    sleep(wait)
+                else:
+                    lateness = max(lateness, -wait)
+            alias = event['tenant']
+            tenant = tenants.get(alias)
+            if tenant is None:
+                tenant = tenants[alias] = Tenant(alias, len(tenants), alias)
+                tenant.timestamp = event.get('from_date', 0)
+            transport.event = event
+            cycle_started = clock()
+            with cycle(tenant.name):
+                try:
+                    tenant.timestamp, _ = homework.process_homeworks(
+                        bot, tenant.chat_id, tenant.headers,
+                        tenant.timestamp, tenant.error_cache, transport,
+                        tenant.diff
+                    )
+                except TooManyRequestsError:
+                    pass
+            cycles.append(clock() - cycle_started)
+    finally:
+        breaker.clock = breaker_clock
+    return {
+        'cycles': cycles,
+        'duration': clock() - started,
+        'lateness': lateness,
+        'recorded': recorded,
+        'sent': bot.sent,
+    }
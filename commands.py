@@ -0,0 +1,289 @@
+"""Команды бота в Telegram: /status, /history и /subscribe.
+
+Обновления принимаются длинным опросом getUpdates в отдельном потоке.
+Ответы строятся по кэшу последних известных статусов StatusCache,
+который пополняется циклом опроса движка, поэтому команды не создают
+нагрузки на API Практикума. Если сведения о пользователе устарели,
+выполняется запрос к API с ограничением частоты: не чаще одного
+запроса в LIVE_FETCH_INTERVAL секунд на чат и LIVE_FETCH_RATE
+запросов в секунду на бота.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import homework
+from diff import STATUS_CODES, homework_key, sort_key
+from ratelimit import TokenBucket
+
+LONG_POLL_TIMEOUT = 30
+POLL_RETRY_DELAY = 5
+STALE_AFTER = int(os.getenv('STATUS_STALE_AFTER', 3600))
+LIVE_FETCH_INTERVAL = 60
+LIVE_FETCH_RATE = 1
+HISTORY = 10
+STATUS_LIMIT = 20
+
+HELP = (
+    'Команды:\n'
+    '/status - текущие статусы работ\n'
+    '/history - последние изменения статусов\n'
+    '/subscribe [on|off] - включить или отключить оповещения'
+)
+UNKNOWN_CHAT = 'Этот чат не подключен к боту.'
+NO_HOMEWORKS = 'Сданных работ не найдено.'
+NO_HISTORY = 'Изменений статусов пока не было.'
+STATUS_LINE = '{name}: {verdict}'
+HISTORY_LINE = '{date} {name}: {verdict}'
+STATUS_AS_OF = 'Данные на {date}.'
+SUBSCRIBED = 'Оповещения об изменениях статусов включены.'
+UNSUBSCRIBED = 'Оповещения об изменениях статусов отключены.'
+UPDATES_FAIL = 'Не удалось получить команды из Telegram: {error}'
+LIVE_FETCH_FAIL = 'Не удалось запросить статусы для чата {chat_id}: {error}'
+COMMAND_RECEIVED = 'Команда {command} из чата {chat_id}.'
+
+logger = logging.getLogger('homework.commands')
+
+
+class ChatStatus:
+    """Последние известные статусы работ одного чата.
+
+    Записи работ - кортежи (название, код статуса, дата). Очередь
+    истории создается при первом изменении: у большинства чатов
+    изменений нет.
+    """
+
+    __slots__ = ('homeworks', 'history', 'updated', 'complete')
+
+    def __init__(self):
+        self.homeworks = {}
+        self.history = None
+        self.updated = None
+        self.complete = False
+
+    def remember(self, record: tuple) -> None:
+        if self.history is None:
+            self.history = deque(maxlen=HISTORY)
+        self.history.append(record)
+
+
+def decode(record: tuple) -> tuple:
+    name, code, date = record
+    return name, STATUS_CODES.name(code), date
+
+
+class StatusCache:
+    """Кэш статусов работ по чатам.
+
+    Цикл опроса вызывает update с изменениями каждого успешного опроса,
+    команды читают кэш методами status и history. Потокобезопасен.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.chats = {}
+
+    def update(self, chat_id, homeworks: list, complete: bool = False):
+        """Учет работ из ответа сервера.
+
+        complete - ответ содержит все работы пользователя (from_date=0).
+        """
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                chat = self.chats[chat_id] = ChatStatus()
+            for homework_record in sorted(homeworks, key=sort_key):
+                key = homework_key(homework_record)
+                record = (
+                    homework_record.get('homework_name'),
+                    STATUS_CODES.code(homework_record.get('status')),
+                    homework_record.get('date_updated'),
+                )
+                if key is None or chat.homeworks.get(key) == record:
+                    continue
+                chat.homeworks[key] = record
+                if not complete:
+                    chat.remember(record)
+            chat.updated = self.clock()
+            chat.complete = chat.complete or complete
+
+    def is_stale(self, chat_id, max_age: float = STALE_AFTER) -> bool:
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            return (
+                chat is None or not chat.complete
+                or self.clock() - chat.updated > max_age
+            )
+
+    def status(self, chat_id) -> tuple:
+        """Работы [(название, статус, дата)] от последней к первой
+        и время последнего обновления.
+        """
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                return [], None
+            homeworks = sorted(
+                map(decode, chat.homeworks.values()),
+                key=lambda record: record[2] or '', reverse=True
+            )
+            return homeworks, chat.updated
+
+    def history(self, chat_id) -> list:
+        """Последние изменения статусов от последнего к первому."""
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None or chat.history is None:
+                return []
+            return [decode(record) for record in reversed(chat.history)]
+
+
+def verdict(status: str) -> str:
+    return homework.VERDICTS.get(status, status)
+
+
+def format_date(timestamp: float) -> str:
+    return time.strftime('%d.%m.%Y %H:%M', time.localtime(timestamp))
+
+
+class CommandListener:
+    """Обработка команд пользователей, полученных длинным опросом.
+
+    Ответы отправляются через sender (например, notifier.Notifier)
+    с общими для бота ограничениями частоты. Выбор оповещений командой
+    /subscribe сохраняется в store (storage.StateStore), если он задан.
+    """
+
+    def __init__(self, bot, tenants: list, cache: StatusCache = None,
+                 sender=None, transport=None, store=None,
+                 clock=time.monotonic):
+        self.bot = bot
+        self.store = store
+        self.sender = sender or bot
+        self.tenants = {str(tenant.chat_id): tenant for tenant in tenants}
+        self.cache = cache or StatusCache()
+        self.transport = transport
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.bucket = TokenBucket(LIVE_FETCH_RATE, LIVE_FETCH_RATE, clock)
+        self.fetched = {}
+        self.offset = None
+        self.running = False
+        self.thread = None
+
+    def allow_fetch(self, chat_id) -> bool:
+        """Ограничение частоты запросов к API по командам."""
+        now = self.clock()
+        with self.lock:
+            last = self.fetched.get(chat_id)
+            if last is not None and now - last < LIVE_FETCH_INTERVAL:
+                return False
+            if not self.bucket.consume():
+                return False
+            self.fetched[chat_id] = now
+            return True
+
+    def refresh(self, tenant) -> None:
+        """Запрос всех работ пользователя, если кэш устарел."""
+        if not self.cache.is_stale(tenant.chat_id):
+            return
+        if not self.allow_fetch(tenant.chat_id):
+            return
+        try:
+            response = homework.PRACTICUM_BREAKER.call(
+                homework.fetch_api_answer, tenant.headers, 0, self.transport
+            )
+            homeworks = homework.check_response(response)
+        except Exception as error:
+            logger.warning(LIVE_FETCH_FAIL.format(
+                chat_id=tenant.chat_id, error=error
+            ))
+            return
+        self.cache.update(tenant.chat_id, homeworks, complete=True)
+
+    def status(self, tenant) -> str:
+        self.refresh(tenant)
+        homeworks, updated = self.cache.status(tenant.chat_id)
+        if updated is None:
+            return NO_HOMEWORKS
+        lines = [
+            STATUS_LINE.format(name=name, verdict=verdict(status))
+            for name, status, _ in homeworks[:STATUS_LIMIT]
+        ] or [NO_HOMEWORKS]
+        lines.append(STATUS_AS_OF.format(date=format_date(updated)))
+        return '\n'.join(lines)
+
+    def history(self, tenant) -> str:
+        lines = [
+            HISTORY_LINE.format(
+                date=(date or '')[:10], name=name, verdict=verdict(status)
+            )
+            for name, status, date in self.cache.history(tenant.chat_id)
+        ]
+        return '\n'.join(lines) or NO_HISTORY
+
+    def subscribe(self, tenant, argument: str) -> str:
+        tenant.subscribed = argument.lower() not in ('off', 'stop', '0')
+        if self.store:
+            self.store.subscribe(tenant.name, tenant.subscribed)
+        return SUBSCRIBED if tenant.subscribed else UNSUBSCRIBED
+
+    def handle(self, chat_id, text: str) -> str:
+        """Ответ на сообщение пользователя или None."""
+        if not text or not text.startswith('/'):
+            return None
+        command, _, argument = text.partition(' ')
+        command = command.split('@')[0].lower()
+        logger.debug(COMMAND_RECEIVED.format(command=command, chat_id=chat_id))
+        tenant = self.tenants.get(str(chat_id))
+        if tenant is None:
+            return UNKNOWN_CHAT
+        if command == '/status':
+            return self.status(tenant)
+        if command == '/history':
+            return self.history(tenant)
+        if command == '/subscribe':
+            return self.subscribe(tenant, argument.strip())
+        return HELP
+
+    def poll(self) -> None:
+        """Получение и обработка одной порции обновлений."""
+        updates = self.bot.get_updates(
+            offset=self.offset, timeout=LONG_POLL_TIMEOUT,
+            allowed_updates=['message']
+        )
+        for update in updates:
+            self.offset = update.update_id + 1
+            message = update.message
+            if message is None:
+                continue
+            reply = self.handle(message.chat_id, message.text)
+            if reply:
+                self.sender.send_message(message.chat_id, reply)
+
+    def run(self) -> None:
+        while self.running:
+            try:
+                self.poll()
+            except Exception as error:
+                logger.warning(UPDATES_FAIL.format(error=error))
+                time.sleep(POLL_RETRY_DELAY)
+
+    def start(self) -> None:
+        self.running = True
+        # Поток, остановленный во время длинного опроса, продолжает
+        # работу вместо запуска второго.
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(
+            target=self.run, name='commands', daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Остановка после завершения текущего длинного опроса."""
+        self.running = False
@@ -1,9 +1,33 @@
-"""Модуль сервера разработчика для отладки бота."""
+"""Модуль сервера разработчика для отладки бота.
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+Сервер имитирует API статусов домашних работ Практикума: для каждого
+токена воспроизводит сценарий изменения статусов с учетом параметра
+from_date, добавляет задержку ответа и с заданной вероятностью
+отвечает ошибками 5xx, 429 или некорректными данными. Запросы
+обрабатываются в отдельных потоках с сохранением соединения, что
+позволяет моделировать опрос тысяч пользователей на одной машине.
+
+Для подключения бота к серверу укажите переменную среды
+PRACTICUM_ENDPOINT=http://127.0.0.1:8080/
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
 HOST = '127.0.0.1'
 PORT = 8080
+# Длительность шага синтетического сценария в секундах.
+PERIOD = 600
+STATUS_CYCLE = ('reviewing', 'rejected', 'reviewing', 'approved')
+RETRY_AFTER = 5
 SAMPLE_NO_HOMEWORKS = '''{
    "current_date":1581604970
 }
@@ -75,20 +99,262 @@ INCORRECT_JSON = '''{
 '''
 
 
+MALFORMED_SAMPLES = (
+    SAMPLE_NO_HOMEWORKS, SAMPLE_HOMEWORK_WRONG_STATUS,
+    SAMPLE_HOMEWORK_ILL_FORMED, SAMPLE_RESPONSE_WITH_SERVER_ERROR,
+    INCORRECT_JSON,
+)
+NOT_AUTHENTICATED = {
+    'code': 'not_authenticated',
+    'message': 'Учетные данные не были предоставлены.',
+    'source': '__response__'
+}
+WRONG_FROM_DATE = {
+    'error': {'error': 'Wrong from_date format'},
+    'code': 'UnknownError'
+}
+SERVER_ERROR = {'error': 'Тест ошибки сервера'}
+
+
+def iso_date(timestamp: float) -> str:
+    """Дата в формате поля date_updated ответа API."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        '%Y-%m-%dT%H:%M:%SZ'
+    )
+
+
+class Scenario:
+    """Сценарии изменения статусов работ для токенов.
+
+    Сценарий токена - список событий
+    ``{"at": 0, "id": 124, "status": "reviewing", "homework_name": "..."}``,
+    где at - время события в секундах от запуска сервера. Для токенов
+    без сценария статусы меняются по кругу STATUS_CYCLE каждые period
+    секунд со сдвигом, зависящим от токена; такой сценарий не занимает
+    памяти и подходит для моделирования любого числа пользователей.
+    """
+
+    def __init__(self, timelines: dict = None, period: float = PERIOD,
+                 start: float = None):
+        self.timelines = {
+            token: sorted(events, key=lambda event: event['at'])
+            for token, events in (timelines or {}).items()
+        }
+        self.period = period
+        self.start = time.time() if start is None else start
+
+    @classmethod
+    def load(cls, path: str, **kwargs):
+        with open(path, encoding='utf-8') as file:
+            return cls(json.load(file), **kwargs)
+
+    def scripted(self, token: str, from_date: float, now: float) -> list:
+        latest = {}
+        for event in self.timelines[token]:
+            changed = self.start + event['at']
+            if changed > now:
+                break
+            latest[event['id']] = changed, event
+        return [
+            dict(
+                {key: value for key, value in event.items() if key != 'at'},
+                date_updated=iso_date(changed)
+            )
+            for changed, event in latest.values() if changed >= from_date
+        ]
+
+    def last_change(self, token: str, now: float):
+        """Номер шага и время последнего изменения синтетического
+        сценария токена.
+        """
+        seed = zlib.crc32(token.encode())
+        origin = self.start - seed % self.period
+        step = int((now - origin) // self.period)
+        return seed, step, origin + step * self.period
+
+    def synthetic(self, token: str, from_date: float, now: float) -> list:
+        seed, step, changed = self.last_change(token, now)
+        if step < 0 or changed < from_date:
+            return []
+        return [{
+            'id': seed % 100000 * 1000 + step // len(STATUS_CYCLE),
+            'status': STATUS_CYCLE[step % len(STATUS_CYCLE)],
+            'homework_name': f'{token}__hw{step // len(STATUS_CYCLE)}.zip',
+            'reviewer_comment': '',
+            'date_updated': iso_date(changed),
+            'lesson_name': 'Проект',
+        }]
+
+    def homeworks(self, token: str, from_date: float, now: float) -> list:
+        """Работы, статус которых изменился с from_date по now."""
+        if token in self.timelines:
+            return self.scripted(token, from_date, now)
+        return self.synthetic(token, from_date, now)
+
+
+class Faults:
+    """Задержки и ошибки, добавляемые к ответам сервера.
+
+    latency - описание распределения задержки в секундах:
+    ``fixed:0.05``, ``uniform:0.01,0.1``, ``exp:0.05`` или
+    ``lognormal:-3,0.5`` (параметры mu и sigma).
+    """
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0,
+                 throttle_rate: float = 0, malformed_rate: float = 0,
+                 seed: int = None):
+        kind, _, params = latency.partition(':')
+        params = [float(param) for param in params.split(',') if param]
+        distributions = {
+            'fixed': lambda rng, value=0: value,
+            'uniform': lambda rng, low, high: rng.uniform(low, high),
+            'exp': lambda rng, mean: rng.expovariate(1 / mean),
+            'lognormal': lambda rng, mu, sigma: rng.lognormvariate(mu, sigma),
+        }
+        if kind not in distributions:
+            raise ValueError(f'Неизвестное распределение задержки: {kind}')
+        self.distribution = distributions[kind]
+        self.params = params
+        self.rates = {
+            'error': error_rate,
+            'throttle': throttle_rate,
+            'malformed': malformed_rate,
+        }
+        self.local = threading.local()
+        self.seed = seed
+        self.streams = itertools.count()
+
+    @property
+    def rng(self) -> random.Random:
+        """Генератор случайных чисел потока обработки соединения.
+
+        Потоки получают разные последовательности: генератор потока
+        инициализируется seed, увеличенным на номер потока.
+        """
+        if not hasattr(self.local, 'rng'):
+            stream = next(self.streams)
+            self.local.rng = random.Random(
+                None if self.seed is None else self.seed + stream
+            )
+        return self.local.rng
+
+    def delay(self) -> float:
+        return max(self.distribution(self.rng, *self.params), 0)
+
+    def fault(self):
+        """Вид сбоя для очередного ответа или None."""
+        value = self.rng.random()
+        for kind, rate in self.rates.items():
+            if value < rate:
+                return kind
+            value -= rate
+        return None
+
+
 class DebugServer(BaseHTTPRequestHandler):
     """Имитатор сервиса сообщения статуса домашней работы."""
 
-    def do_GET(self):
-        """Формирование ответа на запрос."""
-        self.send_response(200)
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def respond(self, code: int, body, headers: dict = None) -> None:
+        if not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False)
+        data = body.encode('utf-8')
+        self.send_response(code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(bytes(SAMPLE_HOMEWORK_ILL_FORMED, 'utf-8'))
+        self.wfile.write(data)
+
+    def do_GET(self):
+        """Формирование ответа на запрос."""
+        faults, scenario = self.server.faults, self.server.scenario
+        time.sleep(faults.delay())
+        fault = faults.fault()
+        if fault == 'error':
+            return self.respond(500, SERVER_ERROR)
+        if fault == 'throttle':
+            return self.respond(
+                429, SERVER_ERROR, {'Retry-After': str(RETRY_AFTER)}
+            )
+        if fault == 'malformed':
+            return self.respond(200, faults.rng.choice(MALFORMED_SAMPLES))
+        authorization = self.headers.get('Authorization', '')
+        if not authorization.startswith('OAuth '):
+            return self.respond(401, NOT_AUTHENTICATED)
+        token = authorization[len('OAuth '):]
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            from_date = int(query.get('from_date', ['0'])[0])
+        except ValueError:
+            return self.respond(400, WRONG_FROM_DATE)
+        now = self.server.clock()
+        self.respond(200, {
+            'homeworks': scenario.homeworks(token, from_date, now),
+            'current_date': int(now),
+        })
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class EmulatorServer(ThreadingHTTPServer):
+    """Многопоточный сервер с длинной очередью входящих соединений."""
+
+    request_queue_size = 1024
+
+
+def make_server(host: str = HOST, port: int = PORT,
+                scenario: Scenario = None, faults: Faults = None,
+                verbose: bool = False) -> EmulatorServer:
+    """Создание сервера с заданным сценарием и сбоями.
+
+    Атрибут clock сервера - источник текущего времени сценария,
+    его можно заменить для моделирования в виртуальном времени.
+    """
+    server = EmulatorServer((host, port), DebugServer)
+    server.scenario = scenario or Scenario()
+    server.faults = faults or Faults()
+    server.clock = time.time
+    server.verbose = verbose
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--scenario', help='JSON-файл сценариев по токенам')
+    parser.add_argument('--period', type=float, default=PERIOD,
+                        help='шаг синтетического сценария, с')
+    parser.add_argument('--latency', default='fixed:0',
+                        help='распределение задержки ответа')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--malformed-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    server = HTTPServer((HOST, PORT), DebugServer)
-    print('Server started http://%s:%s' % (HOST, PORT))
+    args = parse_args()
+    scenario = (
+        Scenario.load(args.scenario, period=args.period) if args.scenario
+        else Scenario(period=args.period)
+    )
+    faults = Faults(
+        args.latency, args.error_rate, args.throttle_rate,
+        args.malformed_rate, args.seed
+    )
+    server = make_server(
+        args.host, args.port, scenario, faults, args.verbose
+    )
+    print('Server started http://%s:%s' % (args.host, args.port))
 
     try:
         server.serve_forever()
@@ -0,0 +1,265 @@
+"""Модуль сервера разработчика, имитирующего Telegram Bot API.
+
+Сервер реализует методы getMe, sendMessage и getUpdates, запоминает
+доставленные сообщения по чатам и с заданной вероятностью отвечает ошибкой
+ограничения частоты (RetryAfter), ошибкой 5xx или задерживает ответ
+дольше таймаута клиента. Позволяет нагрузочно тестировать отправку
+оповещений без обращения к Telegram. Сообщения пользователей, которые
+бот получит методом getUpdates, добавляются методом Mailbox.post.
+
+Для подключения бота к серверу укажите переменную среды
+TELEGRAM_API_URL=http://127.0.0.1:8081/bot
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from debugserver import Faults
+
+HOST = '127.0.0.1'
+PORT = 8081
+RETRY_AFTER = 1
+TIMEOUT_DELAY = 10
+HISTORY = 100
+
+BOT_INFO = {
+    'id': 1, 'is_bot': True, 'first_name': 'Debug', 'username': 'debug_bot'
+}
+NOT_FOUND = {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+BAD_REQUEST = {
+    'ok': False, 'error_code': 400,
+    'description': 'Bad Request: message text is empty'
+}
+FLOOD = {
+    'ok': False, 'error_code': 429,
+    'description': 'Too Many Requests: retry after {retry_after}',
+}
+BAD_GATEWAY = {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}
+
+
+class TelegramFaults(Faults):
+    """Задержки и ошибки ответов имитатора Telegram."""
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0,
+                 flood_rate: float = 0, timeout_rate: float = 0,
+                 retry_after: float = RETRY_AFTER,
+                 timeout_delay: float = TIMEOUT_DELAY, seed: int = None):
+        super().__init__(latency, seed=seed)
+        self.rates = {
+            'error': error_rate,
+            'flood': flood_rate,
+            'timeout': timeout_rate,
+        }
+        self.retry_after = retry_after
+        self.timeout_delay = timeout_delay
+
+
+class Mailbox:
+    """Сообщения, доставленные в чаты.
+
+    Для каждого чата хранятся последние history сообщений и общее число
+    доставленных сообщений.
+    """
+
+    def __init__(self, history: int = HISTORY):
+        self.lock = threading.Lock()
+        self.messages = defaultdict(lambda: deque(maxlen=history))
+        self.counts = Counter()
+        self.message_id = 0
+        self.incoming = threading.Condition(self.lock)
+        self.updates = deque(maxlen=history)
+        self.update_id = 0
+
+    def deliver(self, chat_id: str, text: str) -> int:
+        with self.lock:
+            self.message_id += 1
+            self.messages[chat_id].append(text)
+            self.counts[chat_id] += 1
+            return self.message_id
+
+    def post(self, chat_id, text: str) -> int:
+        """Сообщение пользователя боту."""
+        with self.lock:
+            self.update_id += 1
+            self.message_id += 1
+            self.updates.append({
+                'update_id': self.update_id,
+                'message': {
+                    'message_id': self.message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': int(chat_id), 'type': 'private'},
+                    'text': text,
+                },
+            })
+            self.incoming.notify_all()
+            return self.update_id
+
+    def receive(self, offset: int, timeout: float) -> list:
+        """Обновления с номерами не меньше offset; ожидание
+        не дольше timeout секунд.
+        """
+        with self.lock:
+            self.incoming.wait_for(
+                lambda: any(
+                    update['update_id'] >= offset for update in self.updates
+                ), timeout
+            )
+            return [
+                update for update in self.updates
+                if update['update_id'] >= offset
+            ]
+
+    def delivered(self, chat_id) -> list:
+        with self.lock:
+            return list(self.messages.get(str(chat_id), ()))
+
+    @property
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.counts.values())
+
+
+class DebugTelegram(BaseHTTPRequestHandler):
+    """Имитатор методов Telegram Bot API."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def respond(self, code: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def arguments(self) -> dict:
+        """Параметры вызова из строки запроса и тела запроса."""
+        url = urlparse(self.path)
+        arguments = {
+            key: values[0] for key, values in parse_qs(url.query).items()
+        }
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            if self.headers.get('Content-Type', '').startswith(
+                'application/json'
+            ):
+                arguments.update(json.loads(body))
+            else:
+                arguments.update({
+                    key: values[0] for key, values in parse_qs(body).items()
+                })
+        return arguments
+
+    def send_message(self, arguments: dict) -> None:
+        chat_id, text = arguments.get('chat_id'), arguments.get('text')
+        if chat_id is None or not text:
+            return self.respond(400, BAD_REQUEST)
+        message_id = self.server.mailbox.deliver(str(chat_id), text)
+        if self.server.on_deliver:
+            self.server.on_deliver(str(chat_id), text)
+        self.respond(200, {'ok': True, 'result': {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_INFO,
+            'text': text,
+        }})
+
+    def dispatch(self) -> None:
+        """Выполнение метода API, указанного в пути запроса."""
+        faults = self.server.faults
+        arguments = self.arguments()
+        time.sleep(faults.delay())
+        fault = faults.fault()
+        if fault == 'timeout':
+            time.sleep(faults.timeout_delay)
+        elif fault == 'error':
+            return self.respond(502, BAD_GATEWAY)
+        elif fault == 'flood':
+            return self.respond(429, dict(
+                FLOOD, description=FLOOD['description'].format(
+                    retry_after=faults.retry_after
+                ),
+                parameters={'retry_after': faults.retry_after}
+            ))
+        method = urlparse(self.path).path.rpartition('/')[2]
+        if method == 'getMe':
+            return self.respond(200, {'ok': True, 'result': BOT_INFO})
+        if method == 'sendMessage':
+            return self.send_message(arguments)
+        if method == 'getUpdates':
+            return self.respond(200, {'ok': True, 'result': (
+                self.server.mailbox.receive(
+                    int(arguments.get('offset') or 0),
+                    float(arguments.get('timeout') or 0)
+                )
+            )})
+        self.respond(404, NOT_FOUND)
+
+    do_GET = do_POST = dispatch
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TelegramServer(ThreadingHTTPServer):
+    """Многопоточный сервер с длинной очередью входящих соединений."""
+
+    request_queue_size = 1024
+
+
+def make_server(host: str = HOST, port: int = PORT,
+                faults: TelegramFaults = None,
+                verbose: bool = False) -> TelegramServer:
+    """Создание сервера с заданными сбоями.
+
+    Атрибуту on_deliver сервера можно присвоить функцию от чата и текста,
+    вызываемую при каждой доставке сообщения.
+    """
+    server = TelegramServer((host, port), DebugTelegram)
+    server.faults = faults or TelegramFaults()
+    server.mailbox = Mailbox()
+    server.on_deliver = None
+    server.verbose = verbose
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--latency', default='fixed:0',
+                        help='распределение задержки ответа')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--flood-rate', type=float, default=0)
+    parser.add_argument('--timeout-rate', type=float, default=0)
+    parser.add_argument('--retry-after', type=float, default=RETRY_AFTER)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    faults = TelegramFaults(
+        args.latency, args.error_rate, args.flood_rate, args.timeout_rate,
+        args.retry_after, seed=args.seed
+    )
+    server = make_server(args.host, args.port, faults, args.verbose)
+    print('Server started http://%s:%s' % (args.host, args.port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
+    print('Server stopped. Delivered messages: %d' % server.mailbox.total)
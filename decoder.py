@@ -0,0 +1,124 @@
+"""Разбор и проверка ответа API Практикума за один проход.
+
+Тело ответа разбирается модулем orjson (см. requirements.txt), если он
+установлен, иначе стандартным json; со стандартным json разбор медленнее
+json.loads без проверки работ. Работы проверяются так же, как
+check_response и parse_status, и сразу переводятся в компактные записи
+Homework с четырьмя нужными боту полями; остальные поля
+(reviewer_comment, lesson_name) не сохраняются. Записи поддерживают
+обращение как к словарю, поэтому заменяют словари из ответа сервера во
+всем коде обработки, а parse_status не проверяет их повторно.
+
+Работа, не прошедшая проверку, остается в списке в исходном виде:
+ошибка сообщается при ее обработке, как для ответа, полученного через
+requests.get, и не мешает оповещениям о других работах ответа.
+"""
+
+import json
+
+from exceptions import BadFormatError, MissingDataError, UnknowStatus
+from homework import (
+    NO_HOMEWORKS_IN_RESPONSE, VERDICTS, WRONG_HOMEWORK_OBJECT,
+    WRONG_HOMEWORKS_OBJECT, WRONG_RESPONSE_OBJECT
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIELDS = ('id', 'status', 'homework_name', 'date_updated')
+# Ключи ответа, при которых он содержит сведения об ошибке сервера.
+ERROR_KEYS = ('error', 'code')
+BACKEND = 'orjson' if orjson else 'json'
+LOADS = orjson.loads if orjson else json.loads
+
+
+class Homework:
+    """Запись о домашней работе.
+
+    Отсутствующее поле хранится как None; get, [] и in работают как
+    у словаря из ответа сервера.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, id, status, homework_name, date_updated):
+        self.id = id
+        self.status = status
+        self.homework_name = homework_name
+        self.date_updated = date_updated
+
+    def get(self, key, default=None):
+        value = getattr(self, key) if key in FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __eq__(self, other):
+        if not isinstance(other, Homework):
+            return NotImplemented
+        return all(
+            getattr(self, field) == getattr(other, field) for field in FIELDS
+        )
+
+    def __repr__(self):
+        return 'Homework({})'.format(', '.join(
+            f'{field}={getattr(self, field)!r}' for field in FIELDS
+        ))
+
+
+def make_record(homework) -> Homework:
+    """Проверка работы из ответа сервера и ее компактная запись."""
+    try:
+        name = homework['homework_name']
+        status = homework['status']
+    except KeyError as error:
+        raise MissingDataError(str(error))
+    except TypeError:
+        raise BadFormatError(
+            WRONG_HOMEWORK_OBJECT.format(type_name=type(homework))
+        )
+    if status not in VERDICTS:
+        raise UnknowStatus(status)
+    return Homework(
+        homework.get('id'), status, name, homework.get('date_updated')
+    )
+
+
+def decode_answer(content, loads=LOADS) -> dict:
+    """Разбор тела ответа с проверкой всех работ.
+
+    Возвращает словарь ответа, в котором работы списка homeworks
+    заменены записями Homework; работы с ошибками остаются как есть.
+    Ответ с ключом error или code возвращается без проверки, чтобы
+    вызывающий код сообщил об ошибке сервера.
+    """
+    answer = loads(content)
+    if not isinstance(answer, dict):
+        raise BadFormatError(
+            WRONG_RESPONSE_OBJECT.format(type_name=type(answer))
+        )
+    if any(key in answer for key in ERROR_KEYS):
+        return answer
+    if 'homeworks' not in answer:
+        raise MissingDataError(NO_HOMEWORKS_IN_RESPONSE)
+    homeworks = answer['homeworks']
+    if not isinstance(homeworks, list):
+        raise BadFormatError(
+            WRONG_HOMEWORKS_OBJECT.format(type_name=type(homeworks))
+        )
+    answer['homeworks'] = records = []
+    for homework in homeworks:
+        try:
+            records.append(make_record(homework))
+        except (BadFormatError, MissingDataError, UnknowStatus):
+            records.append(homework)
+    return answer
@@ -0,0 +1,127 @@
+"""Определение изменений статусов домашних работ.
+
+Работы из ответа сервера сравниваются с последним известным состоянием
+по ключу id и дате обновления date_updated. Повторы одной и той же
+работы из перекрывающихся окон from_date и устаревшие сведения
+отбрасываются. Запись с ошибкой (например, с неизвестным статусом)
+тоже запоминается после сообщения о ней, поэтому не сообщается повторно
+и не задерживает следующие изменения. Каждая работа обрабатывается
+за O(1), поэтому стоимость сравнения пропорциональна размеру ответа,
+а не истории пользователя.
+
+Известное состояние работы хранится одним целым числом: время
+обновления в секундах и код статуса из общей таблицы STATUS_CODES.
+Строки разобранного ответа сервера не удерживаются.
+"""
+
+import threading
+from datetime import datetime
+
+# Число младших битов упакованного состояния работы, отведенных под код
+# статуса.
+STATUS_BITS = 16
+
+
+def homework_key(homework: dict):
+    """Ключ работы: id или, при его отсутствии, название."""
+    return homework.get('id', homework.get('homework_name'))
+
+
+def sort_key(homework: dict) -> str:
+    """Ключ сортировки работ по дате обновления."""
+    return homework.get('date_updated') or ''
+
+
+class StatusCodes:
+    """Таблица интернирования статусов работ в малые целые числа.
+
+    Код 0 означает отсутствие статуса, неизвестные статусы получают
+    новые коды при первой встрече.
+    """
+
+    def __init__(self, statuses=()):
+        self.lock = threading.Lock()
+        self.names = [None]
+        self.codes = {None: 0}
+        self.register(statuses)
+
+    def register(self, statuses) -> None:
+        for status in statuses:
+            self.code(status)
+
+    def code(self, status) -> int:
+        code = self.codes.get(status)
+        if code is None:
+            with self.lock:
+                code = self.codes.get(status)
+                if code is None:
+                    code = self.codes[status] = len(self.names)
+                    self.names.append(status)
+        return code
+
+    def name(self, code: int):
+        return self.names[code]
+
+
+STATUS_CODES = StatusCodes()
+
+
+def date_stamp(date_updated) -> int:
+    """Дата обновления в секундах; 0, если даты нет или она неверна."""
+    if not date_updated:
+        return 0
+    try:
+        return int(datetime.fromisoformat(
+            date_updated.replace('Z', '+00:00')
+        ).timestamp())
+    except (AttributeError, ValueError):
+        return 0
+
+
+def pack(status, date_updated) -> int:
+    """Состояние работы одним целым числом."""
+    return date_stamp(date_updated) << STATUS_BITS | STATUS_CODES.code(status)
+
+
+class StatusDiff:
+    """Последние известные статусы работ одного пользователя.
+
+    known - словарь {id: (статус, дата обновления)}, например,
+    восстановленный из storage.StateStore. Внутри состояние каждой
+    работы упаковывается функцией pack.
+    """
+
+    __slots__ = ('known',)
+
+    def __init__(self, known: dict = None):
+        self.known = {
+            key: pack(status, date_updated)
+            for key, (status, date_updated) in (known or {}).items()
+        }
+
+    def is_change(self, homework: dict) -> bool:
+        """Является ли запись работы новым изменением статуса."""
+        key = homework_key(homework)
+        known = self.known.get(key)
+        if key is None or known is None:
+            return True
+        updated = date_stamp(homework.get('date_updated'))
+        if updated != known >> STATUS_BITS:
+            return updated > known >> STATUS_BITS
+        code = known & ((1 << STATUS_BITS) - 1)
+        return STATUS_CODES.code(homework.get('status')) != code
+
+    def changes(self, homeworks: list) -> list:
+        """Изменения статусов в порядке их появления."""
+        return sorted(
+            (homework for homework in homeworks if self.is_change(homework)),
+            key=sort_key
+        )
+
+    def commit(self, homework: dict) -> None:
+        """Запоминание статуса после обработки изменения."""
+        key = homework_key(homework)
+        if key is not None:
+            self.known[key] = pack(
+                homework.get('status'), homework.get('date_updated')
+            )
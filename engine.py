@@ -0,0 +1,511 @@
+"""Многопользовательский движок опроса статусов домашних работ.
+
+Все пары токен Практикума / чат Telegram обслуживаются одним процессом
+в одном цикле событий asyncio. Блокирующие запросы выполняются в пуле
+потоков ограниченного размера, поэтому потребление памяти не зависит от
+числа одновременно ожидающих опроса пользователей.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram import Bot
+
+import homework
+from cassette import CASSETTE, Recorder, RecordingBot, RecordingTransport
+from commands import CommandListener
+from exceptions import TooManyRequestsError
+from metrics import Gauge, Histogram
+from metricsserver import serve_metrics
+from notifier import Notifier
+from ratelimit import FairLimiter
+from sharding import LEASE_INTERVAL, SHARDING, Shard
+from schedule import AdaptivePolicy, Lateness, TimingWheel
+from storage import StateStore
+# Tenant остается доступным как engine.Tenant.
+from tenants import (  # noqa: F401
+    NO_TENANTS, TENANTS_FILE, Tenant, load_tenants
+)
+from tracing import cycle, install_signals, span
+from transport import Transport
+
+CONCURRENCY = int(os.getenv('CONCURRENCY', 32))
+METRICS_PORT = os.getenv('METRICS_PORT')
+COMMANDS = os.getenv('COMMANDS', '1') == '1'
+# Аренда приема команд: при распределении пользователей команды
+# принимает один процесс.
+COMMANDS_LEASE = '#commands'
+STATS_INTERVAL = 3600
+LATENESS_STATS = (
+    'Опоздание опроса относительно расписания: среднее {mean:.3f} с, '
+    'максимальное {max:.3f} с.'
+)
+FLUSH_INTERVAL = 5
+
+TENANTS_LOADED = 'Загружено пользователей: {count}.'
+LEASES_CHANGED = (
+    'Аренда пользователей: захвачено {acquired}, освобождено {released}, '
+    'истекло {lost}, всего {owned}.'
+)
+COMMANDS_ELECTED = 'Процесс принимает команды пользователей.'
+COMMANDS_RESIGNED = 'Прием команд передан другому процессу.'
+LEASE_SYNC_FAIL = (
+    'Не удалось синхронизировать аренду пользователей, опрос '
+    'приостановлен до следующей синхронизации: {error}'
+)
+FLUSH_FAIL = 'Не удалось записать состояние в хранилище: {error}'
+POLL_FAIL = 'Сбой опроса пользователя {name}: {error}'
+POLL_LOST = (
+    'Аренда пользователя {name} истекла во время опроса, '
+    'результаты опроса отброшены.'
+)
+
+
+LATENESS = Histogram(
+    'homework_schedule_lateness_seconds',
+    'Опоздание опроса относительно расписания.',
+    buckets=(0.01, 0.1, 1, 5, 10, 30, 60, 300, float('inf'))
+)
+QUEUE_DEPTH = Gauge(
+    'homework_queue_depth', 'Длина очередей движка.', ('queue',)
+)
+RATE_LIMIT = Gauge(
+    'homework_practicum_rate_limit',
+    'Текущее ограничение частоты запросов к Практикуму, в секунду.'
+)
+ACTIVE_TENANTS = Gauge(
+    'homework_active_tenants', 'Число обслуживаемых пользователей.'
+)
+
+logger = logging.getLogger('homework.engine')
+
+
+class Muted:
+    """Получатель оповещений пользователя, отключившего их командой."""
+
+    def send_message(self, chat_id, text: str) -> None:
+        pass
+
+
+MUTED = Muted()
+
+
+class Deferred:
+    """Сообщения цикла опроса, передаваемые в очередь после цикла."""
+
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, chat_id, text: str) -> None:
+        self.messages.append((chat_id, text))
+
+
+class Engine:
+    """Планировщик циклов опроса для множества пользователей.
+
+    Сроки очередного опроса хранятся в колесе таймеров, наступившие
+    сроки выбираются пачками, и готовые к опросу пользователи
+    передаются фиксированному числу обработчиков через очередь
+    ограниченной длины. Интервал опроса каждого пользователя
+    выбирается политикой policy по статусу его последней работы.
+    Запросы всех пользователей к Практикуму проходят через общее
+    ограничение частоты limiter; ответ 429 приостанавливает опрос всех
+    пользователей на время, указанное сервером. Если commands истинно,
+    бот отвечает на команды пользователей по кэшу статусов, который
+    пополняется при опросе.
+
+    Если задан shard, процесс опрашивает только арендованных им
+    пользователей (см. модуль sharding), остальные остаются в расписании
+    и начинают опрашиваться после захвата аренды. Команды принимает
+    только процесс, держащий аренду COMMANDS_LEASE; выбор /subscribe
+    передается владельцу пользователя через хранилище при
+    синхронизации аренды.
+    """
+
+    def __init__(self, bot: Bot, tenants: list,
+                 concurrency: int = CONCURRENCY,
+                 policy: AdaptivePolicy = None,
+                 transport: Transport = None,
+                 store: StateStore = None,
+                 notifier: Notifier = None,
+                 limiter: FairLimiter = None,
+                 commands: bool = False,
+                 shard: Shard = None):
+        self.bot = bot
+        self.notifier = notifier or Notifier(bot, outbox=store)
+        self.tenants = tenants
+        self.concurrency = concurrency
+        self.policy = policy or AdaptivePolicy()
+        self.transport = transport or Transport()
+        self.limiter = limiter or FairLimiter()
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.wheel = None
+        self.wakeup = None
+        self.lateness = Lateness()
+        self.shard = shard
+        self.owned = None if shard is None else set()
+        # Пользователи в очереди опроса и в опросе; вместе с owned
+        # изменяется под lease_lock.
+        self.inflight = set()
+        self.lease_lock = threading.Lock()
+        self.commands = None
+        if commands:
+            self.commands = CommandListener(
+                bot, tenants, sender=self.notifier, transport=self.transport,
+                store=store
+            )
+
+    def poll(self, index: int) -> None:
+        """Синхронный цикл опроса пользователя с номером index.
+
+        Сообщения не отправляются сразу, а ставятся в очередь notifier
+        по завершении цикла. Если аренда пользователя истекла во время
+        цикла, его результаты отбрасываются: новый владелец повторит
+        цикл с сохраненного состояния. Этапы цикла записываются
+        в трассу (см. модуль tracing).
+        """
+        tenant = self.tenants[index]
+        with cycle(tenant.name):
+            previous = tenant.timestamp
+            deferred = Deferred()
+            tenant.timestamp, changes = homework.process_homeworks(
+                deferred if tenant.subscribed else MUTED, tenant.chat_id,
+                tenant.headers, tenant.timestamp, tenant.error_cache,
+                self.transport, tenant.diff
+            )
+            with self.lease_lock:
+                if self.owned is not None and index not in self.owned:
+                    logger.warning(POLL_LOST.format(name=tenant.name))
+                    return
+            for chat_id, text in deferred.messages:
+                self.notifier.send_message(chat_id, text)
+            # Метка времени сдвигается только при успешном ответе сервера.
+            if self.commands and (changes or tenant.timestamp != previous):
+                self.commands.cache.update(tenant.chat_id, changes)
+            if changes:
+                tenant.status = changes[-1].get('status')
+                tenant.quiet = 0
+            else:
+                tenant.quiet += 1
+            if self.store:
+                with span('store'):
+                    self.store.save(
+                        tenant.name, tenant.timestamp, changes,
+                        tenant.error_cache
+                    )
+
+    def restore(self) -> None:
+        """Восстановление состояния пользователей из хранилища."""
+        for tenant in self.tenants:
+            tenant.restore(self.store)
+
+    def schedule(self, index: int, deadline: float) -> None:
+        """Назначение срока следующего опроса пользователя."""
+        self.tenants[index].deadline = deadline
+        self.wheel.schedule(index, deadline)
+        self.wakeup.set()
+
+    def startup_delay(self, index: int) -> float:
+        """Сдвиг первого опроса пользователя при запуске.
+
+        Первые burst пользователей опрашиваются сразу, остальные
+        равномерно с допустимой частотой запросов, а не ждут все разом
+        в очереди ограничения частоты.
+        """
+        return max(index - self.limiter.burst, 0) / self.limiter.rate
+
+    def reschedule(self, index: int, now: float) -> None:
+        """Назначение следующего опроса после завершения цикла.
+
+        Интервал отсчитывается от запланированного момента цикла;
+        если он уже прошел, опрос назначается на текущий момент.
+        """
+        tenant = self.tenants[index]
+        deadline = tenant.deadline + self.policy.interval(
+            tenant.status, tenant.quiet
+        )
+        self.schedule(index, max(deadline, now))
+
+    def claim(self, index: int) -> bool:
+        """Отметка пользователя как опрашиваемого перед постановкой
+        в очередь. Возвращает False, если процесс им не владеет.
+
+        Пользователь в очереди или в опросе не освобождается sync.
+        """
+        with self.lease_lock:
+            if self.owned is not None and index not in self.owned:
+                return False
+            self.inflight.add(index)
+            return True
+
+    async def worker(self, queue: asyncio.Queue) -> None:
+        """Обработчик очереди готовых к опросу пользователей."""
+        loop = asyncio.get_running_loop()
+        while True:
+            index = await queue.get()
+            try:
+                # Аренда могла истечь, пока пользователь ждал в очереди.
+                if self.owned is None or index in self.owned:
+                    await self.limiter.acquire(index)
+                    await loop.run_in_executor(self.executor, self.poll, index)
+            except TooManyRequestsError as error:
+                self.limiter.throttle(error.retry_after)
+            except Exception as error:
+                # Сбой одного опроса не должен останавливать обработчик:
+                # пользователь будет опрошен снова по расписанию.
+                logger.exception(POLL_FAIL.format(
+                    name=self.tenants[index].name, error=error
+                ))
+            finally:
+                with self.lease_lock:
+                    self.inflight.discard(index)
+                queue.task_done()
+                self.reschedule(index, loop.time())
+
+    def sync(self) -> set:
+        """Синхронизация аренды пользователей (в потоке пула).
+
+        Пользователи, перешедшие к другому процессу, перестают
+        опрашиваться, их состояние записывается в хранилище до
+        освобождения аренды. Пользователи, аренду которых процесс
+        потерял (например, она истекла и захвачена другим процессом),
+        перестают опрашиваться сразу. Недоставленные сообщения тех
+        и других удаляются из очереди notifier и остаются в outbox
+        для нового владельца, поэтому не отправляются дважды.
+        Состояние захваченных пользователей читается из хранилища, их
+        недоставленные сообщения повторно ставятся в очередь.
+        Возвращает номера захваченных пользователей.
+        """
+        names = {
+            tenant.name: index for index, tenant in enumerate(self.tenants)
+        }
+        wanted = self.shard.assigned(names)
+        if self.commands:
+            wanted.add(COMMANDS_LEASE)
+        with self.lease_lock:
+            released = {
+                index for index in self.owned
+                if self.tenants[index].name not in wanted
+            } - self.inflight
+            self.owned -= released
+        if self.store:
+            self.store.flush()
+        self.handoff(released)
+        held = self.shard.acquire(
+            wanted, [self.tenants[index].name for index in released]
+        )
+        if self.commands:
+            self.listen(COMMANDS_LEASE in held)
+        held = {names[name] for name in held if name in names}
+        with self.lease_lock:
+            lost = self.owned - held
+            self.owned -= lost
+            acquired = held - self.owned
+        self.handoff(lost)
+        if self.store:
+            for index in acquired:
+                self.tenants[index].restore(self.store)
+            # Команду /subscribe мог принять другой процесс.
+            subscriptions = self.store.subscriptions()
+            for index in held:
+                tenant = self.tenants[index]
+                tenant.subscribed = subscriptions.get(
+                    tenant.name, tenant.subscribed
+                )
+        if acquired:
+            self.notifier.replay(
+                {self.tenants[index].chat_id for index in acquired}
+            )
+        with self.lease_lock:
+            self.owned |= acquired
+        if released or acquired or lost:
+            logger.info(LEASES_CHANGED.format(
+                acquired=len(acquired), released=len(released),
+                lost=len(lost), owned=len(self.owned)
+            ))
+        return acquired
+
+    def listen(self, elected: bool) -> None:
+        """Запуск или остановка приема команд по аренде COMMANDS_LEASE."""
+        if elected and not self.commands.running:
+            logger.info(COMMANDS_ELECTED)
+            self.commands.start()
+        elif not elected and self.commands.running:
+            logger.info(COMMANDS_RESIGNED)
+            self.commands.stop()
+
+    def handoff(self, indexes: set) -> None:
+        """Отказ от отправки сообщений пользователям indexes.
+
+        Сообщения должны быть записаны в хранилище: они остаются
+        в outbox и повторяются процессом, захватившим пользователя.
+        """
+        if not indexes:
+            return
+        dropped = self.notifier.drop(
+            {self.tenants[index].chat_id for index in indexes}
+        )
+        if self.store:
+            self.store.forget(dropped)
+
+    async def rebalance(self) -> None:
+        """Периодическая синхронизация аренды пользователей."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                acquired = await loop.run_in_executor(
+                    self.executor, self.sync
+                )
+            except Exception as error:
+                # Аренда не продлена и может перейти к другому процессу.
+                logger.error(LEASE_SYNC_FAIL.format(error=error))
+                with self.lease_lock:
+                    self.owned.clear()
+                if self.commands:
+                    self.listen(False)
+            else:
+                now = loop.time()
+                for index in acquired:
+                    self.schedule(index, now)
+            await asyncio.sleep(LEASE_INTERVAL)
+
+    async def report(self) -> None:
+        """Периодическая запись статистики в журнал."""
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            logger.info(str(self.transport.stats))
+            logger.info(str(self.notifier))
+            logger.info(LATENESS_STATS.format(
+                mean=self.lateness.mean, max=self.lateness.max
+            ))
+
+    async def flush(self) -> None:
+        """Периодическая запись состояния в хранилище."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await loop.run_in_executor(self.executor, self.store.flush)
+            except Exception as error:
+                # Изменения остаются в памяти до следующей записи.
+                logger.error(FLUSH_FAIL.format(error=error))
+
+    async def run(self) -> None:
+        """Бесконечный цикл опроса всех пользователей."""
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        # При распределении пользователей недоставленные сообщения
+        # повторяются только для арендованных пользователей (см. sync).
+        self.notifier.start(replay=self.shard is None)
+        self.limiter.start()
+        # При распределении пользователей прием команд запускает sync
+        # в процессе, получившем аренду COMMANDS_LEASE.
+        if self.commands and self.shard is None:
+            self.commands.start()
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        QUEUE_DEPTH.set_function(queue.qsize, 'poll')
+        QUEUE_DEPTH.set_function(lambda: self.notifier.depth, 'telegram')
+        QUEUE_DEPTH.set_function(lambda: self.limiter.waiting, 'limiter')
+        RATE_LIMIT.set_function(lambda: self.limiter.current_rate)
+        ACTIVE_TENANTS.set(len(self.tenants))
+        workers = [
+            asyncio.create_task(self.worker(queue))
+            for _ in range(self.concurrency)
+        ]
+        workers.append(asyncio.create_task(self.report()))
+        if self.store:
+            self.restore()
+            workers.append(asyncio.create_task(self.flush()))
+        if self.shard:
+            workers.append(asyncio.create_task(self.rebalance()))
+        now = loop.time()
+        self.wheel = TimingWheel(start=now)
+        for index in range(len(self.tenants)):
+            self.schedule(index, now + self.startup_delay(index))
+        try:
+            while True:
+                self.wakeup.clear()
+                due = self.wheel.advance(loop.time())
+                if not due:
+                    deadline = self.wheel.next_deadline()
+                    if deadline is None:
+                        await self.wakeup.wait()
+                        continue
+                    try:
+                        await asyncio.wait_for(
+                            self.wakeup.wait(), deadline - loop.time()
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                for index in due:
+                    if not self.claim(index):
+                        self.reschedule(index, loop.time())
+                        continue
+                    await queue.put(index)
+                    lateness = loop.time() - self.tenants[index].deadline
+                    self.lateness.add(lateness)
+                    LATENESS.observe(lateness)
+        finally:
+            for task in workers:
+                task.cancel()
+            self.limiter.stop()
+            if self.commands:
+                self.commands.stop()
+            self.executor.shutdown(wait=False)
+            self.transport.close()
+            self.notifier.stop()
+            if self.shard:
+                # Сообщения, не отправленные за время остановки,
+                # повторит новый владелец пользователя.
+                self.notifier.drop(timeout=0)
+            if self.store:
+                self.store.flush()
+            if self.shard:
+                self.shard.leave()
+
+
+def main():
+    """Запуск бота для всех пользователей из конфигурации."""
+    homework.configure_logging()
+    if not homework.TELEGRAM_TOKEN:
+        homework.logger.critical(
+            homework.MISSING_VARIABLE.format(names='TELEGRAM_TOKEN')
+        )
+        raise RuntimeError('Запуск невозможен. Подробности в журнале ошибок.')
+    tenants = load_tenants(TENANTS_FILE)
+    if not tenants:
+        logger.critical(NO_TENANTS)
+        raise RuntimeError('Запуск невозможен. Подробности в журнале ошибок.')
+    logger.info(TENANTS_LOADED.format(count=len(tenants)))
+    if METRICS_PORT:
+        serve_metrics(int(METRICS_PORT))
+    install_signals()
+    bot = homework.make_bot(con_pool_size=CONCURRENCY + 4)
+    transport = Transport()
+    recorder = None
+    if CASSETTE:
+        recorder = Recorder(CASSETTE)
+        bot = RecordingBot(bot, recorder)
+        transport = RecordingTransport(transport, recorder)
+    store = StateStore()
+    shard = Shard() if SHARDING else None
+    try:
+        asyncio.run(Engine(
+            bot, tenants, transport=transport, store=store,
+            commands=COMMANDS, shard=shard
+        ).run())
+    finally:
+        store.close()
+        if recorder:
+            recorder.close()
+        if shard:
+            shard.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Подавление повторных сообщений об ошибках.
+
+Ошибки различаются по отпечатку - классу исключения и адресу запроса, а
+не по тексту сообщения, в который попадают параметры запроса. О первой
+ошибке с новым отпечатком сообщается полностью, повторы только
+подсчитываются и периодически сообщаются сводкой. Размер кеша ограничен,
+давно не повторявшиеся ошибки вытесняются.
+"""
+
+import time
+from collections import OrderedDict
+
+MAX_SIZE = 100
+TTL = 3600
+SUMMARY_INTERVAL = 3600
+
+ERROR_SUMMARY = '{name} ×{count} за последние {minutes} мин.'
+
+
+def fingerprint(error: Exception) -> str:
+    """Отпечаток ошибки: класс исключения и адрес запроса."""
+    url = getattr(error, 'url', None)
+    name = type(error).__name__
+    return f'{name} {url}' if url else name
+
+
+class ErrorRecord:
+    """Сведения о повторах одной ошибки."""
+
+    __slots__ = ('name', 'seen', 'reported', 'count')
+
+    def __init__(self, name: str, now: float):
+        self.name = name
+        self.seen = now
+        self.reported = now
+        self.count = 0
+
+
+class ErrorCache:
+    """Ограниченный по размеру и времени жизни кеш отпечатков ошибок."""
+
+    __slots__ = ('max_size', 'ttl', 'summary_interval', 'clock', 'records')
+
+    def __init__(self, keys=(), max_size: int = MAX_SIZE, ttl: float = TTL,
+                 summary_interval: float = SUMMARY_INTERVAL,
+                 clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.summary_interval = summary_interval
+        self.clock = clock
+        self.records = OrderedDict()
+        now = clock()
+        for key in keys:
+            self.records[key] = ErrorRecord(key.split()[0], now)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def expire(self, now: float) -> None:
+        while self.records:
+            record = next(iter(self.records.values()))
+            if now - record.seen < self.ttl:
+                break
+            self.records.popitem(last=False)
+
+    def add(self, error: Exception) -> bool:
+        """Учет ошибки; True, если о ней нужно сообщить."""
+        now = self.clock()
+        self.expire(now)
+        key = fingerprint(error)
+        record = self.records.get(key)
+        if record is not None:
+            record.seen = now
+            record.count += 1
+            self.records.move_to_end(key)
+            return False
+        self.records[key] = ErrorRecord(type(error).__name__, now)
+        if len(self.records) > self.max_size:
+            self.records.popitem(last=False)
+        return True
+
+    def summaries(self, force: bool = False) -> list:
+        """Сводки о подавленных повторах ошибок.
+
+        Сводка по ошибке формируется не чаще summary_interval, если
+        не задан force.
+        """
+        now = self.clock()
+        summaries = []
+        for record in self.records.values():
+            elapsed = now - record.reported
+            if record.count and (force or elapsed >= self.summary_interval):
+                summaries.append(ERROR_SUMMARY.format(
+                    name=record.name, count=record.count,
+                    minutes=max(round(elapsed / 60), 1)
+                ))
+                record.count = 0
+                record.reported = now
+        return summaries
+
+    def clear(self) -> None:
+        self.records.clear()
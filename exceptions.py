@@ -13,6 +13,7 @@ class ApiError(Exception):
         super().__init__(self.MESSAGE.format(
             msg=msg, url=url, headers=headers, params=params
         ))
+        self.url = url
 
 
 class NoResponseError(ApiError):
@@ -22,7 +23,18 @@ class NoResponseError(ApiError):
 
 class BadResponseError(ApiError):
     """Сервер вернул код ошибки."""
-    pass
+
+    def __init__(self, msg, url, headers, params, code=None):
+        super().__init__(msg, url, headers, params)
+        self.code = code
+
+
+class TooManyRequestsError(BadResponseError):
+    """Сервер ограничил частоту запросов (код 429)."""
+
+    def __init__(self, msg, url, headers, params, retry_after):
+        super().__init__(msg, url, headers, params, code=429)
+        self.retry_after = retry_after
 
 
 class ServerError(ApiError):
@@ -30,6 +42,19 @@ class ServerError(ApiError):
     pass
 
 
+class CircuitOpenError(Exception):
+    """Запрос отклонен разомкнутым предохранителем сервиса."""
+
+    MESSAGE = (
+        'Сервис {name} недоступен, следующая попытка через {delay:.0f} с.'
+    )
+
+    def __init__(self, name, delay):
+        super().__init__(self.MESSAGE.format(name=name, delay=delay))
+        self.name = name
+        self.delay = delay
+
+
 class MissingDataError(KeyError):
     """Базовый класс для ошибок отсутствия данных в ответе сервера."""
 
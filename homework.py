@@ -1,19 +1,38 @@
-"""Телеграм-бот для информирования об изменении статуса домашней работы."""
+"""Телеграм-бот для информирования об изменении статуса домашней работы.
 
+Модули requests и python-telegram-bot импортируются при первом
+обращении к сети, а обработчики журнала подключаются при запуске бота,
+поэтому импорт модуля и однократная проверка (--once) без изменений
+статусов обходятся без их загрузки.
+"""
+
+from __future__ import annotations
+
+import argparse
 import logging
 import os
 import sys
 import time
+from http import HTTPStatus
+from typing import TYPE_CHECKING
 
-import requests
 from dotenv import load_dotenv
-from telegram import Bot
-from telegram.error import TelegramError
 
+from breaker import CircuitBreaker
+from diff import STATUS_CODES, StatusDiff
+from errorcache import ErrorCache
+from logs import setup_logging
+from metrics import Counter, Histogram
+from schedule import CycleScheduler
 from exceptions import (
-    NoResponseError, BadResponseError, ServerError,
-    BadFormatError, MissingDataError, UnknowStatus
+    NoResponseError, BadResponseError, ServerError, TooManyRequestsError,
+    BadFormatError, MissingDataError, UnknowStatus, CircuitOpenError
 )
+from storage import StateStore
+from tracing import cycle, span
+
+if TYPE_CHECKING:
+    from telegram import Bot
 
 
 SUCCESS = 'В Telegram отправлено сообщение: "{message}"'
@@ -23,6 +42,9 @@ REQUEST_FAIL = (
     'Ошибка: {error}'
 )
 WRONG_STATUS_CODE = ('Сервер вернул неожиданный статус ответа: {code}.')
+TOO_MANY_REQUESTS = (
+    'Сервер ограничил частоту запросов, повтор через {delay:.0f} с.'
+)
 SERVER_FAIL = (
     'Сервер вернул сообщение "{name}" следующего содержания: "{text}". '
 )
@@ -30,6 +52,9 @@ WRONG_RESPONSE_OBJECT = 'Вместо словаря от сервера пол
 WRONG_HOMEWORKS_OBJECT = (
     'Вместо списка домашних работ получен объект {type_name}'
 )
+WRONG_HOMEWORK_OBJECT = (
+    'Вместо словаря с домашней работой получен объект {type_name}'
+)
 NO_HOMEWORKS_IN_RESPONSE = 'В ответе сервера не обнаружено ключа homeworks.'
 WRONG_HOMEWORK_STATUS = 'Неизвестный статус домашней работы - "{status}"'
 STATUS_CHANGED = 'Изменился статус проверки работы "{name}". {verdict}'
@@ -37,19 +62,22 @@ MISSING_VARIABLE = 'Не задана(ы) переменная(ые) среды:
 ERROR_REPORT_FAIL = 'Ошибка при отправке сообщения об ошибке: {error}'
 PROCESSING_COMPLETE = 'Обработка статуса домашних работ завершена успешно.'
 NO_HOMEWORK_UPDATE = 'Обновлений не получено.'
-
-formatter = logging.Formatter(
-    '%(asctime)s [%(levelname)s] Log "%(name)s" function "%(funcName)s" '
-    'line %(lineno)d - %(message)s'
+ONCE_COMPLETE = (
+    'Проверка завершена. Пользователей: {count}, изменений: {changes}.'
 )
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-stream_handler = logging.StreamHandler(stream=sys.stdout)
-stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
-file_handler = logging.FileHandler(__file__ + '.log')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+# Коды завершения однократной проверки (--once)
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_CONFIG = 2
+EXIT_TEMPFAIL = 75
+
+# Имя журнала не зависит от способа запуска (модуль или __main__),
+# журналы модулей бота homework.* наследуют его обработчики.
+logger = logging.getLogger('homework')
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'homework.py.log')
+log_listener = None
 
 load_dotenv()
 PRACTICUM_TOKEN = TELEGRAM_TOKEN = TELEGRAM_CHAT_ID = None
@@ -58,38 +86,214 @@ for name in VARIABLES:
     globals()[name] = os.getenv(name)
 
 RETRY_TIME = 600
-ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
+RETRY_AFTER = 60
+TIMEOUT = (5, 30)
+ENDPOINT = os.getenv(
+    'PRACTICUM_ENDPOINT',
+    'https://practicum.yandex.ru/api/user_api/homework_statuses/'
+)
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
+TELEGRAM_API_URL = os.getenv(
+    'TELEGRAM_API_URL', 'https://api.telegram.org/bot'
+)
+
+API_LATENCY = Histogram(
+    'homework_api_request_seconds', 'Длительность запроса к API Практикума.'
+)
+ERRORS = Counter(
+    'homework_errors_total', 'Ошибки цикла опроса по классам исключений.',
+    ('error',)
+)
 
 VERDICTS = {
     'approved': 'Работа проверена: ревьюеру всё понравилось. Ура!',
     'reviewing': 'Работа взята на проверку ревьюером.',
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
+# Коды статусов для компактного хранения следуют порядку VERDICTS.
+STATUS_CODES.register(VERDICTS)
+
+
+def configure_logging() -> None:
+    """Подключение обработчиков журнала при запуске бота."""
+    global log_listener
+    if log_listener is None:
+        log_listener = setup_logging(logger, LOG_FILE)
+
+
+def make_bot(token: str = None, **kwargs) -> Bot:
+    """Создание бота Telegram, защищенного предохранителем."""
+    from telegram import Bot
+
+    from notifier import GuardedRequest
+
+    return Bot(
+        token=token or TELEGRAM_TOKEN, base_url=TELEGRAM_API_URL,
+        request=GuardedRequest(**kwargs)
+    )
+
+
+class LazyBot:
+    """Бот Telegram, создаваемый при первой отправке сообщения."""
+
+    def __init__(self, token: str = None):
+        """Бот с токеном token, по умолчанию TELEGRAM_TOKEN."""
+        self.token = token
+        self.bot = None
+
+    def send_message(self, chat_id, text: str):
+        """Отправка сообщения с созданием бота при первом вызове."""
+        if self.bot is None:
+            self.bot = make_bot(self.token)
+        return self.bot.send_message(chat_id, text)
+
+
+class LazyTransport:
+    """Транспорт transport.Transport, создаваемый при первом запросе."""
+
+    def __init__(self):
+        """Транспорт без соединений до первого запроса."""
+        self.transport = None
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        """Запрос GET с созданием транспорта при первом вызове."""
+        if self.transport is None:
+            from transport import Transport
+
+            self.transport = Transport()
+        return self.transport.get(url, params, headers, **kwargs)
+
+    def close(self) -> None:
+        """Закрытие соединений транспорта, если он был создан."""
+        if self.transport is not None:
+            self.transport.close()
+
+
+def is_delivery_error(error: Exception) -> bool:
+    """Является ли ошибка ошибкой Telegram.
+
+    Ошибка Telegram не может возникнуть, пока модуль telegram не загружен,
+    поэтому проверка не требует его импорта.
+    """
+    telegram_errors = sys.modules.get('telegram.error')
+    return telegram_errors is not None and isinstance(
+        error, telegram_errors.TelegramError
+    )
+
+
+def make_headers(token: str) -> dict:
+    """Заголовки запроса к серверу для заданного токена."""
+    return {'Authorization': f'OAuth {token}'}
+
+
+def send_chat_message(bot: Bot, chat_id, message: str) -> None:
+    """Отправка сообщения в заданный чат Telegram."""
+    bot.send_message(chat_id, message)
+    logger.info(SUCCESS.format(message=message))
 
 
 def send_message(bot: Bot, message: str) -> None:
     """Отправка сообщения в Telegram."""
-    bot.send_message(TELEGRAM_CHAT_ID, message)
-    logger.info(SUCCESS.format(message=message))
+    send_chat_message(bot, TELEGRAM_CHAT_ID, message)
 
 
-def get_api_answer(current_timestamp: int) -> dict:
-    """Запрос данных у сервера."""
-    request_data = {
+def parse_retry_after(value, default: float = RETRY_AFTER) -> float:
+    """Пауза в секундах из заголовка Retry-After.
+
+    Заголовок содержит число секунд или дату HTTP; при его отсутствии
+    или ошибке разбора возвращается default.
+    """
+    if not value:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def is_outage(error: Exception) -> bool:
+    """Говорит ли ошибка запроса о недоступности сервера Практикума."""
+    if isinstance(error, NoResponseError):
+        return True
+    return (
+        isinstance(error, BadResponseError)
+        and error.code is not None and error.code >= 500
+    )
+
+
+PRACTICUM_BREAKER = CircuitBreaker('practicum', is_failure=is_outage)
+
+
+def api_request(headers: dict, current_timestamp: int) -> dict:
+    """Параметры запроса к серверу."""
+    return {
         'url': ENDPOINT,
-        'headers': HEADERS,
+        'headers': headers,
         'params': {'from_date': current_timestamp}
     }
+
+
+def send_request(request_data: dict, transport=None, **kwargs):
+    """Отправка запроса к серверу с проверкой статуса ответа.
+
+    Запрос выполняется через transport (например, transport.Transport),
+    если он задан, иначе - через requests.get; kwargs передаются им
+    (например, stream=True для чтения ответа частями).
+    """
+    import requests
+
+    started = time.perf_counter()
     try:
-        response = requests.get(**request_data)
+        with span('request'):
+            if transport is None:
+                response = requests.get(
+                    **request_data, timeout=TIMEOUT, **kwargs
+                )
+            else:
+                response = transport.get(**request_data, **kwargs)
     except requests.RequestException as error:
         raise NoResponseError(REQUEST_FAIL.format(error=error), **request_data)
+    finally:
+        API_LATENCY.observe(time.perf_counter() - started)
+    if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        delay = parse_retry_after(response.headers.get('Retry-After'))
+        raise TooManyRequestsError(
+            TOO_MANY_REQUESTS.format(delay=delay), **request_data,
+            retry_after=delay
+        )
     if response.status_code != 200:
         raise BadResponseError(
-            WRONG_STATUS_CODE.format(code=response.status_code), **request_data
+            WRONG_STATUS_CODE.format(code=response.status_code),
+            **request_data, code=response.status_code
         )
-    json = response.json()
+    return response
+
+
+def fetch_api_answer(
+    headers: dict, current_timestamp: int, transport=None
+) -> dict:
+    """Запрос данных у сервера с заданными заголовками.
+
+    Запрос выполняется через transport (например, transport.Transport),
+    если он задан, иначе - через requests.get. Ответ, полученный через
+    transport, разбирается и проверяется за один проход функцией
+    decoder.decode_answer; повторно записи не проверяются.
+    """
+    request_data = api_request(headers, current_timestamp)
+    response = send_request(request_data, transport)
+    with span('decode'):
+        if transport is None:
+            json = response.json()
+        else:
+            from decoder import decode_answer
+
+            json = decode_answer(response.content)
     for key in ('error', 'code'):
         if key in json:
             raise ServerError(
@@ -98,6 +302,11 @@ def get_api_answer(current_timestamp: int) -> dict:
     return json
 
 
+def get_api_answer(current_timestamp: int) -> dict:
+    """Запрос данных у сервера."""
+    return fetch_api_answer(HEADERS, current_timestamp)
+
+
 def check_response(response: dict) -> list:
     """Извлечение списка домашних работ из ответа сервера."""
     if not isinstance(response, dict):
@@ -115,7 +324,17 @@ def check_response(response: dict) -> list:
 
 
 def parse_status(homework: dict) -> str:
-    """Составление сообщения о статусе домашней работы."""
+    """Составление сообщения о статусе домашней работы.
+
+    Запись decoder.Homework уже проверена при разборе ответа. Модуль
+    decoder не загружается, пока ответы не разбираются им, поэтому
+    проверка типа не требует его импорта.
+    """
+    decoder = sys.modules.get('decoder')
+    if decoder is not None and type(homework) is decoder.Homework:
+        return STATUS_CHANGED.format(
+            name=homework.homework_name, verdict=VERDICTS[homework.status]
+        )
     # Автоматические тесты ожидают проверку имени перед запрсом вердикта
     try:
         name = homework['homework_name']
@@ -135,44 +354,222 @@ def check_tokens() -> bool:
     return not missing
 
 
-def send_error(bot: Bot, message: str, error_cache: set):
+def send_chat_error(
+    bot: Bot, chat_id, error: Exception, error_cache: ErrorCache
+):
+    """Отправка сообщения об ошибке в заданный чат Telegram.
+
+    О повторах ошибки сообщается периодической сводкой.
+    """
+    try:
+        if error_cache.add(error):
+            send_chat_message(bot, chat_id, FAILURE.format(error=error))
+        for summary in error_cache.summaries():
+            send_chat_message(bot, chat_id, FAILURE.format(error=summary))
+    except Exception as report_error:
+        logger.exception(ERROR_REPORT_FAIL.format(error=report_error))
+
+
+def send_error(bot: Bot, error: Exception, error_cache: ErrorCache):
     """Отправка сообщения об ошибке в Telegram."""
+    send_chat_error(bot, TELEGRAM_CHAT_ID, error, error_cache)
+
+
+def close_errors(bot: Bot, chat_id, error_cache: ErrorCache):
+    """Итоговая сводка по ошибкам после восстановления работы."""
+    try:
+        for summary in error_cache.summaries(force=True):
+            send_chat_message(bot, chat_id, FAILURE.format(error=summary))
+    except Exception as report_error:
+        logger.exception(ERROR_REPORT_FAIL.format(error=report_error))
+    error_cache.clear()
+
+
+def report_failure(
+    bot: Bot, chat_id, error: Exception, error_cache: ErrorCache
+):
+    """Учет ошибки цикла опроса в журнале и сообщение о ней в чат.
+
+    Вызывается из обработчика исключения. Об ошибках доставки сообщений
+    и формата ответа в чат не сообщается.
+    """
+    ERRORS.inc(type(error).__name__)
+    logger.exception(FAILURE.format(error=error))
+    if not (
+        is_delivery_error(error)
+        or isinstance(error, (MissingDataError, BadFormatError))
+    ):
+        send_chat_error(bot, chat_id, error, error_cache)
+
+
+def process_homeworks(
+    bot: Bot, chat_id, headers: dict, timestamp: int,
+    error_cache: ErrorCache, transport=None, diff: StatusDiff = None
+) -> tuple:
+    """Один цикл опроса сервера и оповещения об изменениях.
+
+    Сообщение отправляется для каждой работы, статус которой изменился
+    относительно известного diff. Ошибка в записи одной работы
+    сообщается, и обработка ответа продолжается. Возвращает метку времени для
+    следующего запроса и список обработанных изменений. Ограничение
+    частоты запросов сервером (TooManyRequestsError) передается
+    вызывающему коду, который должен отложить следующий опрос. Пока
+    сервер недоступен, запросы всех пользователей отклоняются общим
+    предохранителем PRACTICUM_BREAKER без обращения к серверу.
+    """
+    diff = diff or StatusDiff()
+    changes = []
+    failed = False
     try:
-        if message not in error_cache:
-            send_message(bot, message)
-            error_cache.add(message)
+        response = PRACTICUM_BREAKER.call(
+            fetch_api_answer, headers, timestamp, transport
+        )
+        homeworks = check_response(response)
+        with span('diff'):
+            updates = diff.changes(homeworks)
+        for homework in updates:
+            try:
+                with span('parse'):
+                    message = parse_status(homework)
+            except (MissingDataError, UnknowStatus) as error:
+                # Ошибочная запись не задерживает остальные работы ответа.
+                # Ее статус запоминается, чтобы не сообщать о ней
+                # в каждом цикле.
+                report_failure(bot, chat_id, error, error_cache)
+                diff.commit(homework)
+                failed = True
+                continue
+            with span('send'):
+                send_chat_message(bot, chat_id, message)
+            diff.commit(homework)
+            changes.append(homework)
+        if not changes:
+            logger.debug(NO_HOMEWORK_UPDATE)
+        timestamp = response.get('current_date', timestamp)
+    except TooManyRequestsError as error:
+        ERRORS.inc(type(error).__name__)
+        logger.warning(str(error))
+        raise
+    except CircuitOpenError as error:
+        logger.warning(str(error))
     except Exception as error:
-        logger.exception(ERROR_REPORT_FAIL.format(error=error))
+        report_failure(bot, chat_id, error, error_cache)
+    else:
+        if error_cache and not failed:
+            close_errors(bot, chat_id, error_cache)
+        logger.info(PROCESSING_COMPLETE)
+    return timestamp, changes
 
 
 def main():
     """Основная логика работы бота."""
     if not check_tokens():
         raise RuntimeError('Запуск невозможен. Подробности в журнале ошибок.')
-    error_cache = set()
-    bot = Bot(token=TELEGRAM_TOKEN)
-    timestamp = int(time.time())
-    while True:
-        try:
-            response = get_api_answer(timestamp)
-            homeworks = check_response(response)
-            if homeworks:
-                send_message(bot, parse_status(homeworks[0]))
-            else:
-                logger.debug(NO_HOMEWORK_UPDATE)
-            timestamp = response.get('current_date', timestamp)
-        except (TelegramError, MissingDataError, BadFormatError) as error:
-            logger.exception(FAILURE.format(error=error))
-        except Exception as error:
-            message = FAILURE.format(error=error)
-            logger.exception(message)
-            send_error(bot, message, error_cache)
-        else:
-            error_cache.clear()
-            logger.info(PROCESSING_COMPLETE)
-        finally:
-            time.sleep(RETRY_TIME)
+    store = StateStore()
+    tenant = str(TELEGRAM_CHAT_ID)
+    error_cache = ErrorCache(store.error_keys(tenant))
+    diff = StatusDiff(store.homework_statuses(tenant))
+    bot = make_bot()
+    # Часы реального времени нужны только для первого запроса,
+    # далее метка времени берется из ответа сервера.
+    timestamp = store.watermark(tenant, int(time.time()))
+
+    def poll():
+        nonlocal timestamp
+        with cycle(tenant):
+            try:
+                timestamp, changes = process_homeworks(
+                    bot, TELEGRAM_CHAT_ID, HEADERS, timestamp, error_cache,
+                    diff=diff
+                )
+            except TooManyRequestsError as error:
+                # Пропущенные за время паузы циклы планировщик не повторяет.
+                time.sleep(error.retry_after)
+                return
+            with span('store'):
+                store.save(tenant, timestamp, changes, error_cache)
+                store.flush()
+
+    CycleScheduler(RETRY_TIME).run(poll)
+
+
+def check_once(state_file: str = None) -> int:
+    """Однократная проверка статусов всех пользователей.
+
+    Метки времени, статусы работ и недоставленные сообщения об ошибках
+    берутся из файла состояния и сохраняются в него после проверки.
+    Возвращает код завершения: EXIT_OK, EXIT_FAILURE при ошибках
+    опроса или отправки, EXIT_CONFIG при ошибке конфигурации,
+    EXIT_TEMPFAIL, если сервер ограничил частоту запросов.
+    """
+    from tenants import NO_TENANTS, TENANTS_FILE, load_tenants
+
+    if not TELEGRAM_TOKEN:
+        logger.critical(MISSING_VARIABLE.format(names='TELEGRAM_TOKEN'))
+        return EXIT_CONFIG
+    try:
+        tenants = load_tenants(TENANTS_FILE)
+    except (OSError, ValueError) as error:
+        logger.critical(FAILURE.format(error=error))
+        return EXIT_CONFIG
+    if not tenants:
+        logger.critical(NO_TENANTS)
+        return EXIT_CONFIG
+    store = StateStore(state_file) if state_file else StateStore()
+    bot = LazyBot()
+    # Соединения с сервером переиспользуются для всех пользователей.
+    transport = LazyTransport()
+    errors = ERRORS.total()
+    code = EXIT_OK
+    total = 0
+    try:
+        for tenant in tenants:
+            tenant.restore(store)
+            try:
+                with cycle(tenant.name):
+                    tenant.timestamp, changes = process_homeworks(
+                        bot, tenant.chat_id, tenant.headers,
+                        tenant.timestamp, tenant.error_cache, transport,
+                        tenant.diff
+                    )
+            except TooManyRequestsError:
+                code = EXIT_TEMPFAIL
+                break
+            total += len(changes)
+            store.save(
+                tenant.name, tenant.timestamp, changes, tenant.error_cache
+            )
+    finally:
+        transport.close()
+        store.close()
+    if code == EXIT_OK and ERRORS.total() > errors:
+        code = EXIT_FAILURE
+    logger.info(ONCE_COMPLETE.format(count=len(tenants), changes=total))
+    return code
+
+
+def parse_args():
+    """Разбор аргументов командной строки."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--once', action='store_true',
+        help='однократная проверка всех пользователей (для cron)'
+    )
+    parser.add_argument(
+        '--backfill', action='store_true',
+        help='загрузка истории работ новых пользователей без оповещений'
+    )
+    parser.add_argument('--state', help='файл состояния SQLite')
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
+    args = parse_args()
+    configure_logging()
+    if args.backfill:
+        from backfill import backfill_new
+
+        sys.exit(backfill_new(args.state))
+    if args.once:
+        sys.exit(check_once(args.state))
     main()
@@ -0,0 +1,150 @@
+"""Настройка журналирования бота.
+
+Записи передаются через очередь (QueueHandler) отдельному потоку
+(QueueListener), поэтому запись на диск не задерживает цикл опроса.
+Файл журнала ротируется по размеру и по времени, старые части
+сжимаются gzip. Повторяющиеся записи уровней DEBUG и INFO
+прореживаются: в каждом окне времени пропускается ограниченное число
+одинаковых записей.
+"""
+
+import atexit
+import gzip
+import logging
+import os
+import queue
+import shutil
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from tracing import span
+
+FORMAT = (
+    '%(asctime)s [%(levelname)s] Log "%(name)s" function "%(funcName)s" '
+    'line %(lineno)d - %(message)s'
+)
+MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+ROTATE_INTERVAL = int(os.getenv('LOG_ROTATE_INTERVAL', 24 * 3600))
+SAMPLE_WINDOW = 60
+SAMPLE_BURST = 5
+SAMPLE_KEYS = 1000
+
+SUPPRESSED = '{message} (пропущено повторов: {count})'
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Файловый обработчик с ротацией по размеру и времени
+    и сжатием старых частей журнала.
+    """
+
+    def __init__(self, filename, max_bytes: int = MAX_BYTES,
+                 backup_count: int = BACKUP_COUNT,
+                 interval: float = ROTATE_INTERVAL, **kwargs):
+        super().__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count, **kwargs
+        )
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def namer(self, name: str) -> str:
+        return name + '.gz'
+
+    def rotator(self, source: str, dest: str) -> None:
+        with open(source, 'rb') as plain, gzip.open(dest, 'wb') as packed:
+            shutil.copyfileobj(plain, packed)
+        os.remove(source)
+
+    def shouldRollover(self, record) -> bool:
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+class LocalQueueHandler(QueueHandler):
+    """Передача записей через очередь внутри процесса.
+
+    Форматирование записи откладывается до потока записи, поскольку
+    запись не сериализуется.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def handle(self, record):
+        with span('log'):
+            return super().handle(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Прореживание повторяющихся записей ниже уровня WARNING.
+
+    В каждом окне window секунд пропускается не более burst записей с
+    одинаковым текстом, о пропущенных сообщается в следующей записи.
+    """
+
+    def __init__(self, window: float = SAMPLE_WINDOW,
+                 burst: int = SAMPLE_BURST, max_keys: int = SAMPLE_KEYS,
+                 clock=time.monotonic):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.counters = {}
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        message = record.getMessage()
+        key = (record.name, record.levelno, message)
+        now = self.clock()
+        started, passed, suppressed = self.counters.get(key, (now, 0, 0))
+        if now - started >= self.window:
+            started, passed = now, 0
+        if passed >= self.burst:
+            self.counters[key] = (started, passed, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = SUPPRESSED.format(message=message, count=suppressed)
+            record.args = None
+        if len(self.counters) >= self.max_keys and key not in self.counters:
+            self.counters.clear()
+        self.counters[key] = (started, passed + 1, 0)
+        return True
+
+
+def setup_logging(logger: logging.Logger, filename: str,
+                  level: int = logging.DEBUG) -> QueueListener:
+    """Подключение к журналу обработчиков через очередь.
+
+    Возвращает запущенный поток записи, который останавливается при
+    завершении программы.
+    """
+    formatter = logging.Formatter(FORMAT)
+    stream_handler = logging.StreamHandler(stream=sys.stdout)
+    file_handler = CompressingRotatingFileHandler(filename)
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter())
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(
+        records, stream_handler, file_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def stop_logging(listener: QueueListener) -> None:
+    """Остановка потока записи до завершения программы."""
+    atexit.unregister(listener.stop)
+    listener.stop()
@@ -0,0 +1,156 @@
+"""Метрики работы бота в текстовом формате Prometheus.
+
+Метрики регистрируются в общем реестре REGISTRY при создании и
+отдаются HTTP-сервером, запускаемым metricsserver.serve_metrics.
+Обновление метрики занимает доли микросекунды; значения датчиков,
+заданных функцией, вычисляются только при запросе метрик.
+"""
+
+import bisect
+import math
+import threading
+
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf
+)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Набор метрик, отдаваемых одним запросом."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric) -> None:
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """Базовый класс метрики с необязательными метками."""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: tuple = (),
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.register(self)
+
+    def samples(self) -> list:
+        with self.lock:
+            values = dict(self.values)
+        return [
+            f'{self.name}{format_labels(self.labels, key)} '
+            f'{format_value(value)}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        """Сумма значений по всем меткам."""
+        with self.lock:
+            return sum(self.values.values())
+
+
+class Gauge(Metric):
+    """Датчик: значение задается явно или функцией."""
+
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.functions = {}
+
+    def set(self, value: float, *labels) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def set_function(self, function, *labels) -> None:
+        """Значение будет вычисляться функцией при запросе метрик."""
+        with self.lock:
+            self.functions[labels] = function
+
+    def samples(self) -> list:
+        with self.lock:
+            functions = dict(self.functions)
+        for labels, function in functions.items():
+            self.set(function(), *labels)
+        return super().samples()
+
+
+class Histogram(Metric):
+    """Гистограмма распределения наблюдаемых величин."""
+
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: tuple = BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * len(self.buckets) + [
+                    0.0, 0
+                ]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> list:
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        samples = []
+        for key, counts in sorted(values.items()):
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                labels = format_labels(
+                    self.labels, key, f'le="{format_value(bound)}"'
+                )
+                samples.append(f'{self.name}_bucket{labels} {total}')
+            labels = format_labels(self.labels, key)
+            samples.append(f'{self.name}_sum{labels} {counts[-2]!r}')
+            samples.append(f'{self.name}_count{labels} {counts[-1]}')
+        return samples
@@ -0,0 +1,97 @@
+"""HTTP-сервер метрик в текстовом формате Prometheus.
+
+Вынесен из модуля metrics, чтобы модули, только обновляющие метрики,
+не загружали http.server.
+
+Кроме метрик сервер отдает отладочные сведения (см. модуль tracing):
+- /debug/traces - трассы самых долгих циклов опроса в формате JSON;
+- /debug/profile?seconds=30 - запуск окна профилирования, в ответе
+  путь к будущему файлу профиля (409, если профилирование уже идет).
+
+Отладочные сведения отдаются только запросам с локального адреса
+(403 для остальных), если не задана переменная среды DEBUG_REMOTE=1:
+сервер метрик слушает все интерфейсы, а профилирование нагружает
+процесс и пишет файлы на диск.
+"""
+
+import ipaddress
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import REGISTRY, Registry
+from tracing import PROFILE_SECONDS, PROFILER, TRACER
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+DEBUG_REMOTE = os.getenv('DEBUG_REMOTE', '0') == '1'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Отдача метрик по запросу GET /metrics и отладочных сведений."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path in ('/', '/metrics'):
+            self.reply(200, self.server.registry.render(), CONTENT_TYPE)
+        elif url.path.startswith('/debug/') and not self.debug_allowed():
+            self.send_error(403)
+        elif url.path == '/debug/traces':
+            self.reply_json(200, [
+                trace.as_dict() for trace in TRACER.traces()
+            ])
+        elif url.path == '/debug/profile':
+            try:
+                seconds = float(parse_qs(url.query).get(
+                    'seconds', [PROFILE_SECONDS]
+                )[0])
+            except ValueError:
+                self.send_error(400)
+                return
+            path = PROFILER.start(seconds)
+            self.reply_json(409 if path is None else 202, {'path': path})
+        else:
+            self.send_error(404)
+
+    def debug_allowed(self) -> bool:
+        """Можно ли отдать клиенту отладочные сведения."""
+        if self.server.debug_remote:
+            return True
+        try:
+            return ipaddress.ip_address(self.client_address[0]).is_loopback
+        except ValueError:
+            return False
+
+    def reply_json(self, code: int, data) -> None:
+        self.reply(code, json.dumps(data, ensure_ascii=False),
+                   JSON_CONTENT_TYPE)
+
+    def reply(self, code: int, text: str, content_type: str) -> None:
+        body = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = '0.0.0.0',
+                  registry: Registry = REGISTRY,
+                  debug_remote: bool = DEBUG_REMOTE) -> ThreadingHTTPServer:
+    """Запуск HTTP-сервера метрик в отдельном потоке.
+
+    Если debug_remote ложно, отладочные сведения отдаются только
+    запросам с локального адреса.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.registry = registry
+    server.debug_remote = debug_remote
+    threading.Thread(
+        target=server.serve_forever, name='metrics', daemon=True
+    ).start()
+    return server
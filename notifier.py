@@ -0,0 +1,329 @@
+"""Очередь исходящих сообщений Telegram.
+
+Сообщения ставятся в очередь без ожидания ответа Telegram и отправляются
+отдельным потоком с ограничением частоты: общим для бота и отдельным
+для каждого чата. Несколько ожидающих сообщений одного чата
+объединяются в одно. При ошибке RetryAfter отправка приостанавливается
+на указанное сервером время.
+
+Все запросы к Bot API проходят через общий предохранитель
+TELEGRAM_BREAKER (см. GuardedRequest): пока Telegram недоступен,
+сообщения остаются в очереди, а сервер получает один пробный запрос
+за интервал восстановления.
+
+Если задано хранилище outbox (storage.StateStore), каждое сообщение
+записывается в него до постановки в очередь и удаляется после доставки;
+при запуске недоставленные сообщения отправляются повторно в исходном
+порядке.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from telegram.utils.request import Request
+
+from breaker import CircuitBreaker
+from metrics import Counter, Histogram
+from ratelimit import TokenBucket
+from tracing import cycle, span
+
+# Ограничения Bot API: около 30 сообщений в секунду на бота
+# и одно сообщение в секунду в отдельный чат.
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+MESSAGE_LIMIT = 4096
+SEPARATOR = '\n\n'
+TELEGRAM_CYCLE = 'telegram {chat_id}'
+NETWORK_RETRY_DELAY = 5
+DRAIN_TIMEOUT = 10
+
+DELIVERED = 'Доставлено сообщений в чат {chat_id}: {count}.'
+DROPPED = 'Сообщение в чат {chat_id} удалено из очереди: {error}'
+REPLAYED = 'Повторная отправка недоставленных сообщений: {count}.'
+SEND_FAIL = 'Не удалось отправить сообщение в чат {chat_id}: {error}'
+CIRCUIT_OPEN = 'Telegram недоступен, следующая попытка через {delay:.0f} с.'
+FLOOD_CONTROL = 'Превышен лимит Telegram, пауза {delay} с.'
+NOTIFIER_STATS = (
+    'В очереди сообщений: {depth}, отправлено: {sent}, '
+    'средняя задержка отправки: {latency:.3f} с.'
+)
+
+SEND_LATENCY = Histogram(
+    'homework_telegram_send_seconds',
+    'Длительность отправки сообщения в Telegram.'
+)
+SEND_FAILURES = Counter(
+    'homework_telegram_failures_total',
+    'Ошибки отправки сообщений в Telegram по классам исключений.',
+    ('error',)
+)
+
+logger = logging.getLogger('homework.notifier')
+
+
+def is_outage(error: Exception) -> bool:
+    """Говорит ли ошибка Bot API о недоступности Telegram."""
+    return (
+        isinstance(error, NetworkError) and not isinstance(error, BadRequest)
+    )
+
+
+TELEGRAM_BREAKER = CircuitBreaker('telegram', is_failure=is_outage)
+
+
+class GuardedRequest(Request):
+    """Соединение с Bot API, защищенное предохранителем."""
+
+    __slots__ = ('breaker',)
+
+    def __init__(self, *args, breaker: CircuitBreaker = TELEGRAM_BREAKER,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breaker = breaker
+
+    def _request_wrapper(self, *args, **kwargs):
+        if not self.breaker.allow():
+            raise NetworkError(CIRCUIT_OPEN.format(
+                delay=self.breaker.retry_in()
+            ))
+        try:
+            result = super()._request_wrapper(*args, **kwargs)
+        except TelegramError as error:
+            self.breaker.record(error)
+            raise
+        self.breaker.success()
+        return result
+
+
+class Notifier:
+    """Асинхронная очередь отправки сообщений через бота Telegram.
+
+    Метод send_message совместим по параметрам с telegram.Bot, поэтому
+    очередь может передаваться в функции модуля homework вместо бота.
+    """
+
+    def __init__(self, bot, rate: float = GLOBAL_RATE,
+                 chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST,
+                 clock=time.monotonic, outbox=None):
+        self.bot = bot
+        self.outbox = outbox
+        self.clock = clock
+        self.bucket = TokenBucket(rate, rate, clock)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.pending = OrderedDict()
+        self.condition = threading.Condition()
+        self.paused_until = 0
+        self.depth = 0
+        self.sent = 0
+        self.latency = 0.0
+        # Чат, сообщения которому отправляются в данный момент.
+        self.delivering = None
+        self.running = False
+        self.thread = None
+
+    def send_message(self, chat_id, text: str) -> None:
+        """Постановка сообщения в очередь."""
+        message_id = None
+        if self.outbox:
+            message_id = self.outbox.enqueue(chat_id, text)
+        self.put(chat_id, text, message_id)
+
+    def put(self, chat_id, text: str, message_id: int = None) -> None:
+        with self.condition:
+            self.pending.setdefault(chat_id, []).append(
+                (text, self.clock(), message_id)
+            )
+            self.depth += 1
+            self.condition.notify()
+
+    def replay(self, chats: set = None) -> None:
+        """Постановка в очередь сообщений, не доставленных до остановки.
+
+        Если задано chats, повторяются только сообщения в эти чаты
+        (например, пользователей, арендованных процессом).
+        """
+        if not self.outbox:
+            return
+        messages = self.outbox.outbox(chats)
+        for message_id, chat_id, text in messages:
+            self.put(chat_id, text, message_id)
+        if messages:
+            logger.warning(REPLAYED.format(count=len(messages)))
+
+    def drop(self, chats: set = None,
+             timeout: float = DRAIN_TIMEOUT) -> list:
+        """Удаление из очереди сообщений в чаты chats (по умолчанию
+        во все чаты), например, пользователей, переданных другому
+        процессу.
+
+        Если сообщение в один из чатов отправляется, отправка
+        дожидается завершения (не дольше timeout). Сообщения остаются
+        в outbox для нового владельца. Возвращает их номера.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.delivering is None or (
+                    chats is not None and self.delivering not in chats
+                ),
+                timeout
+            )
+            dropped = []
+            for chat_id in list(self.pending if chats is None else chats):
+                messages = self.pending.pop(chat_id, ())
+                self.depth -= len(messages)
+                dropped.extend(
+                    message_id for _, _, message_id in messages
+                    if message_id is not None
+                )
+        return dropped
+
+    def acknowledge(self, messages: list) -> None:
+        if self.outbox:
+            self.outbox.ack([
+                message_id for _, _, message_id in messages
+                if message_id is not None
+            ])
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst, self.clock
+            )
+        return self.chat_buckets[chat_id]
+
+    def take(self):
+        """Выбор чата, которому можно отправить сообщение.
+
+        Возвращает чат и объединенные сообщения или время ожидания.
+        """
+        delay = max(self.paused_until - self.clock(), 0)
+        if delay:
+            return None, [], delay
+        delay = self.bucket.delay()
+        if delay:
+            return None, [], delay
+        for chat_id in self.pending:
+            bucket = self.chat_bucket(chat_id)
+            chat_delay = bucket.delay()
+            if chat_delay:
+                delay = min(delay, chat_delay) if delay else chat_delay
+                continue
+            bucket.consume()
+            self.bucket.consume()
+            messages = self.pending.pop(chat_id)
+            size = len(messages[0][0])
+            count = 1
+            while count < len(messages):
+                size += len(SEPARATOR) + len(messages[count][0])
+                if size > MESSAGE_LIMIT:
+                    break
+                count += 1
+            if count < len(messages):
+                self.pending[chat_id] = messages[count:]
+            self.depth -= count
+            return chat_id, messages[:count], 0
+        return None, [], delay
+
+    def requeue(self, chat_id, messages: list, delay: float) -> None:
+        """Возврат неотправленных сообщений в начало очереди чата."""
+        self.pending[chat_id] = messages + self.pending.get(chat_id, [])
+        self.pending.move_to_end(chat_id, last=False)
+        self.depth += len(messages)
+        self.paused_until = max(self.paused_until, self.clock() + delay)
+
+    def deliver(self, chat_id, messages: list) -> None:
+        text = SEPARATOR.join(message for message, _, _ in messages)
+        started = time.perf_counter()
+        try:
+            with cycle(TELEGRAM_CYCLE.format(chat_id=chat_id)), span('send'):
+                self.bot.send_message(chat_id, text)
+        except TelegramError as error:
+            SEND_FAILURES.inc(type(error).__name__)
+            self.fail(chat_id, messages, error)
+            return
+        finally:
+            SEND_LATENCY.observe(time.perf_counter() - started)
+        self.acknowledge(messages)
+        now = self.clock()
+        with self.condition:
+            for _, enqueued, _ in messages:
+                self.sent += 1
+                self.latency += now - enqueued
+        logger.debug(DELIVERED.format(chat_id=chat_id, count=len(messages)))
+
+    def fail(self, chat_id, messages: list, error: TelegramError) -> None:
+        """Обработка ошибки отправки: повтор или отказ."""
+        if isinstance(error, RetryAfter):
+            logger.warning(FLOOD_CONTROL.format(delay=error.retry_after))
+            delay = error.retry_after
+        elif isinstance(error, NetworkError):
+            logger.warning(SEND_FAIL.format(chat_id=chat_id, error=error))
+            delay = NETWORK_RETRY_DELAY
+        else:
+            logger.error(DROPPED.format(chat_id=chat_id, error=error))
+            self.acknowledge(messages)
+            return
+        with self.condition:
+            self.requeue(chat_id, messages, delay)
+
+    def run(self) -> None:
+        """Цикл потока отправки сообщений."""
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                chat_id, messages, delay = self.take()
+                if not messages:
+                    self.condition.wait(delay)
+                    continue
+                self.delivering = chat_id
+            try:
+                self.deliver(chat_id, messages)
+            finally:
+                with self.condition:
+                    self.delivering = None
+                    self.condition.notify_all()
+
+    def start(self, replay: bool = True) -> None:
+        """Запуск потока отправки; если replay истинно, сначала
+        повторяются все недоставленные сообщения из outbox.
+        """
+        if replay:
+            self.replay()
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.run, name='notifier', daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """Остановка после отправки ожидающих сообщений."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def idle(self) -> bool:
+        """Нет ни ожидающих, ни отправляемых сообщений."""
+        with self.condition:
+            return not self.pending and self.delivering is None
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                'depth': self.depth,
+                'sent': self.sent,
+                'latency': self.latency / self.sent if self.sent else 0,
+            }
+
+    def __str__(self):
+        return NOTIFIER_STATS.format(**self.stats())
@@ -0,0 +1,148 @@
+"""Ограничение частоты запросов к внешним сервисам."""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+PRACTICUM_RATE = float(os.getenv('PRACTICUM_RATE', 10))
+PRACTICUM_BURST = float(os.getenv('PRACTICUM_BURST', 20))
+# После ответа 429 частота снижается вдвое, затем за каждый
+# разрешенный запрос восстанавливается на RECOVERY от заданной.
+DECREASE = 0.5
+RECOVERY = 0.01
+MIN_RATE_SHARE = 0.05
+
+
+class TokenBucket:
+    """Маркерная корзина: не более rate операций в секунду в среднем
+    и не более burst операций подряд.
+
+    Не потокобезопасна: синхронизация остается за вызывающим кодом.
+    """
+
+    def __init__(self, rate: float, burst: float = 1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def delay(self, tokens: float = 1) -> float:
+        """Время ожидания до появления нужного числа маркеров."""
+        self.refill()
+        return max(tokens - self.tokens, 0) / self.rate
+
+    def consume(self, tokens: float = 1) -> bool:
+        """Попытка забрать маркеры; False, если их недостаточно."""
+        self.refill()
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class FairLimiter:
+    """Общее ограничение частоты запросов с честной очередью.
+
+    Разрешения выдаются не чаще rate в секунду (подряд - не более burst)
+    по кругу между ключами ожидающих (пользователями), поэтому частые
+    запросы одного ключа не задерживают остальных. Сигнал сервера
+    об ограничении частоты (throttle) приостанавливает выдачу разрешений
+    всем ключам и временно снижает частоту.
+
+    Используется внутри одного цикла событий asyncio, часы которого
+    служат часами корзины.
+    """
+
+    def __init__(self, rate: float = PRACTICUM_RATE,
+                 burst: float = PRACTICUM_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate * MIN_RATE_SHARE
+        self.bucket = None
+        self.queues = OrderedDict()
+        self.paused_until = 0
+        self.throttled = 0
+        self.wakeup = None
+        self.dispatcher = None
+
+    @property
+    def current_rate(self) -> float:
+        return self.bucket.rate if self.bucket else self.rate
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self.queues.values())
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.bucket = TokenBucket(self.rate, self.burst, loop.time)
+        self.wakeup = asyncio.Event()
+        self.dispatcher = loop.create_task(self.dispatch())
+
+    def stop(self) -> None:
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+
+    async def acquire(self, key) -> None:
+        """Ожидание разрешения на запрос от имени ключа key."""
+        if self.dispatcher is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(key, deque()).append(future)
+        self.wakeup.set()
+        await future
+
+    def throttle(self, delay: float) -> None:
+        """Пауза в выдаче разрешений по сигналу сервера."""
+        if self.bucket is None:
+            return
+        now = self.bucket.clock()
+        self.paused_until = max(self.paused_until, now + delay)
+        self.throttled += 1
+        self.bucket.refill()
+        self.bucket.rate = max(self.bucket.rate * DECREASE, self.min_rate)
+        self.bucket.tokens = min(self.bucket.tokens, 0)
+        self.wakeup.set()
+
+    def grant(self) -> None:
+        """Выдача разрешения первому ожидающему очередного ключа."""
+        key, waiters = next(iter(self.queues.items()))
+        future = waiters.popleft()
+        if waiters:
+            self.queues.move_to_end(key)
+        else:
+            del self.queues[key]
+        if future.done():
+            return
+        self.bucket.consume()
+        self.bucket.rate = min(
+            self.bucket.rate + self.rate * RECOVERY, self.rate
+        )
+        future.set_result(None)
+
+    async def dispatch(self) -> None:
+        while True:
+            self.wakeup.clear()
+            if not self.queues:
+                await self.wakeup.wait()
+                continue
+            delay = max(
+                self.paused_until - self.bucket.clock(), self.bucket.delay()
+            )
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.grant()
@@ -0,0 +1,303 @@
+"""Выбор момента очередного опроса сервера домашних работ.
+
+Моменты опроса отсчитываются по монотонным часам от запланированного,
+а не фактического времени предыдущего цикла, поэтому длительность
+запросов не накапливается в виде сдвига расписания.
+
+Интервал опроса зависит от последнего известного статуса работы и числа
+опросов подряд, не принесших изменений: пока работа на проверке, сервер
+опрашивается часто, после одобрения работы или при отсутствии
+сданных работ интервал растет экспоненциально до заданного предела.
+Случайный разброс не дает пользователям опрашивать сервер синхронно.
+
+Сроки опроса множества пользователей хранит иерархическое колесо
+таймеров TimingWheel: добавление, отмена и перенос срока выполняются
+за O(1) независимо от числа таймеров.
+"""
+
+import math
+import random
+import time
+from collections import deque
+
+# Минимальный и максимальный интервалы опроса в секундах для статуса
+# последней работы. None - сведений о работах еще нет.
+INTERVALS = {
+    'reviewing': (60, 300),
+    'rejected': (300, 3600),
+    'approved': (600, 3 * 3600),
+    None: (600, 3600),
+}
+BACKOFF = 2
+JITTER = 0.1
+# Поведение при опоздании цикла больше чем на интервал: пропустить
+# опоздавшие запуски или выполнить их подряд без ожидания.
+SKIP = 'skip'
+CATCH_UP = 'catch-up'
+LATENESS_HISTORY = 100
+# Шаг колеса таймеров в секундах и число ячеек на каждом уровне:
+# 25,6 с, 27 мин, 29 ч и 77 суток при шаге 0,1 с.
+WHEEL_TICK = 0.1
+WHEEL_SLOTS = (256, 64, 64, 64)
+READY = (-1, None)
+OVERFLOW = (-2, None)
+
+
+class AdaptivePolicy:
+    """Политика выбора интервала опроса по статусу домашней работы."""
+
+    def __init__(self, intervals: dict = None, backoff: float = BACKOFF,
+                 jitter: float = JITTER, rng: random.Random = None):
+        self.intervals = intervals or INTERVALS
+        self.backoff = backoff
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def interval(self, status: str = None, quiet: int = 0) -> float:
+        """Интервал до следующего опроса.
+
+        status - последний известный статус работы,
+        quiet - число опросов подряд без изменения статуса.
+        """
+        low, high = self.intervals.get(status, self.intervals[None])
+        # Степень ограничена шагом, на котором интервал достигает
+        # предела: иначе при длинной серии опросов без изменений
+        # backoff ** quiet переполняет float.
+        if self.backoff > 1 and high > low:
+            quiet = min(quiet, math.ceil(math.log(high / low, self.backoff)))
+        interval = min(low * self.backoff ** quiet, high)
+        return interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class VirtualClock:
+    """Виртуальные часы для моделирования расписания без ожидания."""
+
+    def __init__(self, start: float = 0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, delay: float) -> None:
+        self.now += max(delay, 0)
+
+
+class Lateness:
+    """Статистика опозданий запуска циклов относительно расписания."""
+
+    def __init__(self, history: int = LATENESS_HISTORY):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=history)
+
+    def add(self, lateness: float) -> None:
+        self.count += 1
+        self.total += lateness
+        self.max = max(self.max, lateness)
+        self.recent.append(lateness)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+
+class CycleScheduler:
+    """Запуск циклов с постоянной частотой по монотонным часам.
+
+    clock и sleep можно заменить, например, на VirtualClock, чтобы
+    моделировать работу бота без реального ожидания.
+    """
+
+    def __init__(self, interval: float, overrun: str = SKIP,
+                 clock=time.monotonic, sleep=time.sleep):
+        if overrun not in (SKIP, CATCH_UP):
+            raise ValueError(f'Неизвестная политика опозданий: {overrun}')
+        self.interval = interval
+        self.overrun = overrun
+        self.clock = clock
+        self.sleep = sleep
+        self.lateness = Lateness()
+        self.skipped = 0
+
+    def next_run(self, planned: float, now: float) -> float:
+        """Момент следующего запуска после цикла, запланированного
+        на planned и завершившегося в now.
+        """
+        planned += self.interval
+        if now > planned and self.overrun == SKIP:
+            missed = math.ceil((now - planned) / self.interval)
+            self.skipped += missed
+            planned += missed * self.interval
+        return planned
+
+    def run(self, cycle, cycles: int = None) -> None:
+        """Выполнение cycle заданное число раз или бесконечно."""
+        planned = self.clock()
+        done = 0
+        while cycles is None or done < cycles:
+            self.lateness.add(max(self.clock() - planned, 0))
+            cycle()
+            done += 1
+            planned = self.next_run(planned, self.clock())
+            self.sleep(max(planned - self.clock(), 0))
+
+
+class TimingWheel:
+    """Иерархическое колесо таймеров.
+
+    Уровень 0 делится на ячейки по одному шагу tick, каждая ячейка
+    следующего уровня охватывает весь предыдущий уровень. Таймер
+    помещается на самый нижний уровень, в пределах которого находится
+    его срок, и при наступлении периода его ячейки переносится на
+    уровень ниже. Ячейка - словарь {ключ: срок}, положение каждого
+    ключа запоминается, поэтому отмена и перенос срока выполняются
+    за O(1). Сроки округляются вверх до шага колеса: таймер никогда не
+    срабатывает раньше срока, а таймеры одного шага выдаются одной
+    пачкой.
+    """
+
+    def __init__(self, tick: float = WHEEL_TICK, slots: tuple = WHEEL_SLOTS,
+                 start: float = 0):
+        self.tick = tick
+        self.sizes = slots
+        self.granularity = [math.prod(slots[:level]) for level in
+                            range(len(slots))]
+        self.span = self.granularity[-1] * slots[-1]
+        self.levels = [[{} for _ in range(size)] for size in slots]
+        self.counts = [0] * len(slots)
+        self.timers = {}
+        self.ready = {}
+        self.overflow = {}
+        self.now = start
+        self.ticks = self.tick_of(start)
+
+    def tick_of(self, moment: float) -> int:
+        """Номер последнего шага, наступившего к моменту moment.
+
+        Согласован с next_deadline: к моменту tick * self.tick шаг tick
+        считается наступившим, несмотря на ошибки округления.
+        """
+        tick = math.floor(moment / self.tick)
+        if (tick + 1) * self.tick <= moment:
+            tick += 1
+        return tick
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def insert(self, key, deadline: float, due: int, reference: int) -> None:
+        for level, size in enumerate(self.sizes):
+            granularity = self.granularity[level]
+            if due // granularity - reference // granularity < size:
+                slot = due // granularity % size
+                self.levels[level][slot][key] = (deadline, due)
+                self.counts[level] += 1
+                self.timers[key] = (level, slot)
+                return
+        self.overflow[key] = (deadline, due)
+        self.timers[key] = OVERFLOW
+
+    def schedule(self, key, deadline: float) -> None:
+        """Назначение или перенос срока таймера key."""
+        self.cancel(key)
+        if deadline <= self.now:
+            self.ready[key] = deadline
+            self.timers[key] = READY
+            return
+        due = max(math.ceil(deadline / self.tick), self.ticks + 1)
+        self.insert(key, deadline, due, self.ticks + 1)
+
+    def cancel(self, key) -> bool:
+        """Отмена таймера; False, если таймера нет."""
+        location = self.timers.pop(key, None)
+        if location is None:
+            return False
+        level, slot = location
+        if location is READY:
+            del self.ready[key]
+        elif location is OVERFLOW:
+            del self.overflow[key]
+        else:
+            del self.levels[level][slot][key]
+            self.counts[level] -= 1
+        return True
+
+    def next_tick(self):
+        """Ближайший шаг, на котором нужно проверить колесо, или None."""
+        candidate = None
+        if self.counts[0]:
+            size = self.sizes[0]
+            for tick in range(self.ticks + 1, self.ticks + size + 1):
+                if self.levels[0][tick % size]:
+                    candidate = tick
+                    break
+        for level in range(1, len(self.sizes)):
+            if self.counts[level]:
+                granularity = self.granularity[level]
+                boundary = (self.ticks // granularity + 1) * granularity
+                if candidate is None or boundary < candidate:
+                    candidate = boundary
+        if self.overflow:
+            boundary = (self.ticks // self.span + 1) * self.span
+            if candidate is None or boundary < candidate:
+                candidate = boundary
+        return candidate
+
+    def next_deadline(self):
+        """Время ближайшей проверки колеса или None, если таймеров нет."""
+        if self.ready:
+            return self.now
+        tick = self.next_tick()
+        return None if tick is None else tick * self.tick
+
+    def cascade(self, tick: int) -> None:
+        """Перенос таймеров наступивших периодов на нижние уровни."""
+        for level in range(1, len(self.sizes)):
+            granularity = self.granularity[level]
+            if tick % granularity:
+                return
+            slot = tick // granularity % self.sizes[level]
+            timers = self.levels[level][slot]
+            if not timers:
+                continue
+            self.levels[level][slot] = {}
+            self.counts[level] -= len(timers)
+            for key, (deadline, due) in timers.items():
+                self.insert(key, deadline, due, tick)
+        if tick % self.span == 0 and self.overflow:
+            timers, self.overflow = self.overflow, {}
+            for key, (deadline, due) in timers.items():
+                self.insert(key, deadline, due, tick)
+
+    def advance(self, now: float) -> list:
+        """Перевод колеса к моменту now.
+
+        Возвращает ключи сработавших таймеров в порядке сроков с
+        точностью до шага колеса; сработавшие таймеры удаляются.
+        """
+        self.now = max(self.now, now)
+        due = list(self.ready)
+        for key in due:
+            del self.timers[key]
+        self.ready = {}
+        target = self.tick_of(self.now)
+        size = self.sizes[0]
+        while self.ticks < target:
+            tick = self.next_tick()
+            if tick is None or tick > target:
+                self.ticks = target
+                break
+            self.ticks = tick
+            self.cascade(tick)
+            timers = self.levels[0][tick % size]
+            if timers:
+                self.levels[0][tick % size] = {}
+                self.counts[0] -= len(timers)
+                for key in timers:
+                    del self.timers[key]
+                due.extend(timers)
+        return due
@@ -0,0 +1,165 @@
+"""Распределение пользователей между процессами движка.
+
+Каждый процесс (worker) регулярно отмечается в общей базе SQLite и по
+списку живых процессов строит кольцо согласованного хеширования
+HashRing. Пользователь опрашивается только процессом, которому он
+принадлежит по кольцу и который держит аренду (lease) на него. Аренда
+продлевается при каждой синхронизации; аренда остановившегося процесса
+истекает через LEASE_TTL секунд, после чего пользователя забирает новый
+владелец. При добавлении процесса прежний владелец сам освобождает
+аренду, поэтому пользователи переходят к новому процессу за одну
+синхронизацию, а одно оповещение не отправляется дважды.
+"""
+
+import bisect
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+
+from storage import STATE_FILE
+
+SHARDING = os.getenv('SHARDING', '0') == '1'
+WORKER_ID = os.getenv(
+    'WORKER_ID', '{}-{}'.format(socket.gethostname(), os.getpid())
+)
+LEASE_TTL = float(os.getenv('LEASE_TTL', 30))
+LEASE_INTERVAL = float(os.getenv('LEASE_INTERVAL', 10))
+REPLICAS = 64
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    tenant TEXT PRIMARY KEY,
+    worker TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+'''
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big'
+    )
+
+
+class HashRing:
+    """Кольцо согласованного хеширования с виртуальными узлами.
+
+    При добавлении или удалении участника меняют владельца только
+    ключи, принадлежавшие ему, - в среднем 1/N всех ключей.
+    """
+
+    def __init__(self, members, replicas: int = REPLICAS):
+        points = sorted(
+            (ring_hash(f'{member}#{replica}'), member)
+            for member in members for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.members = [member for _, member in points]
+
+    def owner(self, key: str):
+        if not self.hashes:
+            return None
+        index = bisect.bisect(self.hashes, ring_hash(key))
+        return self.members[index % len(self.members)]
+
+
+class Shard:
+    """Аренда пользователей одним процессом через общую базу SQLite."""
+
+    def __init__(self, path: str = STATE_FILE, worker: str = WORKER_ID,
+                 ttl: float = LEASE_TTL, clock=time.time):
+        self.worker = worker
+        self.ttl = ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(
+            path, timeout=ttl, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def members(self) -> list:
+        """Отметка процесса и список живых процессов."""
+        now = self.clock()
+        with self.transaction():
+            self.connection.execute(
+                'INSERT INTO workers VALUES (?, ?) ON CONFLICT(worker) '
+                'DO UPDATE SET heartbeat = excluded.heartbeat',
+                (self.worker, now)
+            )
+            self.connection.execute(
+                'DELETE FROM workers WHERE heartbeat < ?', (now - self.ttl,)
+            )
+            rows = self.connection.execute(
+                'SELECT worker FROM workers'
+            ).fetchall()
+        return [worker for worker, in rows]
+
+    def assigned(self, names) -> set:
+        """Пользователи, принадлежащие процессу по кольцу."""
+        ring = HashRing(self.members())
+        return {name for name in names if ring.owner(name) == self.worker}
+
+    def acquire(self, wanted, released=()) -> set:
+        """Освобождение аренды released, продление собственной аренды
+        и захват свободной или истекшей аренды wanted.
+
+        Возвращает всех пользователей, арендованных процессом.
+        """
+        now = self.clock()
+        with self.transaction():
+            self.connection.executemany(
+                'DELETE FROM leases WHERE tenant = ? AND worker = ?',
+                [(name, self.worker) for name in released]
+            )
+            self.connection.execute(
+                'UPDATE leases SET expires = ? WHERE worker = ?',
+                (now + self.ttl, self.worker)
+            )
+            self.connection.executemany(
+                'INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(tenant) '
+                'DO UPDATE SET worker = excluded.worker, '
+                'expires = excluded.expires WHERE leases.expires < ?',
+                [(name, self.worker, now + self.ttl, now) for name in wanted]
+            )
+            rows = self.connection.execute(
+                'SELECT tenant FROM leases WHERE worker = ?', (self.worker,)
+            ).fetchall()
+        return {name for name, in rows}
+
+    def leave(self) -> None:
+        """Освобождение всей аренды при остановке процесса."""
+        with self.transaction():
+            self.connection.execute(
+                'DELETE FROM leases WHERE worker = ?', (self.worker,)
+            )
+            self.connection.execute(
+                'DELETE FROM workers WHERE worker = ?', (self.worker,)
+            )
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class Transaction:
+    """Транзакция с блокировкой записи с самого начала (BEGIN IMMEDIATE),
+    чтобы процессы не получали одну аренду одновременно.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, error_type, error, traceback):
+        self.connection.execute('ROLLBACK' if error_type else 'COMMIT')
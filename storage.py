@@ -0,0 +1,276 @@
+"""Постоянное хранилище состояния бота в базе SQLite.
+
+Для каждого пользователя хранятся метка времени current_date последнего
+успешного ответа сервера, последние известные статусы домашних работ и
+ключи уже отправленных сообщений об ошибках. Изменения накапливаются в
+памяти и записываются в базу одной транзакцией при вызове flush.
+Включение и отключение оповещений пользователем (команда /subscribe)
+записывается сразу.
+
+Кроме того, хранилище служит очередью исходящих сообщений (outbox):
+сообщение записывается до отправки и удаляется после подтверждения
+доставки. Новые сообщения попадают в базу той же транзакцией, что и
+статусы работ, о которых они сообщают, поэтому после сбоя оповещение не
+теряется: недоставленные сообщения отправляются повторно при запуске.
+Номера строк очереди назначает SQLite при записи, поэтому одну базу
+могут использовать несколько процессов (см. модуль sharding); до записи
+сообщение известно процессу по собственному номеру.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+
+STATE_FILE = os.getenv('STATE_FILE', 'state.sqlite3')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS watermarks (
+    tenant TEXT PRIMARY KEY,
+    watermark INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS statuses (
+    tenant TEXT NOT NULL,
+    homework_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    date_updated TEXT,
+    PRIMARY KEY (tenant, homework_id)
+);
+CREATE TABLE IF NOT EXISTS errors (
+    tenant TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (tenant, key)
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    tenant TEXT PRIMARY KEY,
+    subscribed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    chat_id NOT NULL,
+    text TEXT NOT NULL
+);
+'''
+
+
+class StateStore:
+    """Хранилище состояния пользователей с пакетной записью.
+
+    Методы безопасны для вызова из нескольких потоков.
+    """
+
+    def __init__(self, path: str = STATE_FILE):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.watermarks = {}
+        self.statuses = {}
+        self.errors = {}
+        self.outgoing = {}
+        self.acked = set()
+        # Номера сообщений процесса и номера их строк в базе.
+        self.message_ids = itertools.count(1)
+        self.rowids = {}
+
+    def watermark(self, tenant: str, default: int = None) -> int:
+        """Метка времени, с которой нужно продолжить опрос."""
+        with self.lock:
+            if tenant in self.watermarks:
+                return self.watermarks[tenant]
+            row = self.connection.execute(
+                'SELECT watermark FROM watermarks WHERE tenant = ?',
+                (tenant,)
+            ).fetchone()
+        return default if row is None else row[0]
+
+    def homework_statuses(self, tenant: str) -> dict:
+        """Последние известные статусы работ: {id: (статус, дата)}."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT homework_id, status, date_updated FROM statuses '
+                'WHERE tenant = ?', (tenant,)
+            ).fetchall()
+            statuses = {
+                homework_id: (status, date_updated)
+                for homework_id, status, date_updated in rows
+            }
+            statuses.update({
+                homework_id: value
+                for (owner, homework_id), value in self.statuses.items()
+                if owner == tenant
+            })
+        return statuses
+
+    def last_status(self, tenant: str):
+        """Статус последней по дате обновления работы или None."""
+        statuses = self.homework_statuses(tenant)
+        if not statuses:
+            return None
+        status, _ = max(statuses.values(), key=lambda item: item[1] or '')
+        return status
+
+    def error_keys(self, tenant: str) -> set:
+        """Ключи сообщений об ошибках, уже отправленных пользователю."""
+        with self.lock:
+            if tenant in self.errors:
+                return set(self.errors[tenant])
+            rows = self.connection.execute(
+                'SELECT key FROM errors WHERE tenant = ?', (tenant,)
+            ).fetchall()
+        return {key for key, in rows}
+
+    def subscribed(self, tenant: str, default: bool = True) -> bool:
+        """Включены ли оповещения пользователя."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT subscribed FROM subscriptions WHERE tenant = ?',
+                (tenant,)
+            ).fetchone()
+        return default if row is None else bool(row[0])
+
+    def subscriptions(self) -> dict:
+        """Выбор оповещений всех пользователей: {пользователь: bool}."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT tenant, subscribed FROM subscriptions'
+            ).fetchall()
+        return {tenant: bool(subscribed) for tenant, subscribed in rows}
+
+    def subscribe(self, tenant: str, subscribed: bool) -> None:
+        """Запись включения или отключения оповещений пользователя."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO subscriptions VALUES (?, ?)',
+                (tenant, int(subscribed))
+            )
+
+    def save(self, tenant: str, current_date: int,
+             homeworks: list = (), error_keys: set = None) -> None:
+        """Запоминание результатов цикла опроса до записи в базу."""
+        with self.lock:
+            self.watermarks[tenant] = current_date
+            self.remember(tenant, homeworks)
+            if error_keys is not None:
+                self.errors[tenant] = frozenset(error_keys)
+
+    def seed(self, tenant: str, homeworks: list) -> None:
+        """Запоминание статусов работ без изменения метки времени."""
+        with self.lock:
+            self.remember(tenant, homeworks)
+
+    def remember(self, tenant: str, homeworks: list) -> None:
+        for homework in homeworks:
+            if 'id' in homework and 'status' in homework:
+                self.statuses[tenant, homework['id']] = (
+                    homework['status'], homework.get('date_updated')
+                )
+
+    def enqueue(self, chat_id, text: str) -> int:
+        """Запись сообщения в очередь исходящих до его отправки.
+
+        Возвращает номер сообщения для подтверждения доставки.
+        """
+        with self.lock:
+            message_id = next(self.message_ids)
+            self.outgoing[message_id] = (chat_id, text)
+            return message_id
+
+    def ack(self, message_ids) -> None:
+        """Удаление доставленных сообщений из очереди исходящих."""
+        with self.lock:
+            for message_id in message_ids:
+                if self.outgoing.pop(message_id, None) is None:
+                    rowid = self.rowids.pop(message_id, None)
+                    if rowid is not None:
+                        self.acked.add(rowid)
+
+    def forget(self, message_ids) -> None:
+        """Передача записанных сообщений другому процессу: строки
+        остаются в очереди исходящих, но процесс больше не считает
+        их своими и может вернуть их из outbox снова.
+        """
+        with self.lock:
+            for message_id in message_ids:
+                self.rowids.pop(message_id, None)
+
+    def outbox(self, chats: set = None) -> list:
+        """Недоставленные сообщения [(номер, чат, текст)] в порядке
+        постановки в очередь.
+
+        Возвращаются только сообщения, записанные другими процессами
+        или до перезапуска и еще не возвращенные этим хранилищем;
+        если задано chats - только сообщения в эти чаты.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT id, chat_id, text FROM outbox ORDER BY id'
+            ).fetchall()
+            known = set(self.rowids.values()) | self.acked
+            messages = []
+            for rowid, chat_id, text in rows:
+                if rowid in known:
+                    continue
+                if chats is not None and chat_id not in chats:
+                    continue
+                message_id = next(self.message_ids)
+                self.rowids[message_id] = rowid
+                messages.append((message_id, chat_id, text))
+        return messages
+
+    def flush(self) -> None:
+        """Запись накопленных изменений одной транзакцией.
+
+        Буферы очищаются только после успешной записи: если транзакция
+        не удалась, изменения остаются в памяти до следующего вызова.
+        """
+        with self.lock:
+            if not (self.watermarks or self.statuses or self.errors
+                    or self.outgoing or self.acked):
+                return
+            rowids = {}
+            with self.connection:
+                for message_id, (chat_id, text) in self.outgoing.items():
+                    rowids[message_id] = self.connection.execute(
+                        'INSERT INTO outbox (chat_id, text) VALUES (?, ?)',
+                        (chat_id, text)
+                    ).lastrowid
+                self.connection.executemany(
+                    'DELETE FROM outbox WHERE id = ?',
+                    [(message_id,) for message_id in self.acked]
+                )
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO watermarks VALUES (?, ?)',
+                    self.watermarks.items()
+                )
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO statuses VALUES (?, ?, ?, ?)',
+                    [
+                        (tenant, homework_id, status, date_updated)
+                        for (tenant, homework_id), (status, date_updated)
+                        in self.statuses.items()
+                    ]
+                )
+                self.connection.executemany(
+                    'DELETE FROM errors WHERE tenant = ?',
+                    [(tenant,) for tenant in self.errors]
+                )
+                self.connection.executemany(
+                    'INSERT INTO errors VALUES (?, ?)',
+                    [
+                        (tenant, key)
+                        for tenant, keys in self.errors.items()
+                        for key in keys
+                    ]
+                )
+            self.rowids.update(rowids)
+            self.watermarks = {}
+            self.statuses = {}
+            self.errors = {}
+            self.outgoing = {}
+            self.acked = set()
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
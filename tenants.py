@@ -0,0 +1,91 @@
+"""Пользователи бота: пары токен Практикума / чат Telegram."""
+
+import json
+import os
+import time
+
+import homework
+from diff import STATUS_CODES, StatusDiff
+from errorcache import ErrorCache
+
+TENANTS_FILE = os.getenv('TENANTS_FILE')
+
+NO_TENANTS = 'Не задан ни один пользователь бота.'
+BAD_TENANT = 'Неверное описание пользователя №{index}: {error}'
+
+
+class Tenant:
+    """Пользователь бота: токен Практикума и чат для оповещений.
+
+    Запись хранится в слотах без словаря атрибутов: при сотнях тысяч
+    пользователей это заметная доля памяти процесса. Заголовки запроса
+    строятся при обращении, статус последней работы хранится кодом
+    STATUS_CODES.
+    """
+
+    __slots__ = (
+        'practicum_token', 'chat_id', 'name', 'timestamp', 'error_cache',
+        'status_code', 'quiet', 'deadline', 'diff', 'subscribed'
+    )
+
+    def __init__(self, practicum_token: str, chat_id, name: str = None):
+        self.practicum_token = practicum_token
+        self.chat_id = chat_id
+        self.name = name or str(chat_id)
+        self.timestamp = int(time.time())
+        self.error_cache = ErrorCache()
+        self.status_code = 0
+        self.quiet = 0
+        self.deadline = None
+        self.diff = StatusDiff()
+        self.subscribed = True
+
+    @property
+    def headers(self) -> dict:
+        return homework.make_headers(self.practicum_token)
+
+    @property
+    def status(self):
+        """Статус последней работы или None."""
+        return STATUS_CODES.name(self.status_code)
+
+    @status.setter
+    def status(self, status) -> None:
+        self.status_code = STATUS_CODES.code(status)
+
+    def restore(self, store) -> None:
+        """Восстановление состояния из хранилища storage.StateStore."""
+        self.timestamp = store.watermark(self.name, self.timestamp)
+        self.error_cache = ErrorCache(store.error_keys(self.name))
+        self.status = store.last_status(self.name)
+        self.diff = StatusDiff(store.homework_statuses(self.name))
+        self.subscribed = store.subscribed(self.name, self.subscribed)
+
+    def __repr__(self):
+        return f'Tenant({self.name!r})'
+
+
+def load_tenants(path: str = None) -> list:
+    """Загрузка списка пользователей.
+
+    Список читается из JSON-файла вида
+    ``[{"practicum_token": "...", "chat_id": 123, "name": "..."}]``.
+    Если файл не задан, используется единственный пользователь из
+    переменных среды PRACTICUM_TOKEN и TELEGRAM_CHAT_ID.
+    """
+    if path is None:
+        if not (homework.PRACTICUM_TOKEN and homework.TELEGRAM_CHAT_ID):
+            return []
+        return [Tenant(homework.PRACTICUM_TOKEN, homework.TELEGRAM_CHAT_ID)]
+    with open(path, encoding='utf-8') as file:
+        records = json.load(file)
+    tenants = []
+    for index, record in enumerate(records, start=1):
+        try:
+            tenants.append(Tenant(
+                record['practicum_token'], record['chat_id'],
+                record.get('name')
+            ))
+        except (KeyError, TypeError) as error:
+            raise ValueError(BAD_TENANT.format(index=index, error=error))
+    return tenants
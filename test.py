@@ -1,6 +1,40 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import main, mock, TestCase
 
+from telegram import Bot
+from telegram.error import NetworkError, RetryAfter
+
+import backfill
+import breaker
+import cassette
+import commands
+import debugserver
+import debugtelegram
+import decoder
+import diff
+import engine
+import errorcache
+import exceptions
 import homework
+import logs
+import metrics
+import metricsserver
+import notifier
+import ratelimit
+import schedule
+import sharding
+import storage
+import tracing
+import transport
 
 SAMPLE_NO_HOMEWORKS = '''{
    "current_date":1581604970
@@ -115,5 +149,1313 @@ class TestRequest(TestCase):
         pass
 
 
+class FakeBot:
+    """Бот, запоминающий отправленные сообщения."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+class TestEngine(TestCase):
+    """Проверка многопользовательского движка опроса."""
+
+    def test_all_tenants_polled(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(5)]
+        bot = FakeBot()
+        runner = engine.Engine(bot, tenants, concurrency=2)
+        with mock.patch(
+            'homework.fetch_api_answer',
+            return_value=json.loads(SAMPLE_HOMEWORK)
+        ):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(runner.run(), 0.5))
+        self.assertEqual(
+            sorted(chat_id for chat_id, _ in bot.sent), list(range(5))
+        )
+        for tenant in tenants:
+            self.assertEqual(tenant.timestamp, 1581604970)
+            self.assertEqual(tenant.status, 'rejected')
+
+    def test_poll_failure_keeps_worker(self):
+        tenants = [engine.Tenant('token', 0)]
+        policy = schedule.AdaptivePolicy(
+            intervals={None: (0.05, 0.05)}, jitter=0
+        )
+        runner = engine.Engine(FakeBot(), tenants, concurrency=1,
+                               policy=policy)
+        with mock.patch(
+            'homework.process_homeworks',
+            side_effect=[RuntimeError('сбой')] + [(0, [])] * 100
+        ) as process:
+            with self.assertLogs('homework.engine', 'ERROR'):
+                with self.assertRaises(asyncio.TimeoutError):
+                    asyncio.run(asyncio.wait_for(runner.run(), 0.5))
+        self.assertGreater(process.call_count, 1)
+
+
+class TestAdaptivePolicy(TestCase):
+    """Проверка выбора интервала опроса."""
+
+    def setUp(self):
+        self.policy = schedule.AdaptivePolicy(jitter=0)
+
+    def test_reviewing_polled_faster(self):
+        self.assertLess(
+            self.policy.interval('reviewing'),
+            self.policy.interval('approved')
+        )
+
+    def test_backoff_limited(self):
+        intervals = [self.policy.interval('approved', n) for n in range(10)]
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], schedule.INTERVALS['approved'][1])
+        policy = schedule.AdaptivePolicy(backoff=1.5, jitter=0)
+        self.assertEqual(
+            policy.interval(None, 100000), schedule.INTERVALS[None][1]
+        )
+
+    def test_unknown_status(self):
+        self.assertEqual(
+            self.policy.interval('undefined status'),
+            self.policy.interval(None)
+        )
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Обработчик, сохраняющий соединение между запросами."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = SAMPLE_HOMEWORK.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransport(TestCase):
+    """Проверка переиспользования соединений транспортом."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        http = transport.Transport(pool_size=1)
+        with mock.patch('homework.ENDPOINT', self.url):
+            for _ in range(5):
+                answer = homework.fetch_api_answer({}, 0, http)
+        http.close()
+        self.assertEqual(answer['current_date'], 1581604970)
+        self.assertEqual(http.stats.requests, 5)
+        self.assertEqual(http.stats.connections, 1)
+
+
+class TestCycleScheduler(TestCase):
+    """Проверка расписания циклов с постоянной частотой."""
+
+    def run_cycles(self, overrun, durations):
+        clock = schedule.VirtualClock()
+        scheduler = schedule.CycleScheduler(
+            10, overrun, clock=clock, sleep=clock.sleep
+        )
+        starts = []
+        durations = iter(durations)
+
+        def cycle():
+            starts.append(clock())
+            clock.sleep(next(durations))
+
+        scheduler.run(cycle, cycles=4)
+        return starts, scheduler
+
+    def test_no_drift(self):
+        starts, scheduler = self.run_cycles(schedule.SKIP, [3, 3, 3, 3])
+        self.assertEqual(starts, [0, 10, 20, 30])
+        self.assertEqual(scheduler.lateness.max, 0)
+
+    def test_overrun_policies(self):
+        starts, scheduler = self.run_cycles(schedule.SKIP, [25, 1, 1, 1])
+        self.assertEqual(starts, [0, 30, 40, 50])
+        self.assertEqual(scheduler.skipped, 2)
+        starts, scheduler = self.run_cycles(schedule.CATCH_UP, [25, 1, 1, 1])
+        self.assertEqual(starts, [0, 25, 26, 30])
+        self.assertEqual(scheduler.lateness.max, 15)
+
+
+class TestTimingWheel(TestCase):
+    """Проверка колеса таймеров."""
+
+    def test_due_batches(self):
+        wheel = schedule.TimingWheel(tick=1)
+        wheel.schedule('a', 5)
+        wheel.schedule('b', 3)
+        wheel.schedule('c', 3.5)
+        wheel.schedule('d', 0)
+        self.assertEqual(wheel.next_deadline(), 0)
+        self.assertEqual(wheel.advance(0), ['d'])
+        self.assertEqual(wheel.next_deadline(), 3)
+        self.assertEqual(wheel.advance(3.2), ['b'])
+        self.assertEqual(wheel.advance(10), ['c', 'a'])
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.next_deadline())
+
+    def test_cancel_and_reschedule(self):
+        wheel = schedule.TimingWheel(tick=1)
+        wheel.schedule('a', 5)
+        wheel.schedule('b', 6)
+        wheel.schedule('a', 8)
+        self.assertTrue(wheel.cancel('b'))
+        self.assertFalse(wheel.cancel('b'))
+        self.assertEqual(wheel.advance(7), [])
+        self.assertEqual(wheel.advance(8), ['a'])
+
+    def test_never_early(self):
+        rng = schedule.random.Random(1)
+        wheel = schedule.TimingWheel(tick=0.1, slots=(4, 4, 2))
+        deadlines = {key: rng.uniform(0, 50) for key in range(500)}
+        for key, deadline in deadlines.items():
+            wheel.schedule(key, deadline)
+        fired = {}
+        now = 0
+        while wheel:
+            now = wheel.next_deadline()
+            for key in wheel.advance(now):
+                fired[key] = now
+        self.assertEqual(fired.keys(), deadlines.keys())
+        for key, moment in fired.items():
+            self.assertGreaterEqual(moment, deadlines[key])
+            self.assertLess(moment - deadlines[key], 0.1 + 1e-9)
+
+
+class TestErrorCache(TestCase):
+    """Проверка подавления повторных сообщений об ошибках."""
+
+    def error(self, timestamp):
+        return exceptions.NoResponseError(
+            'Нет ответа', homework.ENDPOINT, {}, {'from_date': timestamp}
+        )
+
+    def test_repeats_summarized(self):
+        clock = schedule.VirtualClock()
+        cache = errorcache.ErrorCache(clock=clock)
+        self.assertTrue(cache.add(self.error(1)))
+        for timestamp in range(2, 39):
+            clock.sleep(60)
+            self.assertFalse(cache.add(self.error(timestamp)))
+        self.assertEqual(cache.summaries(), [])
+        clock.sleep(errorcache.SUMMARY_INTERVAL)
+        self.assertEqual(cache.summaries(), [
+            'NoResponseError ×37 за последние 97 мин.'
+        ])
+        self.assertEqual(cache.summaries(), [])
+
+    def test_bounded(self):
+        clock = schedule.VirtualClock()
+        cache = errorcache.ErrorCache(max_size=2, ttl=10, clock=clock)
+        for error in (ValueError(), KeyError(), TypeError()):
+            cache.add(error)
+        self.assertEqual(list(cache), ['KeyError', 'TypeError'])
+        clock.sleep(10)
+        self.assertTrue(cache.add(KeyError()))
+        self.assertEqual(list(cache), ['KeyError'])
+
+
+class TestLogs(TestCase):
+    """Проверка ротации и прореживания журнала."""
+
+    def test_rotated_segments_compressed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, 'bot.log')
+        handler = logs.CompressingRotatingFileHandler(
+            filename, max_bytes=100, backup_count=2
+        )
+        logger = logging.getLogger('test.rotation')
+        logger.propagate = False
+        logger.addHandler(handler)
+        for index in range(20):
+            logger.warning('Запись журнала номер %d', index)
+        handler.close()
+        self.assertEqual(
+            sorted(os.listdir(directory.name)),
+            ['bot.log', 'bot.log.1.gz', 'bot.log.2.gz']
+        )
+
+    def test_repeats_sampled(self):
+        clock = schedule.VirtualClock()
+        sampler = logs.SamplingFilter(window=60, burst=2, clock=clock)
+
+        def record(level=logging.DEBUG):
+            return logging.LogRecord(
+                'test', level, __file__, 1, homework.NO_HOMEWORK_UPDATE,
+                None, None
+            )
+
+        self.assertEqual(
+            [sampler.filter(record()) for _ in range(4)],
+            [True, True, False, False]
+        )
+        self.assertTrue(sampler.filter(record(logging.ERROR)))
+        clock.sleep(60)
+        passed = record()
+        self.assertTrue(sampler.filter(passed))
+        self.assertIn('2', passed.getMessage())
+
+
+class TestDebugServer(TestCase):
+    """Проверка имитатора API Практикума."""
+
+    def start(self, scenario=None, faults=None):
+        server = debugserver.make_server('127.0.0.1', 0, scenario, faults)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        patcher = mock.patch(
+            'homework.ENDPOINT', 'http://127.0.0.1:%d/' % server.server_port
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scripted_timeline(self):
+        self.start(debugserver.Scenario({'student': [
+            {'at': -100, 'id': 1, 'status': 'reviewing',
+             'homework_name': 'hw1'},
+            {'at': -50, 'id': 1, 'status': 'rejected',
+             'homework_name': 'hw1'},
+            {'at': 3600, 'id': 1, 'status': 'approved',
+             'homework_name': 'hw1'},
+        ]}))
+        headers = homework.make_headers('student')
+        answer = homework.fetch_api_answer(headers, 0)
+        self.assertEqual(
+            [hw['status'] for hw in answer['homeworks']], ['rejected']
+        )
+        answer = homework.fetch_api_answer(headers, answer['current_date'])
+        self.assertEqual(answer['homeworks'], [])
+        answer = homework.fetch_api_answer(homework.make_headers('other'), 0)
+        self.assertEqual(answer['homeworks'][0]['status'], 'reviewing')
+
+    def test_fault_injection(self):
+        self.start(faults=debugserver.Faults(error_rate=1))
+        with self.assertRaises(exceptions.BadResponseError):
+            homework.fetch_api_answer(homework.make_headers('student'), 0)
+
+    def test_fault_streams_differ(self):
+        faults = debugserver.Faults('uniform:0,1', seed=1)
+        delays = []
+
+        def connection():
+            delays.append([faults.delay() for _ in range(5)])
+
+        for _ in range(2):
+            thread = threading.Thread(target=connection)
+            thread.start()
+            thread.join()
+        self.assertNotEqual(delays[0], delays[1])
+        again = debugserver.Faults('uniform:0,1', seed=1)
+        self.assertEqual([again.delay() for _ in range(5)], delays[0])
+
+
+class TestDebugTelegram(TestCase):
+    """Проверка имитатора Telegram Bot API."""
+
+    def start(self, faults=None):
+        server = debugtelegram.make_server('127.0.0.1', 0, faults)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, Bot(
+            '1234:abcdefg',
+            base_url='http://127.0.0.1:%d/bot' % server.server_port
+        )
+
+    def test_messages_recorded(self):
+        server, bot = self.start()
+        self.assertEqual(bot.get_me().username, 'debug_bot')
+        homework.send_chat_message(bot, 12345, 'Сообщение')
+        self.assertEqual(server.mailbox.delivered(12345), ['Сообщение'])
+
+    def test_faults(self):
+        _, bot = self.start(debugtelegram.TelegramFaults(flood_rate=1))
+        with self.assertRaises(RetryAfter):
+            bot.send_message(12345, 'Сообщение')
+        _, bot = self.start(debugtelegram.TelegramFaults(error_rate=1))
+        with self.assertRaises(NetworkError):
+            bot.send_message(12345, 'Сообщение')
+
+
+class TestCommands(TestCase):
+    """Проверка команд бота."""
+
+    def setUp(self):
+        self.tenant = engine.Tenant('token', 12345)
+        self.listener = commands.CommandListener(FakeBot(), [self.tenant])
+
+    def test_answers_from_cache(self):
+        sample = json.loads(SAMPLE_HOMEWORK)
+        with mock.patch(
+            'homework.fetch_api_answer', return_value=sample
+        ) as fetch:
+            first = self.listener.handle(12345, '/status')
+            second = self.listener.handle(12345, '/status@debug_bot')
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertIn(homework.VERDICTS['rejected'], first)
+        self.assertEqual(self.listener.handle(12345, '/history'),
+                         commands.NO_HISTORY)
+        homeworks = [dict(sample['homeworks'][0], status='approved',
+                          date_updated='2020-02-14T10:00:00Z')]
+        self.listener.cache.update(12345, homeworks)
+        self.assertIn(homework.VERDICTS['approved'],
+                      self.listener.handle(12345, '/history'))
+        self.assertEqual(self.listener.handle(1, '/status'),
+                         commands.UNKNOWN_CHAT)
+
+    def test_subscribe(self):
+        self.listener.handle(12345, '/subscribe off')
+        self.assertFalse(self.tenant.subscribed)
+        self.listener.handle(12345, '/subscribe')
+        self.assertTrue(self.tenant.subscribed)
+
+    def test_subscription_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'state.sqlite3')
+            store = storage.StateStore(path)
+            listener = commands.CommandListener(
+                FakeBot(), [self.tenant], store=store
+            )
+            listener.handle(12345, '/subscribe off')
+            store.close()
+            store = storage.StateStore(path)
+            tenant = engine.Tenant('token', 12345)
+            tenant.restore(store)
+            self.assertFalse(tenant.subscribed)
+            other = engine.Tenant('other', 1)
+            other.restore(store)
+            self.assertTrue(other.subscribed)
+            store.close()
+
+    def test_long_polling(self):
+        server = debugtelegram.make_server('127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.listener.bot = self.listener.sender = Bot(
+            '1234:abcdefg',
+            base_url='http://127.0.0.1:%d/bot' % server.server_port
+        )
+        server.mailbox.post(12345, '/history')
+        self.listener.poll()
+        self.assertEqual(server.mailbox.delivered(12345),
+                         [commands.NO_HISTORY])
+
+
+class TestMetrics(TestCase):
+    """Проверка выдачи метрик в формате Prometheus."""
+
+    def test_render(self):
+        registry = metrics.Registry()
+        errors = metrics.Counter(
+            'errors_total', 'Ошибки.', ('error',), registry=registry
+        )
+        latency = metrics.Histogram(
+            'latency_seconds', 'Задержка.', buckets=(0.1, 1, float('inf')),
+            registry=registry
+        )
+        depth = metrics.Gauge('depth', 'Очередь.', registry=registry)
+        errors.inc('NoResponseError')
+        errors.inc('NoResponseError')
+        latency.observe(0.5)
+        depth.set_function(lambda: 3)
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE errors_total counter', lines)
+        self.assertIn('errors_total{error="NoResponseError"} 2', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn('latency_seconds_count 1', lines)
+        self.assertIn('depth 3', lines)
+
+
+class TestTracing(TestCase):
+    """Проверка трассировки циклов и профилировщика."""
+
+    def test_spans(self):
+        tracer = tracing.Tracer(slowest=2)
+        with tracer.span('request'):
+            pass
+        self.assertEqual(tracer.traces(), [])
+        for name in ('fast', 'slow', 'middle'):
+            with tracer.cycle(name):
+                with tracer.span('request'):
+                    pass
+                with tracer.span('send'):
+                    pass
+                with tracer.span('send'):
+                    pass
+        self.assertEqual(len(tracer.traces()), 2)
+        trace = tracer.traces()[0]
+        self.assertGreaterEqual(trace.duration, sum(trace.stages().values()))
+        self.assertEqual(set(trace.stages()), {'request', 'send'})
+        self.assertEqual(len(trace.as_dict()['spans']), 3)
+
+    def test_slowest(self):
+        clock = iter(range(100)).__next__
+        tracer = tracing.Tracer(slowest=2, clock=clock)
+        for name, steps in (('a', 1), ('b', 5), ('c', 3), ('d', 0)):
+            with tracer.cycle(name):
+                for _ in range(steps):
+                    clock()
+        self.assertEqual(
+            [trace.name for trace in tracer.traces()], ['b', 'c']
+        )
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = tracing.SamplingProfiler(directory, interval=0.001)
+            path = profiler.start(0.05)
+            self.assertIsNotNone(path)
+            self.assertIsNone(profiler.start(0.05))
+            profiler.thread.join()
+            with open(path, encoding='utf-8') as profile:
+                lines = profile.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn(';', stack)
+
+    def test_debug_local_only(self):
+        server = metricsserver.serve_metrics(0, '127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d/debug/traces' % server.server_address[1]
+        with urllib.request.urlopen(url) as response:
+            self.assertIsInstance(json.loads(response.read()), list)
+        handler = metricsserver.MetricsHandler.__new__(
+            metricsserver.MetricsHandler
+        )
+        handler.server = server
+        handler.client_address = ('192.0.2.1', 40000)
+        self.assertFalse(handler.debug_allowed())
+        server.debug_remote = True
+        self.assertTrue(handler.debug_allowed())
+
+
+class TestStateStore(TestCase):
+    """Проверка сохранения состояния между перезапусками."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'state.sqlite3')
+
+    def test_state_survives_restart(self):
+        store = storage.StateStore(self.path)
+        homeworks = json.loads(SAMPLE_HOMEWORK)['homeworks']
+        store.save('student', 1581604970, homeworks, {'error'})
+        store.close()
+        store = storage.StateStore(self.path)
+        self.assertEqual(store.watermark('student'), 1581604970)
+        self.assertEqual(store.watermark('other', 0), 0)
+        self.assertEqual(store.error_keys('student'), {'error'})
+        self.assertEqual(store.last_status('student'), 'rejected')
+        store.close()
+
+    def test_outbox_replayed(self):
+        store = storage.StateStore(self.path)
+        first = store.enqueue(1, 'first')
+        store.enqueue(2, 'other')
+        store.flush()
+        store.enqueue(1, 'second')
+        store.ack([first])
+        store.close()
+        store = storage.StateStore(self.path)
+        bot = FakeBot()
+        queue = notifier.Notifier(bot, chat_burst=1, outbox=store)
+        queue.start()
+        queue.stop()
+        self.assertEqual(bot.sent, [(2, 'other'), (1, 'second')])
+        store.flush()
+        self.assertEqual(store.outbox(), [])
+        store.close()
+
+    def test_shared_outbox(self):
+        first = storage.StateStore(self.path)
+        second = storage.StateStore(self.path)
+        first.enqueue(1, 'first')
+        second.enqueue(2, 'second')
+        first.flush()
+        second.flush()
+        first.close()
+        second.close()
+        store = storage.StateStore(self.path)
+        self.assertEqual(
+            [(chat_id, text) for _, chat_id, text in store.outbox({2})],
+            [(2, 'second')]
+        )
+        messages = store.outbox()
+        self.assertEqual(
+            [(chat_id, text) for _, chat_id, text in messages],
+            [(1, 'first')]
+        )
+        store.ack([message_id for message_id, _, _ in messages])
+        store.close()
+        store = storage.StateStore(self.path)
+        self.assertEqual(
+            [(chat_id, text) for _, chat_id, text in store.outbox()],
+            [(2, 'second')]
+        )
+        store.close()
+
+    def test_failed_flush_kept(self):
+        store = storage.StateStore(self.path)
+        store.save('student', 1581604970, [], {'error'})
+        store.enqueue(1, 'first')
+        store.connection.close()
+        with self.assertRaises(sqlite3.Error):
+            store.flush()
+        store.connection = sqlite3.connect(
+            self.path, check_same_thread=False
+        )
+        store.close()
+        store = storage.StateStore(self.path)
+        self.assertEqual(store.watermark('student'), 1581604970)
+        self.assertEqual(store.error_keys('student'), {'error'})
+        self.assertEqual(store.outbox(), [(1, 1, 'first')])
+        store.close()
+
+
+class TestCheckOnce(TestCase):
+    """Проверка однократного режима --once."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'state.sqlite3')
+        patcher = mock.patch.multiple(
+            homework, PRACTICUM_TOKEN='token', TELEGRAM_TOKEN='1234:abcdefg',
+            TELEGRAM_CHAT_ID=12345
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bot = FakeBot()
+        patcher = mock.patch('homework.LazyBot', return_value=self.bot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, **kwargs):
+        with mock.patch('homework.fetch_api_answer', **kwargs):
+            return homework.check_once(self.path)
+
+    def test_shared_transport(self):
+        sample = json.loads(SAMPLE_HOMEWORK)
+        with mock.patch('transport.Transport') as transport_class:
+            self.check(return_value=sample)
+            transport_class.assert_not_called()
+            lazy = homework.LazyTransport()
+            lazy.get('url')
+            lazy.get('url')
+            lazy.close()
+        transport_class.assert_called_once_with()
+        transport_class.return_value.close.assert_called_once_with()
+        fetch = mock.Mock(return_value=sample)
+        with mock.patch('homework.fetch_api_answer', fetch):
+            homework.check_once(self.path)
+        self.assertIsInstance(fetch.call_args[0][2], homework.LazyTransport)
+
+    def test_exit_codes(self):
+        sample = json.loads(SAMPLE_HOMEWORK)
+        self.assertEqual(self.check(return_value=sample), homework.EXIT_OK)
+        self.assertEqual(len(self.bot.sent), 1)
+        self.assertEqual(self.check(return_value=sample), homework.EXIT_OK)
+        self.assertEqual(len(self.bot.sent), 1)
+        store = storage.StateStore(self.path)
+        self.assertEqual(store.watermark('12345'), 1581604970)
+        store.close()
+        error = exceptions.NoResponseError('Нет ответа.', 'url', {}, {})
+        self.assertEqual(
+            self.check(side_effect=error), homework.EXIT_FAILURE
+        )
+        error = exceptions.TooManyRequestsError(
+            'Слишком часто.', 'url', {}, {}, retry_after=1
+        )
+        self.assertEqual(
+            self.check(side_effect=error), homework.EXIT_TEMPFAIL
+        )
+
+    def test_missing_token(self):
+        with mock.patch('homework.TELEGRAM_TOKEN', None):
+            self.assertEqual(homework.check_once(self.path),
+                             homework.EXIT_CONFIG)
+
+
+class StreamResponse:
+    """Ответ сервера, читаемый частями заданного размера."""
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: str):
+        self.body = body.encode()
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class ListTransport:
+    """Транспорт, отвечающий заданными телами ответов по очереди."""
+
+    def __init__(self, *bodies):
+        self.bodies = list(bodies)
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        response = StreamResponse(self.bodies.pop(0))
+        response.content = response.body
+        return response
+
+
+class TestCassette(TestCase):
+    """Проверка записи и воспроизведения трафика."""
+
+    def test_record_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cassette.jsonl')
+            recorder = cassette.Recorder(path)
+            transport = cassette.RecordingTransport(ListTransport(
+                SAMPLE_EMPTY_HOMEWORKS, SAMPLE_HOMEWORK
+            ), recorder)
+            bot = cassette.RecordingBot(FakeBot(), recorder)
+            headers = homework.make_headers('secret-token')
+            status_diff = diff.StatusDiff()
+            for _ in range(2):
+                homework.process_homeworks(
+                    bot, 42, headers, 0, errorcache.ErrorCache(), transport,
+                    status_diff
+                )
+            bot.send_message(42, f'Параметры запроса: headers={headers}')
+            recorder.close()
+            with open(path, encoding='utf-8') as recorded:
+                self.assertNotIn('secret-token', recorded.read())
+            events = cassette.load(path)
+        self.assertEqual(
+            [event['kind'] for event in events],
+            ['practicum', 'practicum', 'telegram', 'telegram']
+        )
+        self.assertEqual(events[0]['tenant'], events[1]['tenant'])
+        other = cassette.Recorder(os.devnull)
+        other.close()
+        self.assertNotEqual(events[0]['tenant'], other.redact('secret-token'))
+        result = cassette.replay(events[:3])
+        self.assertEqual(len(result['cycles']), 2)
+        self.assertEqual(result['sent'], result['recorded'])
+
+    def test_bot_token_redacted(self):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        token = '123456:SECRET-bot_token'
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cassette.jsonl')
+            recorder = cassette.Recorder(path)
+            bot = cassette.RecordingBot(Bot(
+                token, base_url='http://127.0.0.1:%d/bot' % port
+            ), recorder)
+            with self.assertRaises(NetworkError):
+                bot.send_message(42, 'Статус изменился')
+            with mock.patch.object(homework, 'TELEGRAM_TOKEN', token):
+                recorder.write(cassette.TELEGRAM, error=recorder.scrub(
+                    f'Нет доступа к {token}'
+                ))
+            recorder.close()
+            with open(path, encoding='utf-8') as recorded:
+                text = recorded.read()
+        self.assertNotIn('SECRET', text)
+        self.assertIn('/bot' + recorder.redact(token), text)
+
+    def test_replay_speed(self):
+        events = [
+            {'kind': 'practicum', 'at': 0, 'tenant': 'a', 'elapsed': 0.5,
+             'status': 200, 'body': SAMPLE_HOMEWORK},
+            {'kind': 'practicum', 'at': 10, 'tenant': 'a', 'elapsed': 1,
+             'error': 'ReadTimeout: timeout'},
+        ]
+        sleeps = []
+        with self.assertLogs(homework.logger, logging.ERROR):
+            result = cassette.replay(
+                events, speed=2, clock=lambda: 0, sleep=sleeps.append
+            )
+        self.assertEqual(sleeps, [0.25, 5.0, 0.5])
+        self.assertEqual(len(result['sent']), 2)
+        self.assertIn('ReadTimeout', result['sent'][1])
+
+
+class TestBackfill(TestCase):
+    """Проверка загрузки истории работ."""
+
+    def history(self, count):
+        return json.dumps({
+            'homeworks': [
+                {
+                    'id': number, 'status': 'approved',
+                    'homework_name': 'hw%d.zip' % number,
+                    'reviewer_comment': 'Отлично', 'lesson_name': 'Урок',
+                    'date_updated': '2020-02-13T16:42:47Z'
+                }
+                for number in range(count)
+            ],
+            'current_date': 1581604970
+        }, ensure_ascii=False)
+
+    def test_stream_chunks(self):
+        fields = {}
+        records = list(backfill.stream_answer(
+            StreamResponse(self.history(50)).iter_content(7), fields
+        ))
+        self.assertEqual([record.id for record in records], list(range(50)))
+        self.assertEqual(records[0].homework_name, 'hw0.zip')
+        self.assertEqual(fields, {'current_date': 1581604970})
+
+    def test_stream_errors(self):
+        cases = (
+            ('[]', exceptions.BadFormatError),
+            ('{}', exceptions.MissingDataError),
+            ('{"homeworks": {}}', exceptions.BadFormatError),
+            (INCORRECT_JSON, ValueError),
+            ('{"homeworks": [] "current_date": 1}', ValueError),
+        )
+        for body, error in cases:
+            with self.subTest(body=body), self.assertRaises(error):
+                list(backfill.stream_answer(
+                    StreamResponse(body).iter_content(3), {}
+                ))
+
+    def test_invalid_records_skipped(self):
+        answer = json.loads(self.history(3))
+        answer['homeworks'][1]['status'] = 'unknown'
+        del answer['homeworks'][2]['homework_name']
+        answer['homeworks'].insert(0, 1)
+        fields = {}
+        with self.assertLogs('homework.backfill', logging.WARNING) as logs:
+            records = list(backfill.stream_answer(
+                StreamResponse(json.dumps(answer)).iter_content(3), fields
+            ))
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(
+            records, [decoder.make_record(answer['homeworks'][1])]
+        )
+        self.assertIn('current_date', fields)
+
+    def test_statuses_seeded(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = storage.StateStore(os.path.join(directory.name, 'state'))
+        response = StreamResponse(self.history(120))
+        http = mock.Mock()
+        http.get.return_value = response
+        tenant = engine.Tenant('token', 1)
+        count = backfill.backfill(
+            tenant, store, http, chunk_size=64, batch_size=50
+        )
+        self.assertEqual(count, 120)
+        self.assertTrue(response.closed)
+        self.assertTrue(http.get.call_args.kwargs['stream'])
+        self.assertEqual(store.watermark('1'), 1581604970)
+        tenant.restore(store)
+        store.close()
+        self.assertEqual(len(tenant.diff.known), 120)
+        self.assertEqual(tenant.status, 'approved')
+        self.assertEqual(tenant.diff.changes(
+            json.loads(self.history(120))['homeworks']
+        ), [])
+
+
+class TestSharding(TestCase):
+    """Проверка распределения пользователей между процессами."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'state.sqlite3')
+        self.clock = schedule.VirtualClock(1000)
+        self.names = ['tenant%d' % i for i in range(100)]
+
+    def shard(self, worker):
+        shard = sharding.Shard(self.path, worker, ttl=30, clock=self.clock)
+        self.addCleanup(shard.close)
+        return shard
+
+    def test_ring_moves_few_keys(self):
+        before = sharding.HashRing(['a', 'b', 'c'])
+        after = sharding.HashRing(['a', 'b', 'c', 'd'])
+        moved = [
+            name for name in self.names
+            if before.owner(name) != after.owner(name)
+        ]
+        self.assertTrue(all(after.owner(name) == 'd' for name in moved))
+        self.assertLess(len(moved), len(self.names) / 2)
+
+    def test_leases_move(self):
+        first, second = self.shard('first'), self.shard('second')
+        held = first.acquire(first.assigned(self.names))
+        self.assertEqual(held, set(self.names))
+        wanted = second.assigned(self.names)
+        self.assertTrue(wanted)
+        self.assertEqual(second.acquire(wanted), set())
+        kept = first.assigned(self.names)
+        first.acquire(kept, held - kept)
+        self.assertEqual(second.acquire(wanted), wanted)
+        self.assertEqual(kept | wanted, set(self.names))
+        self.assertFalse(kept & wanted)
+        self.clock.sleep(31)
+        held = first.acquire(first.assigned(self.names))
+        self.assertEqual(held, set(self.names))
+
+    def test_queued_not_released(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(20)]
+        runner = engine.Engine(
+            FakeBot(), tenants, concurrency=2, shard=self.shard('first')
+        )
+        self.addCleanup(runner.executor.shutdown)
+        runner.sync()
+        self.assertEqual(runner.owned, set(range(20)))
+        names = [tenant.name for tenant in tenants]
+        moved = self.shard('second').assigned(names)
+        queued = names.index(min(moved))
+        self.assertTrue(runner.claim(queued))
+        runner.sync()
+        self.assertEqual(
+            runner.owned,
+            {queued} | {
+                index for index, name in enumerate(names)
+                if name not in moved
+            }
+        )
+        self.assertFalse(runner.claim(names.index(max(moved))))
+
+    def runner(self, worker, tenants, **kwargs):
+        store = storage.StateStore(self.path)
+        self.addCleanup(store.close)
+        runner = engine.Engine(
+            FakeBot(), tenants, concurrency=2, store=store,
+            shard=self.shard(worker), **kwargs
+        )
+        self.addCleanup(runner.executor.shutdown)
+        return runner
+
+    def test_handoff_sends_once(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(20)]
+        first = self.runner('first', tenants)
+        first.sync()
+        for tenant in tenants:
+            first.notifier.send_message(tenant.chat_id, 'status')
+        copies = [engine.Tenant('token%d' % i, i) for i in range(20)]
+        second = self.runner('second', copies)
+        self.assertEqual(second.sync(), set())
+        first.sync()
+        moved = second.sync()
+        self.assertTrue(moved)
+        self.assertEqual(set(second.notifier.pending), moved)
+        self.assertEqual(
+            set(first.notifier.pending), set(range(20)) - moved
+        )
+        self.assertEqual(first.notifier.depth, 20 - len(moved))
+
+    def test_lost_poll_discarded(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(2)]
+        runner = self.runner('only', tenants)
+        runner.sync()
+        runner.owned.discard(0)
+        with mock.patch(
+            'homework.fetch_api_answer',
+            return_value=json.loads(SAMPLE_HOMEWORK)
+        ):
+            with self.assertLogs('homework.engine', logging.WARNING):
+                runner.poll(0)
+            runner.poll(1)
+        self.assertEqual(list(runner.notifier.pending), [1])
+        runner.store.flush()
+        self.assertIsNone(runner.store.watermark('0'))
+
+    def test_single_command_listener(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(20)]
+        copies = [engine.Tenant('token%d' % i, i) for i in range(20)]
+        with mock.patch.object(commands.CommandListener, 'run'):
+            runners = [
+                self.runner('first', tenants, commands=True),
+                self.runner('second', copies, commands=True),
+            ]
+            for runner in runners + runners:
+                runner.sync()
+        first, second = runners
+        self.assertTrue(first.commands.running)
+        self.assertFalse(second.commands.running)
+        moved = min(second.owned)
+        first.commands.handle(moved, '/subscribe off')
+        self.assertTrue(copies[moved].subscribed)
+        second.sync()
+        self.assertFalse(copies[moved].subscribed)
+
+    def test_failed_sync_stops_polling(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(5)]
+        runner = engine.Engine(
+            FakeBot(), tenants, concurrency=2, shard=self.shard('only')
+        )
+        self.addCleanup(runner.executor.shutdown)
+        runner.sync()
+        runner.sync = mock.Mock(side_effect=sqlite3.OperationalError('locked'))
+
+        async def rebalance():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(runner.rebalance(), 0.1)
+
+        with self.assertLogs('homework.engine', logging.ERROR):
+            asyncio.run(rebalance())
+        self.assertEqual(runner.owned, set())
+
+    def test_engine_polls_owned(self):
+        tenants = [engine.Tenant('token%d' % i, i) for i in range(5)]
+        bot = FakeBot()
+        runner = engine.Engine(
+            bot, tenants, concurrency=2, shard=self.shard('only')
+        )
+        with mock.patch(
+            'homework.fetch_api_answer',
+            return_value=json.loads(SAMPLE_HOMEWORK)
+        ):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(runner.run(), 0.5))
+        self.assertEqual(
+            sorted(chat_id for chat_id, _ in bot.sent), list(range(5))
+        )
+
+
+class TestStatusDiff(TestCase):
+    """Проверка определения изменений статусов."""
+
+    def homework(self, id, status, date):
+        return {
+            'id': id, 'status': status, 'homework_name': 'hw%d' % id,
+            'date_updated': date
+        }
+
+    def test_every_change_processed(self):
+        homeworks = [
+            self.homework(2, 'approved', '2020-02-14T10:00:00Z'),
+            self.homework(1, 'reviewing', '2020-02-13T10:00:00Z'),
+        ]
+        bot = FakeBot()
+        with mock.patch('homework.fetch_api_answer', return_value={
+            'homeworks': homeworks, 'current_date': 1581604970
+        }):
+            status_diff = diff.StatusDiff()
+            for _ in range(2):
+                _, changes = homework.process_homeworks(
+                    bot, 1, {}, 0, errorcache.ErrorCache(), diff=status_diff
+                )
+        self.assertEqual([hw['id'] for hw in changes], [])
+        self.assertEqual(len(bot.sent), 2)
+        self.assertIn('hw1', bot.sent[0][1])
+
+    def test_transitions_after_bad_record(self):
+        answers = [
+            [
+                self.homework(1, 'bogus', '2020-02-13T10:00:00Z'),
+                self.homework(2, 'approved', '2020-02-14T10:00:00Z'),
+            ],
+            [
+                self.homework(1, 'bogus', '2020-02-13T10:00:00Z'),
+                self.homework(2, 'approved', '2020-02-14T10:00:00Z'),
+                self.homework(1, 'reviewing', '2020-02-15T10:00:00Z'),
+            ],
+            [self.homework(1, 'reviewing', '2020-02-15T10:00:00Z')],
+        ]
+        bot = FakeBot()
+        status_diff = diff.StatusDiff()
+        events = []
+        with self.assertLogs(homework.logger, logging.ERROR):
+            for homeworks in answers:
+                with mock.patch('homework.fetch_api_answer', return_value={
+                    'homeworks': homeworks, 'current_date': 1581604970
+                }):
+                    _, changes = homework.process_homeworks(
+                        bot, 1, {}, 0, errorcache.ErrorCache(),
+                        diff=status_diff
+                    )
+                events.extend(
+                    (hw['id'], hw['status']) for hw in changes
+                )
+        self.assertEqual(events, [(2, 'approved'), (1, 'reviewing')])
+        self.assertEqual(len(bot.sent), 3)
+
+    def test_stale_and_repeated_skipped(self):
+        status_diff = diff.StatusDiff(
+            {1: ('approved', '2020-02-14T10:00:00Z')}
+        )
+        homeworks = [
+            self.homework(1, 'reviewing', '2020-02-13T10:00:00Z'),
+            self.homework(1, 'approved', '2020-02-14T10:00:00Z'),
+        ]
+        self.assertEqual(status_diff.changes(homeworks), [])
+        newer = self.homework(1, 'rejected', '2020-02-15T10:00:00Z')
+        self.assertEqual(status_diff.changes([newer]), [newer])
+
+    def test_compact_state(self):
+        tenant = engine.Tenant('token', 1)
+        self.assertFalse(hasattr(tenant, '__dict__'))
+        self.assertEqual(tenant.headers, {'Authorization': 'OAuth token'})
+        tenant.status = 'approved'
+        self.assertEqual(tenant.status_code, 1)
+        self.assertEqual(tenant.status, 'approved')
+        record = json.loads(
+            '{"id": 1, "status": "reviewing", "homework_name": "hw1",'
+            ' "date_updated": "2020-02-13T10:00:00Z"}'
+        )
+        tenant.diff.commit(record)
+        self.assertEqual(list(tenant.diff.known.values()), [
+            diff.date_stamp('2020-02-13T10:00:00Z') << diff.STATUS_BITS | 2
+        ])
+        self.assertFalse(tenant.diff.is_change(dict(record)))
+        self.assertTrue(tenant.diff.is_change(dict(record, status='new')))
+
+
+class TestDecoder(TestCase):
+    """Проверка разбора ответа API за один проход."""
+
+    def test_compact_records(self):
+        for loads in (json.loads, decoder.LOADS):
+            answer = decoder.decode_answer(SAMPLE_HOMEWORK.encode(), loads)
+            record = answer['homeworks'][0]
+            self.assertIsInstance(record, decoder.Homework)
+            self.assertEqual(record['homework_name'],
+                             'username__hw_python_oop.zip')
+            self.assertEqual(record.get('lesson_name', 'нет'), 'нет')
+            self.assertIn('id', record)
+            self.assertEqual(answer['current_date'], 1581604970)
+            self.assertIn('username__hw_python_oop.zip',
+                          homework.parse_status(record))
+            status_diff = diff.StatusDiff()
+            status_diff.commit(record)
+            self.assertFalse(status_diff.is_change(record))
+
+    def test_errors(self):
+        cases = (
+            ('{"homeworks": {}}', exceptions.BadFormatError),
+            ('[]', exceptions.BadFormatError),
+            ('{}', exceptions.MissingDataError),
+            (INCORRECT_JSON, ValueError),
+        )
+        for body, error in cases:
+            with self.subTest(body=body), self.assertRaises(error):
+                decoder.decode_answer(body.encode())
+        answer = decoder.decode_answer(
+            '{"homeworks": [1], "error": "Тест ошибки"}'.encode()
+        )
+        self.assertIn('error', answer)
+
+    def test_record_errors(self):
+        cases = (
+            (SAMPLE_HOMEWORK_WRONG_STATUS, exceptions.UnknowStatus),
+            (SAMPLE_HOMEWORK_ILL_FORMED, exceptions.MissingDataError),
+            ('{"homeworks": [1]}', exceptions.BadFormatError),
+        )
+        for body, error in cases:
+            with self.subTest(body=body):
+                bad = decoder.decode_answer(body.encode())['homeworks'][0]
+                self.assertNotIsInstance(bad, decoder.Homework)
+                with self.assertRaises(error):
+                    decoder.make_record(bad)
+        answer = json.loads(SAMPLE_HOMEWORK)
+        wrong = json.loads(SAMPLE_HOMEWORK_WRONG_STATUS)['homeworks'][0]
+        wrong['id'] = 125
+        wrong['date_updated'] = '2020-02-14T16:42:47Z'
+        answer['homeworks'].append(wrong)
+        bot = FakeBot()
+        with self.assertLogs(homework.logger, logging.ERROR):
+            homework.process_homeworks(
+                bot, 42, {}, 0, errorcache.ErrorCache(),
+                ListTransport(json.dumps(answer)), diff.StatusDiff()
+            )
+        self.assertEqual(len(bot.sent), 2)
+        self.assertIn('username__hw_python_oop.zip', bot.sent[0][1])
+        self.assertIn('undefined status', bot.sent[1][1])
+
+    def test_bad_record_first(self):
+        body = json.dumps({'homeworks': [
+            {'id': 2, 'status': 'approved', 'homework_name': 'hw2',
+             'date_updated': '2020-02-14T10:00:00Z'},
+            {'id': 1, 'status': 'bogus', 'homework_name': 'hw1',
+             'date_updated': '2020-02-13T10:00:00Z'},
+        ], 'current_date': 1581604970})
+        bot = FakeBot()
+        transport = ListTransport(body, body)
+        status_diff = diff.StatusDiff()
+        timestamp = 0
+        with self.assertLogs(homework.logger, logging.ERROR) as logs:
+            for _ in range(2):
+                timestamp, changes = homework.process_homeworks(
+                    bot, 42, {}, timestamp, errorcache.ErrorCache(),
+                    transport, status_diff
+                )
+        self.assertEqual(timestamp, 1581604970)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(changes, [])
+        self.assertEqual(len(bot.sent), 2)
+        self.assertIn('bogus', bot.sent[0][1])
+        self.assertIn('hw2', bot.sent[1][1])
+
+
+class FloodBot(FakeBot):
+    """Бот, отвечающий RetryAfter на первый запрос."""
+
+    def __init__(self):
+        super().__init__()
+        self.flooded = False
+
+    def send_message(self, chat_id, text):
+        if not self.flooded:
+            self.flooded = True
+            raise RetryAfter(0.1)
+        super().send_message(chat_id, text)
+
+
+class TestNotifier(TestCase):
+    """Проверка очереди исходящих сообщений."""
+
+    def test_messages_coalesced_after_flood(self):
+        bot = FloodBot()
+        queue = notifier.Notifier(bot)
+        queue.send_message(1, 'first')
+        queue.send_message(1, 'second')
+        queue.send_message(2, 'other')
+        queue.start()
+        queue.stop()
+        self.assertEqual(
+            bot.sent, [(1, 'first' + notifier.SEPARATOR + 'second'),
+                       (2, 'other')]
+        )
+        self.assertEqual(queue.stats()['depth'], 0)
+        self.assertEqual(queue.stats()['sent'], 3)
+
+
+class TestFairLimiter(TestCase):
+    """Проверка общего ограничения частоты запросов к Практикуму."""
+
+    def test_keys_served_in_turn(self):
+        limiter = ratelimit.FairLimiter(rate=1000, burst=1)
+        order = []
+
+        async def request(key):
+            await limiter.acquire(key)
+            order.append(key)
+
+        async def scenario():
+            tasks = [request('noisy') for _ in range(5)]
+            tasks += [request('first'), request('second')]
+            await asyncio.gather(*tasks)
+            limiter.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(set(order[:3]), {'noisy', 'first', 'second'})
+
+    def test_throttle_pauses_all(self):
+        limiter = ratelimit.FairLimiter(rate=1000, burst=1)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            limiter.start()
+            limiter.throttle(0.2)
+            started = loop.time()
+            await limiter.acquire('other')
+            limiter.stop()
+            return loop.time() - started
+
+        self.assertGreaterEqual(asyncio.run(scenario()), 0.2)
+        self.assertLess(limiter.current_rate, 1000)
+
+    def test_retry_after_parsed(self):
+        response = mock.Mock(status_code=429, headers={'Retry-After': '7'})
+        with mock.patch('requests.get', return_value=response):
+            with self.assertRaises(exceptions.TooManyRequestsError) as error:
+                homework.get_api_answer(0)
+        self.assertEqual(error.exception.retry_after, 7)
+        self.assertIsInstance(
+            error.exception, exceptions.BadResponseError
+        )
+        self.assertEqual(
+            homework.parse_retry_after(None), homework.RETRY_AFTER
+        )
+
+
+class TestCircuitBreaker(TestCase):
+    """Проверка предохранителей внешних сервисов."""
+
+    def setUp(self):
+        self.clock = schedule.VirtualClock()
+        self.breaker = breaker.CircuitBreaker(
+            'test', threshold=2, recovery_timeout=60, clock=self.clock
+        )
+
+    def test_states(self):
+        self.breaker.failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, breaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.clock.sleep(60)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, breaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEqual(self.breaker.retry_in(), 60)
+        self.clock.sleep(60)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+
+    def test_outage_probed_once(self):
+        error = exceptions.NoResponseError('Нет ответа.', 'url', {}, {})
+        bot = FakeBot()
+        cache = errorcache.ErrorCache()
+        practicum = breaker.CircuitBreaker(
+            'practicum', threshold=2, clock=self.clock,
+            is_failure=homework.is_outage
+        )
+        with mock.patch('homework.PRACTICUM_BREAKER', practicum):
+            with mock.patch(
+                'homework.fetch_api_answer', side_effect=error
+            ) as fetch:
+                for _ in range(10):
+                    homework.process_homeworks(bot, 1, {}, 0, cache)
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(len(bot.sent), 1)
+
+    def test_client_errors_ignored(self):
+        self.breaker.is_failure = homework.is_outage
+        for _ in range(3):
+            self.breaker.record(exceptions.BadResponseError(
+                'Нет доступа.', 'url', {}, {}, code=401
+            ))
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+
+
 if __name__ == '__main__':
     main()
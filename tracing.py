@@ -0,0 +1,292 @@
+"""Трассировка циклов опроса и профилирование по запросу.
+
+Цикл опроса одного пользователя оборачивается в cycle, его этапы -
+в span: установка соединения (connect, включая DNS и TLS), запрос
+(request), разбор ответа (decode), поиск изменений (diff), составление
+сообщений (parse), отправка или постановка в очередь (send), передача
+записей журнала (log) и запись состояния (store). Этапы учитываются в
+трассе текущего потока; вне цикла span ничего не записывает. Трассы
+самых долгих циклов хранятся в ограниченной куче и отдаются по запросу
+/debug/traces сервера метрик или пишутся в журнал по сигналу SIGUSR1.
+
+Профилировщик SamplingProfiler по сигналу SIGUSR2 или запросу
+/debug/profile в течение заданного окна снимает стеки всех потоков
+и записывает их на диск в свернутом формате (folded), который читают
+flamegraph.pl и speedscope. Снимок стеков, а не cProfile, выбран
+потому, что опросы выполняются в потоках пула, а cProfile
+профилирует только включивший его поток.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from metrics import Histogram
+
+SLOWEST = int(os.getenv('TRACE_SLOWEST', 20))
+MAX_SPANS = 200
+PROFILE_SECONDS = float(os.getenv('PROFILE_SECONDS', 30))
+MAX_PROFILE_SECONDS = 600
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR', os.path.dirname(os.path.abspath(__file__))
+)
+PROFILE_FILE = 'profile-{time}.folded'
+PROFILE_TOP = 10
+
+SLOW_CYCLE = 'Долгий цикл {name}: {duration:.3f} с, этапы: {stages}'
+PROFILE_STARTED = 'Профилирование на {seconds:.0f} с, результат: {path}'
+PROFILE_BUSY = 'Профилирование уже выполняется.'
+PROFILE_SAVED = (
+    'Профиль записан в {path}: {samples} снимков, самые частые функции: '
+    '{top}'
+)
+
+STAGE_DURATION = Histogram(
+    'homework_cycle_stage_seconds',
+    'Длительность этапов цикла опроса.', ('stage',)
+)
+
+logger = logging.getLogger('homework.tracing')
+
+
+class Trace:
+    """Трасса одного цикла: длительность и этапы.
+
+    spans - список (этап, начало от начала цикла, длительность).
+    """
+
+    __slots__ = ('name', 'started', 'duration', 'spans')
+
+    def __init__(self, name: str, started: float):
+        self.name = name
+        self.started = started
+        self.duration = None
+        self.spans = []
+
+    def stages(self) -> dict:
+        """Суммарная длительность каждого этапа."""
+        totals = {}
+        for stage, _, duration in self.spans:
+            totals[stage] = totals.get(stage, 0) + duration
+        return totals
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'duration': self.duration,
+            'stages': self.stages(),
+            'spans': [
+                {'stage': stage, 'offset': offset, 'duration': duration}
+                for stage, offset, duration in self.spans
+            ],
+        }
+
+    def __str__(self):
+        return SLOW_CYCLE.format(
+            name=self.name, duration=self.duration,
+            stages=', '.join(
+                f'{stage} {duration:.3f}'
+                for stage, duration in self.stages().items()
+            ) or '-'
+        )
+
+
+class Span:
+    """Замер одного этапа цикла текущего потока."""
+
+    __slots__ = ('tracer', 'stage', 'started')
+
+    def __init__(self, tracer, stage: str):
+        self.tracer = tracer
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = self.tracer.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        trace = getattr(self.tracer.local, 'trace', None)
+        if trace is not None and len(trace.spans) < MAX_SPANS:
+            finished = self.tracer.clock()
+            trace.spans.append((
+                self.stage, self.started - trace.started,
+                finished - self.started
+            ))
+
+
+class Cycle:
+    """Трассировка цикла в текущем потоке."""
+
+    __slots__ = ('tracer', 'trace', 'outer')
+
+    def __init__(self, tracer, name: str):
+        self.tracer = tracer
+        self.trace = Trace(name, tracer.clock())
+        self.outer = None
+
+    def __enter__(self):
+        self.outer = getattr(self.tracer.local, 'trace', None)
+        self.tracer.local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, *exc_info):
+        self.tracer.local.trace = self.outer
+        self.trace.duration = self.tracer.clock() - self.trace.started
+        self.tracer.record(self.trace)
+
+
+class Tracer:
+    """Трассы циклов с хранением slowest самых долгих."""
+
+    def __init__(self, slowest: int = SLOWEST, clock=time.perf_counter):
+        self.slowest = slowest
+        self.clock = clock
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.heap = []
+        self.order = itertools.count()
+
+    def cycle(self, name: str) -> Cycle:
+        return Cycle(self, name)
+
+    def span(self, stage: str) -> Span:
+        return Span(self, stage)
+
+    def record(self, trace: Trace) -> None:
+        for stage, duration in trace.stages().items():
+            STAGE_DURATION.observe(duration, stage)
+        item = (trace.duration, next(self.order), trace)
+        with self.lock:
+            if len(self.heap) < self.slowest:
+                heapq.heappush(self.heap, item)
+            elif trace.duration > self.heap[0][0]:
+                heapq.heapreplace(self.heap, item)
+
+    def traces(self) -> list:
+        """Трассы самых долгих циклов от самого долгого."""
+        with self.lock:
+            items = sorted(self.heap, reverse=True)
+        return [trace for _, _, trace in items]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.heap = []
+
+
+TRACER = Tracer()
+cycle = TRACER.cycle
+span = TRACER.span
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return '{} ({}:{})'.format(
+        code.co_name, os.path.basename(code.co_filename),
+        code.co_firstlineno
+    )
+
+
+class SamplingProfiler:
+    """Профилировщик, периодически снимающий стеки всех потоков."""
+
+    def __init__(self, directory: str = PROFILE_DIR,
+                 interval: float = PROFILE_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds: float = PROFILE_SECONDS) -> str:
+        """Запуск окна профилирования в отдельном потоке.
+
+        Возвращает путь к будущему файлу профиля или None, если
+        профилирование уже выполняется. Может вызываться из
+        обработчика сигнала.
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            if self.running:
+                logger.warning(PROFILE_BUSY)
+                return None
+            seconds = min(max(seconds, self.interval), MAX_PROFILE_SECONDS)
+            path = os.path.join(self.directory, PROFILE_FILE.format(
+                time=time.strftime('%Y%m%d-%H%M%S')
+            ))
+            self.thread = threading.Thread(
+                target=self.run, args=(seconds, path), name='profiler',
+                daemon=True
+            )
+            self.thread.start()
+        finally:
+            self.lock.release()
+        logger.info(PROFILE_STARTED.format(seconds=seconds, path=path))
+        return path
+
+    def sample(self, stacks: Counter) -> None:
+        """Снимок стеков всех потоков, кроме самого профилировщика."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[';'.join(reversed(stack))] += 1
+
+    def run(self, seconds: float, path: str) -> Counter:
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample(stacks)
+            time.sleep(self.interval)
+        self.save(stacks, path)
+        return stacks
+
+    def save(self, stacks: Counter, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in stacks.most_common():
+                output.write(f'{stack} {count}\n')
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        logger.info(PROFILE_SAVED.format(
+            path=path, samples=sum(stacks.values()),
+            top=', '.join(
+                f'{name} {count}'
+                for name, count in leaves.most_common(PROFILE_TOP)
+            )
+        ))
+
+
+PROFILER = SamplingProfiler()
+
+
+def log_traces(tracer: Tracer = TRACER) -> None:
+    """Запись трасс самых долгих циклов в журнал."""
+    for trace in tracer.traces():
+        logger.info(str(trace))
+
+
+def install_signals() -> None:
+    """SIGUSR1 - трассы долгих циклов в журнал, SIGUSR2 - профилирование
+    на PROFILE_SECONDS. Вызывается из главного потока.
+    """
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+    signal.signal(signal.SIGUSR1, lambda signum, frame: log_traces())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: PROFILER.start())